@@ -2,11 +2,14 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Q, Sum
+from django.utils import timezone
+from datetime import timedelta
 from .models import (
     Profile, Doctor, Appointment, MedicalRecord, Prescription, 
-    HealthArticle, Question, Answer, Tip, EmergencyContact
+    HealthArticle, Question, Answer, Tip, EmergencyContact, OutboundEmail, AppointmentRollup
 )
+from . import outbox, rollups, search
 
 class Patient(User):
     class Meta:
@@ -75,7 +78,7 @@ class PrescriptionAdmin(admin.ModelAdmin):
 class HealthArticleAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'created_at', 'featured', 'get_excerpt')
     list_filter = ('featured', 'author')
-    search_fields = ('title', 'content', 'author__username')
+    search_fields = ('author__username',)
     prepopulated_fields = {'slug': ('title',)}
     readonly_fields = ('created_at', 'updated_at')
     list_per_page = 20
@@ -85,6 +88,13 @@ class HealthArticleAdmin(admin.ModelAdmin):
         return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
     get_excerpt.short_description = 'Content Preview'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Title/summary/content go through the search index instead of icontains
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=search.matching_article_ids(search_term))
+        return results, may_have_duplicates
+
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
     list_display = ('username', 'get_full_name', 'email', 'get_phone', 'get_appointments_count', 'date_joined')
@@ -181,3 +191,57 @@ class EmergencyContactAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     list_per_page = 20
     ordering = ('-created_at',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'get_recipients', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    list_per_page = 20
+    ordering = ('-created_at',)
+    actions = ('requeue',)
+
+    def get_recipients(self, obj):
+        return ', '.join(obj.recipients)
+    get_recipients.short_description = 'Recipients'
+
+    @admin.action(description='Requeue failed emails')
+    def requeue(self, request, queryset):
+        count = outbox.requeue(queryset)
+        self.message_user(request, f'{count} email(s) requeued', messages.SUCCESS)
+
+@admin.register(AppointmentRollup)
+class AppointmentRollupAdmin(admin.ModelAdmin):
+    list_display = ('period', 'period_start', 'doctor', 'appointment_type', 'status', 'count')
+    list_filter = ('period', 'status', 'appointment_type', 'doctor__specialization')
+    date_hierarchy = 'period_start'
+    list_per_page = 50
+    ordering = ('-period_start',)
+    change_list_template = 'admin/OHC_System/appointmentrollup/change_list.html'
+    chart_days = 30
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Charts of the last chart_days days, read from the daily rollups only
+        end = timezone.localdate()
+        start = end - timedelta(days=self.chart_days - 1)
+        totals = {row['period_start']: row['appointments'] for row in rollups.report('day', start, end)}
+        days = [
+            {'day': start + timedelta(days=offset), 'appointments': totals.get(start + timedelta(days=offset), 0)}
+            for offset in range(self.chart_days)
+        ]
+        statuses = list(
+            AppointmentRollup.objects.filter(period='day', period_start__gte=start, period_start__lte=end)
+            .values('status').annotate(appointments=Sum('count')).order_by('-appointments')
+        )
+        peak = max([day['appointments'] for day in days] + [row['appointments'] for row in statuses] + [1])
+        for row in days + statuses:
+            row['percent'] = round(row['appointments'] * 100 / peak)
+        extra_context = {**(extra_context or {}), 'chart_days': days, 'chart_statuses': statuses}
+        return super().changelist_view(request, extra_context=extra_context)
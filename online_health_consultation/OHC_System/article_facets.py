@@ -0,0 +1,134 @@
+"""
+Cached facets for the health articles landing page.
+
+The per-category article counts, the most viewed, featured and newest
+articles are kept as one snapshot in the cache, so rendering the articles
+page needs no aggregate queries. The snapshot only holds the fields the
+pages display (no article bodies) and is rebuilt from the database when it
+is missing.
+
+Changes never edit the snapshot in place, since concurrent read-modify-write
+updates would lose each other's changes. Instead, once an article or
+category is committed, ``invalidate()`` stores a new version token, and the
+snapshot is looked up under the current token. A snapshot built from data
+read before the change lands under the old token and is never read again.
+
+View counts only reorder the popular list, so it is cached on its own under
+both tokens and a second one of its own: a flushed batch of views calls
+``invalidate_popular()``, which rebuilds just that list with one query. The
+view counts carried by the featured and recent rows may lag until the next
+article change.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Left
+from django.utils.text import Truncator
+
+from .models import Category, HealthArticle
+
+CACHE_KEY = 'article_facets'
+VERSION_KEY = 'article_facets_version'
+POPULAR_VERSION_KEY = 'article_facets_popular_version'
+CACHE_TIMEOUT = 60 * 60
+POPULAR_POOL_SIZE = 20
+FEATURED_COUNT = 3
+RECENT_COUNT = 3
+ARTICLE_FIELDS = ('id', 'title', 'slug', 'summary', 'image', 'featured', 'views', 'created_at')
+TEASER_WORDS = 30
+
+
+def _category_counts():
+    return [
+        {'id': c.id, 'name': c.name, 'slug': c.slug, 'article_count': c.article_count}
+        for c in Category.objects.annotate(article_count=Count('healtharticle')).order_by('name')
+    ]
+
+
+def _rows(articles):
+    """The display fields of ``articles``, with the opening words of the body as ``teaser``."""
+    rows = []
+    for row in articles.values(*ARTICLE_FIELDS, opening=Left('content', TEASER_WORDS * 20)):
+        row['teaser'] = Truncator(row.pop('opening')).words(TEASER_WORDS)
+        rows.append(row)
+    return rows
+
+
+def build():
+    """Compute the facets snapshot, apart from the popular list, from the database."""
+    return {
+        'categories': _category_counts(),
+        'featured': _rows(HealthArticle.objects.filter(featured=True).order_by('-created_at', '-id')[:FEATURED_COUNT]),
+        'recent': _rows(HealthArticle.objects.order_by('-created_at', '-id')[:RECENT_COUNT]),
+    }
+
+
+def build_popular():
+    """Compute the most viewed articles from the database."""
+    return _rows(HealthArticle.objects.order_by('-views', '-id')[:POPULAR_POOL_SIZE])
+
+
+def _articles(rows):
+    articles = []
+    for row in rows:
+        row = dict(row)
+        teaser = row.pop('teaser')
+        article = HealthArticle(**row)
+        article.teaser = teaser
+        articles.append(article)
+    return articles
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def _snapshot_key():
+    return f'{CACHE_KEY}:{_version(VERSION_KEY)}'
+
+
+def _popular_key(snapshot_key):
+    return f'{snapshot_key}:popular:{_version(POPULAR_VERSION_KEY)}'
+
+
+def get_facets():
+    """
+    Return the facets snapshot, building it on a cache miss.
+
+    Articles come back as unsaved ``HealthArticle`` instances carrying only
+    the display fields, plus a ``teaser`` of the body.
+    """
+    key = _snapshot_key()
+    popular_key = _popular_key(key)
+    cached = cache.get_many([key, popular_key])
+    facets = cached.get(key)
+    if facets is None:
+        facets = build()
+        cache.set(key, facets, CACHE_TIMEOUT)
+    popular = cached.get(popular_key)
+    if popular is None:
+        popular = build_popular()
+        cache.set(popular_key, popular, CACHE_TIMEOUT)
+    return {
+        'categories': [dict(category) for category in facets['categories']],
+        'popular': _articles(popular),
+        'featured': _articles(facets['featured']),
+        'recent': _articles(facets['recent']),
+    }
+
+
+def invalidate():
+    """Retire the current snapshot once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def invalidate_popular():
+    """Retire the cached popular list, keeping the rest of the snapshot."""
+    transaction.on_commit(lambda: cache.set(POPULAR_VERSION_KEY, uuid.uuid4().hex, None))
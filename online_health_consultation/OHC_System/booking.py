@@ -0,0 +1,35 @@
+"""
+Booking appointments without double-booking a slot.
+
+``AppointmentForm.clean`` rejects taken slots early, but two requests can
+both pass that check before either saves. The database has the final word:
+``appointment_active_slot_unique`` allows one active appointment per doctor
+and time, and ``book()`` turns the loser's ``IntegrityError`` into
+``SlotUnavailable``.
+"""
+from django.db import IntegrityError, transaction
+
+from .models import Appointment
+from .slots import is_slot_free
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is taken, outside the doctor's hours or in the past."""
+
+
+def book(user, doctor, at, appointment_type='Consultation', symptoms=''):
+    """Create an appointment for ``user`` in the slot starting at ``at``, or raise ``SlotUnavailable``."""
+    if not is_slot_free(doctor, at):
+        raise SlotUnavailable
+    try:
+        # A savepoint, so a conflict does not break a caller's transaction.
+        with transaction.atomic():
+            return Appointment.objects.create(
+                user=user,
+                doctor=doctor,
+                datetime=at,
+                appointment_type=appointment_type,
+                symptoms=symptoms,
+            )
+    except IntegrityError:
+        raise SlotUnavailable
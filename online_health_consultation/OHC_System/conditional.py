@@ -0,0 +1,101 @@
+"""
+Conditional GET support for read-mostly pages.
+
+``conditional_page`` answers ``If-None-Match`` / ``If-Modified-Since`` with a
+304 before the view runs, so repeat visitors and crawlers cost neither
+queries nor template rendering. Validators come from a "last modified"
+timestamp kept in the cache and bumped by signals whenever the underlying
+content changes; it is seeded from ``max(updated_at)`` on a cache miss.
+For signed-in users the ETag also covers what the navbar shows of them, so
+a new name, role or profile picture is never answered with a 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .images import available_derivatives
+from .models import HealthArticle, Profile
+
+ARTICLES_CACHE_KEY = 'articles_last_modified'
+
+
+def articles_last_modified(request=None, *args, **kwargs):
+    """When any health article last changed (or was deleted)."""
+    value = cache.get(ARTICLES_CACHE_KEY)
+    if value is None:
+        value = HealthArticle.objects.aggregate(latest=Max('updated_at'))['latest'] or timezone.now()
+        cache.set(ARTICLES_CACHE_KEY, value, None)
+    return value
+
+
+def touch_articles():
+    """Mark every page built from health articles as changed."""
+    cache.set(ARTICLES_CACHE_KEY, timezone.now(), None)
+
+
+def _user_state(user):
+    """What the navbar in Base.html shows of ``user``: name, role and profile picture."""
+    if not user.is_authenticated:
+        return '0'
+    profile = Profile.objects.filter(user=user).first()
+    picture = profile.profile_picture if profile else None
+    derivatives = sorted(map(str, available_derivatives(picture))) if picture else []
+    return ':'.join([
+        str(user.pk), user.username, str(bool(profile and profile.is_doctor)),
+        picture.name if picture else '', ','.join(derivatives),
+    ])
+
+
+def _etag(request, last_modified):
+    # The page also depends on who is looking at it and on their CSRF secret,
+    # which the middleware keeps in META whether it came from the cookie or
+    # was generated while rendering.
+    if not hasattr(request, '_navbar_state'):
+        request._navbar_state = _user_state(request.user)
+    key = f'{last_modified.isoformat()}:{request._navbar_state}:{request.META.get("CSRF_COOKIE", "")}'
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def conditional_page(last_modified_func, on_not_modified=None):
+    """
+    Decorator answering conditional GETs from ``last_modified_func``.
+
+    ``last_modified_func(request, *args, **kwargs)`` returns a datetime, or
+    None to skip the check. ``on_not_modified`` is called with the same
+    arguments when a 304 is returned, for side effects such as counting a
+    view that the skipped view function would have recorded.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            # Pages with pending flash messages must always be rendered.
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view_func(request, *args, **kwargs)
+            last_modified = last_modified_func(request, *args, **kwargs)
+            if last_modified is None:
+                return view_func(request, *args, **kwargs)
+
+            etag = _etag(request, last_modified)
+            # Last-Modified says nothing about the user, so only anonymous pages use it.
+            timestamp = None if request.user.is_authenticated else int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                if on_not_modified is not None:
+                    on_not_modified(request, *args, **kwargs)
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers.setdefault('ETag', _etag(request, last_modified))
+                if timestamp is not None:
+                    response.headers.setdefault('Last-Modified', http_date(timestamp))
+                patch_vary_headers(response, ('Cookie',))
+            return response
+        return inner
+    return decorator
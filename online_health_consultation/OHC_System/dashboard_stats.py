@@ -0,0 +1,63 @@
+"""
+Cached per-user numbers for the dashboard.
+
+All of the dashboard counters come from one query of correlated ``COUNT``
+subqueries, and are cached together with the upcoming appointments list.
+Signal handlers drop a user's entry whenever one of their appointments,
+medical records or prescriptions is saved or deleted; bulk ``update()``
+calls bypass signals, so entries also expire after ``CACHE_TIMEOUT``.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Appointment, MedicalRecord, Prescription
+from .slots import ACTIVE_STATUSES
+
+CACHE_PREFIX = 'dashboard_stats:'
+CACHE_TIMEOUT = 5 * 60
+UPCOMING_COUNT = 5
+
+
+def _count(queryset, owner, condition=Q()):
+    """``COUNT(*)`` of the ``queryset`` rows owned by the outer user, as a subquery."""
+    counted = (
+        queryset.filter(**{owner: OuterRef('pk')})
+        .order_by()
+        .values(owner)
+        .annotate(total=Count('pk', filter=condition))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def compute(user, is_doctor):
+    """Compute the dashboard numbers of ``user`` from the database."""
+    owner = 'doctor__user' if is_doctor else 'user'
+    active = Appointment.objects.filter(status__in=ACTIVE_STATUSES)
+    stats = User.objects.filter(pk=user.pk).values(
+        appointments_count=_count(active, owner),
+        consultations_count=_count(active, owner, Q(appointment_type='Consultation')),
+        records_count=_count(MedicalRecord.objects.all(), 'user'),
+        prescriptions_count=_count(Prescription.objects.all(), 'user'),
+    ).get()
+    stats['upcoming_appointments'] = list(
+        active.filter(**{owner: user}).select_related('doctor__user', 'user').order_by('datetime')[:UPCOMING_COUNT]
+    )
+    return stats
+
+
+def get_stats(user, is_doctor):
+    """Return the dashboard numbers of ``user``, computing them on a cache miss."""
+    key = f'{CACHE_PREFIX}{user.pk}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute(user, is_doctor)
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate(*user_ids):
+    """Forget the cached dashboard numbers of the given users."""
+    cache.delete_many([f'{CACHE_PREFIX}{user_id}' for user_id in user_ids if user_id is not None])
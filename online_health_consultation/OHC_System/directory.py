@@ -0,0 +1,119 @@
+"""
+Doctor directory search, facets and autocomplete.
+
+``search`` filters doctors by name, specialization, fee band, experience
+band and "free at" time; the last one is answered by the slot engine for every
+candidate in one pass. Facet counts for the directory sidebar are computed
+with two aggregate queries, cached, and dropped by signal handlers whenever
+a doctor is saved or deleted.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Doctor
+from .slots import Availability
+
+FACETS_CACHE_KEY = 'doctor_facets'
+FACETS_CACHE_TIMEOUT = 60 * 60
+AUTOCOMPLETE_LIMIT = 10
+
+# (label, minimum, maximum) bands shown as facets; the maximum is exclusive.
+FEE_BANDS = [
+    ('Under 50', None, 50),
+    ('50 - 100', 50, 100),
+    ('100 - 200', 100, 200),
+    ('200 and over', 200, None),
+]
+EXPERIENCE_BANDS = [
+    ('Under 5 years', None, 5),
+    ('5 - 10 years', 5, 10),
+    ('10 - 20 years', 10, 20),
+    ('20 years and over', 20, None),
+]
+
+
+def _band(field, minimum, maximum):
+    condition = Q()
+    if minimum is not None:
+        condition &= Q(**{f'{field}__gte': minimum})
+    if maximum is not None:
+        condition &= Q(**{f'{field}__lt': maximum})
+    return condition
+
+
+def build_facets():
+    """Count doctors per specialization, fee band and experience band."""
+    specializations = list(
+        Doctor.objects.order_by('specialization').values('specialization').annotate(count=Count('pk'))
+    )
+    bands = Doctor.objects.aggregate(
+        **{f'fee_{i}': Count('pk', filter=_band('consultation_fee', lo, hi)) for i, (_, lo, hi) in enumerate(FEE_BANDS)},
+        **{f'experience_{i}': Count('pk', filter=_band('experience_years', lo, hi))
+           for i, (_, lo, hi) in enumerate(EXPERIENCE_BANDS)},
+    )
+    return {
+        'specializations': specializations,
+        'fees': [
+            {'band': i, 'label': label, 'count': bands[f'fee_{i}']}
+            for i, (label, lo, hi) in enumerate(FEE_BANDS)
+        ],
+        'experience': [
+            {'band': i, 'label': label, 'count': bands[f'experience_{i}']}
+            for i, (label, lo, hi) in enumerate(EXPERIENCE_BANDS)
+        ],
+    }
+
+
+def get_facets():
+    """Return the directory facets, building them on a cache miss."""
+    facets = cache.get(FACETS_CACHE_KEY)
+    if facets is None:
+        facets = build_facets()
+        cache.set(FACETS_CACHE_KEY, facets, FACETS_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    cache.delete(FACETS_CACHE_KEY)
+
+
+def _name_filter(query):
+    condition = Q()
+    for word in query.split():
+        condition &= (
+            Q(user__first_name__istartswith=word) | Q(user__last_name__istartswith=word)
+            | Q(user__username__istartswith=word) | Q(specialization__istartswith=word)
+        )
+    return condition
+
+
+def search(query='', specialization='', fee_band=None, experience_band=None, available_at=None):
+    """
+    Doctors matching every given filter, with their users joined.
+
+    ``fee_band`` and ``experience_band`` are indexes into ``FEE_BANDS`` and
+    ``EXPERIENCE_BANDS``.
+    """
+    doctors = Doctor.objects.select_related('user')
+    if query:
+        doctors = doctors.filter(_name_filter(query))
+    if specialization:
+        doctors = doctors.filter(specialization=specialization)
+    if fee_band is not None:
+        doctors = doctors.filter(_band('consultation_fee', *FEE_BANDS[fee_band][1:]))
+    if experience_band is not None:
+        doctors = doctors.filter(_band('experience_years', *EXPERIENCE_BANDS[experience_band][1:]))
+    if available_at is not None:
+        day = timezone.localtime(available_at).date()
+        free = Availability(doctors.filter(is_available=True), day, day).free_doctors(available_at)
+        doctors = doctors.filter(pk__in=[doctor.pk for doctor in free])
+    return doctors
+
+
+def autocomplete(query, limit=AUTOCOMPLETE_LIMIT):
+    """Up to ``limit`` bookable doctors whose name or specialization starts with the words of ``query``."""
+    doctors = Doctor.objects.select_related('user').filter(is_available=True)
+    if query:
+        doctors = doctors.filter(_name_filter(query))
+    return list(doctors.order_by('user__first_name', 'user__last_name', 'pk')[:limit])
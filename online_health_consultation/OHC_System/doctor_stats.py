@@ -0,0 +1,148 @@
+"""
+Denormalised counters for the doctor dashboard.
+
+``DoctorStats`` holds a doctor's pending consultations, completed sessions
+and distinct patients so the dashboard reads one row however long the
+doctor's history is. Distinct patients are counted through ``DoctorPatient``
+rows, one per doctor and patient with their number of appointments: a
+patient is new when that row is created and gone when it drops to zero.
+
+Signal handlers pass every appointment change to ``appointment_changed``,
+which applies the difference with ``F()`` updates in one transaction.
+``reconcile`` recomputes everything from the appointments table; it also
+seeds doctors that have no counters yet.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+
+from .models import Appointment, Doctor, DoctorPatient, DoctorStats
+
+# The appointment's datetime is only needed by the rollups, which share the snapshot.
+TRACKED_FIELDS = ('doctor_id', 'user_id', 'status', 'appointment_type', 'datetime')
+RECONCILE_BATCH_SIZE = 500
+
+
+def snapshot(appointment):
+    """The values of ``appointment`` that the counters depend on."""
+    return {field: getattr(appointment, field) for field in TRACKED_FIELDS}
+
+
+def _counts(state):
+    return {
+        'pending_consultations': int(state['status'] == 'Scheduled' and state['appointment_type'] == 'Consultation'),
+        'completed_sessions': int(state['status'] == 'Completed'),
+    }
+
+
+def _pair(state):
+    return state and (state['doctor_id'], state['user_id'])
+
+
+def _link(doctor_id, user_id):
+    """Count one more appointment of a patient with a doctor. Returns True for a new patient."""
+    links = DoctorPatient.objects.filter(doctor_id=doctor_id, user_id=user_id)
+    if links.update(appointments=F('appointments') + 1):
+        return False
+    try:
+        with transaction.atomic():
+            DoctorPatient.objects.create(doctor_id=doctor_id, user_id=user_id, appointments=1)
+        return True
+    except IntegrityError:
+        # A concurrent booking created the row first.
+        links.update(appointments=F('appointments') + 1)
+        return False
+
+
+def _unlink(doctor_id, user_id):
+    """Count one appointment fewer. Returns True when it was the patient's last one."""
+    links = DoctorPatient.objects.filter(doctor_id=doctor_id, user_id=user_id)
+    links.filter(appointments__gt=0).update(appointments=F('appointments') - 1)
+    deleted, _ = links.filter(appointments=0).delete()
+    return bool(deleted)
+
+
+def appointment_changed(previous, current):
+    """
+    Apply an appointment changing from ``previous`` to ``current``.
+
+    Both are ``snapshot()`` dicts; ``previous`` is None for a new appointment
+    and ``current`` is None for a deleted one.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    with transaction.atomic():
+        if previous is not None:
+            for field, value in _counts(previous).items():
+                deltas[previous['doctor_id']][field] -= value
+        if current is not None:
+            for field, value in _counts(current).items():
+                deltas[current['doctor_id']][field] += value
+
+        if _pair(previous) != _pair(current):
+            if previous is not None and _unlink(*_pair(previous)):
+                deltas[previous['doctor_id']]['total_patients'] -= 1
+            if current is not None and _link(*_pair(current)):
+                deltas[current['doctor_id']]['total_patients'] += 1
+
+        # Doctors without a stats row yet are seeded in full by get_stats().
+        for doctor_id, changes in deltas.items():
+            changes = {field: delta for field, delta in changes.items() if delta}
+            if changes:
+                DoctorStats.objects.filter(doctor_id=doctor_id).update(
+                    **{field: F(field) + delta for field, delta in changes.items()}
+                )
+
+
+def get_stats(doctor):
+    """Return the ``DoctorStats`` of ``doctor``, computing them the first time."""
+    stats = DoctorStats.objects.filter(doctor=doctor).first()
+    if stats is None:
+        reconcile([doctor.pk])
+        stats = DoctorStats.objects.get(doctor=doctor)
+    return stats
+
+
+def _reconcile_batch(doctor_ids):
+    actual = {
+        row['pk']: row
+        for row in Doctor.objects.filter(pk__in=doctor_ids).values('pk').annotate(
+            pending_consultations=Count(
+                'appointment', filter=Q(appointment__status='Scheduled', appointment__appointment_type='Consultation')
+            ),
+            completed_sessions=Count('appointment', filter=Q(appointment__status='Completed')),
+            total_patients=Count('appointment__user', distinct=True),
+        )
+    }
+    stored = {stats.doctor_id: stats for stats in DoctorStats.objects.filter(doctor_id__in=doctor_ids)}
+    fields = ('pending_consultations', 'completed_sessions', 'total_patients')
+    drifted = [
+        doctor_id for doctor_id, row in actual.items()
+        if doctor_id not in stored or any(getattr(stored[doctor_id], field) != row[field] for field in fields)
+    ]
+
+    DoctorStats.objects.filter(doctor_id__in=doctor_ids).delete()
+    DoctorStats.objects.bulk_create([
+        DoctorStats(doctor_id=doctor_id, **{field: row[field] for field in fields})
+        for doctor_id, row in actual.items()
+    ])
+    DoctorPatient.objects.filter(doctor_id__in=doctor_ids).delete()
+    DoctorPatient.objects.bulk_create([
+        DoctorPatient(doctor_id=row['doctor'], user_id=row['user'], appointments=row['appointments'])
+        for row in Appointment.objects.filter(doctor_id__in=doctor_ids)
+        .values('doctor', 'user')
+        .annotate(appointments=Count('pk'))
+        .order_by()
+    ], batch_size=1000)
+    return drifted
+
+
+def reconcile(doctor_ids=None):
+    """Recompute the counters of ``doctor_ids`` (default: every doctor). Returns the ids that were wrong."""
+    if doctor_ids is None:
+        doctor_ids = list(Doctor.objects.order_by('pk').values_list('pk', flat=True))
+    drifted = []
+    for start in range(0, len(doctor_ids), RECONCILE_BATCH_SIZE):
+        with transaction.atomic():
+            drifted += _reconcile_batch(doctor_ids[start:start + RECONCILE_BATCH_SIZE])
+    return drifted
@@ -1,7 +1,13 @@
+import datetime
+
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Profile, Appointment, MedicalRecord, EmergencyContact, Prescription
+from django.urls import reverse
+from django.utils import timezone
+from .models import Profile, Doctor, Appointment, MedicalRecord, EmergencyContact, Prescription
+from .directory import EXPERIENCE_BANDS, FEE_BANDS
+from .slots import is_slot_free
 
 class UserUpdateForm(forms.ModelForm):
     class Meta:
@@ -180,12 +186,35 @@ class ProfileUpdateForm(forms.ModelForm):
         model = Profile
         fields = ['profile_picture', 'date_of_birth', 'phone_number', 'blood_group', 'emergency_contact_name', 'emergency_contact_phone']
 
+class AutocompleteSelect(forms.Select):
+    """
+    A select that only renders its chosen option.
+
+    The other options are looked up as the user types, from the JSON endpoint
+    in ``data-autocomplete-url``, so large tables are never sent whole.
+    """
+
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        selected = [str(v) for v in (value if isinstance(value, (list, tuple)) else [value]) if v not in (None, '')]
+        if hasattr(self.choices, 'queryset'):
+            field = self.choices.field
+            self.choices = [('', field.empty_label or '')] + [
+                (obj.pk, field.label_from_instance(obj)) for obj in self.choices.queryset.filter(pk__in=selected)
+            ]
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse(self.url_name)
+        return context
+
 class AppointmentForm(forms.ModelForm):
     class Meta:
         model = Appointment
         fields = ['doctor', 'datetime', 'appointment_type']
         widgets = {
-            'doctor': forms.Select(attrs={
+            'doctor': AutocompleteSelect('doctor_autocomplete', attrs={
                 'class': 'form-control',
                 'placeholder': 'Select Doctor'
             }),
@@ -202,6 +231,7 @@ class AppointmentForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = Doctor.objects.select_related('user')
         self.fields['doctor'].label_from_instance = lambda obj: obj.get_display_name()
 
     def clean(self):
@@ -211,13 +241,8 @@ class AppointmentForm(forms.ModelForm):
 
         if datetime and doctor:
             # Check if the doctor is available at this time
-            existing_appointments = Appointment.objects.filter(
-                doctor=doctor,
-                datetime=datetime,
-                status='scheduled'
-            )
-            if existing_appointments.exists():
-                raise forms.ValidationError('This time slot is already booked.')
+            if not is_slot_free(doctor, datetime):
+                raise forms.ValidationError('This time slot is not available. Please choose one of the free slots.')
         return cleaned_data
 
 class MedicalRecordForm(forms.ModelForm):
@@ -229,6 +254,11 @@ class MedicalRecordForm(forms.ModelForm):
             'notes': forms.Textarea(attrs={'rows': 4}),
         }
 
+class RecordDetailsForm(MedicalRecordForm):
+    """The details of a medical record whose file arrives through a chunked upload."""
+    class Meta(MedicalRecordForm.Meta):
+        fields = ['title', 'date', 'record_type', 'notes']
+
 class EmergencyContactForm(forms.ModelForm):
     class Meta:
         model = EmergencyContact
@@ -239,16 +269,37 @@ class EmergencyContactForm(forms.ModelForm):
         }
 
 class SearchDoctorForm(forms.Form):
+    q = forms.CharField(required=False, label='Name')
     specialization = forms.CharField(required=False)
+    fee = forms.TypedChoiceField(
+        required=False, coerce=int, empty_value=None, label='Consultation fee',
+        choices=[('', 'Any')] + [(i, label) for i, (label, _, _) in enumerate(FEE_BANDS)],
+    )
+    experience = forms.TypedChoiceField(
+        required=False, coerce=int, empty_value=None,
+        choices=[('', 'Any')] + [(i, label) for i, (label, _, _) in enumerate(EXPERIENCE_BANDS)],
+    )
     date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), required=False)
     time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}), required=False)
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('date')) != bool(cleaned_data.get('time')):
+            raise forms.ValidationError('Give both a date and a time to find doctors available then.')
+        return cleaned_data
+
+    def available_at(self):
+        """The aware datetime to check availability at, if a date and time were given."""
+        if self.cleaned_data.get('date') and self.cleaned_data.get('time'):
+            return timezone.make_aware(datetime.datetime.combine(self.cleaned_data['date'], self.cleaned_data['time']))
+        return None
+
 class PrescriptionForm(forms.ModelForm):
     class Meta:
         model = Prescription
         fields = ['user', 'diagnosis', 'medications', 'instructions', 'is_active']
         widgets = {
-            'user': forms.Select(attrs={
+            'user': AutocompleteSelect('patient_autocomplete', attrs={
                 'class': 'form-control',
                 'placeholder': 'Select Patient'
             }),
@@ -274,8 +325,9 @@ class PrescriptionForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Filter users to show only patients (non-doctors)
+        # Filter users to show only patients (non-doctors). The widget renders only the
+        # selected patient and validation looks up the submitted one, so this is never listed.
         patients = User.objects.filter(profile__is_doctor=False).order_by('first_name', 'last_name')
         self.fields['user'].queryset = patients
         # Customize how patient names are displayed in the dropdown
-        self.fields['user'].label_from_instance = lambda user: f"{user.get_full_name() or user.username}"
+        self.fields['user'].label_from_instance = lambda user: f"{user.get_full_name() or user.username} ({user.username})"
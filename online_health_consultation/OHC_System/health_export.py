@@ -0,0 +1,151 @@
+"""
+A patient's whole health file as a streamed ZIP archive.
+
+``archive()`` is a generator of ZIP bytes for a ``StreamingHttpResponse``.
+The ``ZipFile`` writes to a buffer that is emptied after every chunk, so
+nothing is seeked back to and only one chunk of a file is held at a time:
+record files are copied from storage ``READ_SIZE`` bytes at a time, and
+tables are written a row at a time while iterating their querysets with
+``iterator()``. Memory stays flat however many gigabytes the records add up
+to; entries carry data descriptors and switch to ZIP64 when large.
+
+The archive holds::
+
+    records/<id>-<title><ext>   each medical record's file, stored as is
+    records.csv                 the records, with the file each one is in
+    prescriptions.csv
+    appointments.csv
+    manifest.json               who and when, and the row count of each table
+
+Record files are stored uncompressed since scans and PDFs hardly shrink;
+the tables are deflated.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from django.utils import timezone
+
+from .models import Appointment, MedicalRecord, Prescription
+from .record_downloads import filename
+
+READ_SIZE = 256 * 1024
+
+TABLES = {
+    'records.csv': (
+        MedicalRecord,
+        ['id', 'title', 'date', 'record_type', 'notes', 'uploaded_at'],
+    ),
+    'prescriptions.csv': (
+        Prescription,
+        ['id', 'date', 'doctor__user__username', 'diagnosis', 'medications', 'instructions', 'next_visit', 'is_active'],
+    ),
+    'appointments.csv': (
+        Appointment,
+        ['id', 'datetime', 'doctor__user__username', 'doctor__specialization', 'appointment_type', 'status', 'symptoms'],
+    ),
+}
+
+
+class _Buffer:
+    """A write-only, unseekable file whose contents are taken with ``drain()``."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def archive_name(record):
+    """Where ``record``'s file goes in the archive."""
+    return f'records/{record.pk}-{filename(record)}'
+
+
+def _zip_info(name, when, compress_type):
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime(when).timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def _write_records(zip_file, buffer, patient, missing):
+    records = MedicalRecord.objects.filter(user=patient).exclude(file='').only('pk', 'title', 'file', 'uploaded_at')
+    for record in records.order_by('pk').iterator():
+        storage = record.file.storage
+        try:
+            size = storage.size(record.file.name)
+            source = storage.open(record.file.name, 'rb')
+        except OSError:
+            missing.add(record.pk)
+            continue
+        info = _zip_info(archive_name(record), record.uploaded_at, zipfile.ZIP_STORED)
+        # A known size lets zipfile pick ZIP64 for files over 4 GB.
+        info.file_size = size
+        with source, zip_file.open(info, 'w') as entry:
+            while chunk := source.read(READ_SIZE):
+                entry.write(chunk)
+                yield buffer.drain()
+        yield buffer.drain()
+
+
+def _write_table(zip_file, buffer, name, patient, missing, counts, now):
+    model, fields = TABLES[name]
+    is_records = model is MedicalRecord
+    columns = [*fields, 'file'] if is_records else fields
+    rows = model.objects.filter(user=patient).values(*columns).order_by('pk')
+    counts[name] = 0
+    with zip_file.open(_zip_info(name, now, zipfile.ZIP_DEFLATED), 'w') as entry:
+        text = io.TextIOWrapper(entry, encoding='utf-8', newline='', write_through=True)
+        writer = csv.DictWriter(text, fieldnames=columns)
+        writer.writeheader()
+        for row in rows.iterator():
+            if is_records:
+                record = MedicalRecord(pk=row['id'], title=row['title'], file=row['file'])
+                row['file'] = archive_name(record) if row['file'] and record.pk not in missing else ''
+            writer.writerow(row)
+            counts[name] += 1
+            yield buffer.drain()
+        text.detach()
+    yield buffer.drain()
+
+
+def _archive(patient, buffer):
+    now = timezone.now()
+    missing = set()
+    counts = {}
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        yield from _write_records(zip_file, buffer, patient, missing)
+        for name in TABLES:
+            yield from _write_table(zip_file, buffer, name, patient, missing, counts, now)
+        manifest = {
+            'patient': {
+                'username': patient.username,
+                'name': patient.get_full_name(),
+                'email': patient.email,
+            },
+            'generated_at': now.isoformat(),
+            'tables': counts,
+            'missing_files': sorted(missing),
+        }
+        zip_file.writestr(
+            _zip_info('manifest.json', now, zipfile.ZIP_DEFLATED),
+            json.dumps(manifest, indent=2),
+        )
+    yield buffer.drain()
+
+
+def archive(patient):
+    """Yield the bytes of a ZIP archive of ``patient``'s records, prescriptions and appointments."""
+    for data in _archive(patient, _Buffer()):
+        if data:
+            yield data
@@ -0,0 +1,134 @@
+"""
+iCalendar (.ics) feeds of a user's appointments.
+
+Each profile can have a secret ``calendar_token``; ``/calendar/<token>.ics``
+serves the doctor's or patient's appointments from ``FEED_PAST`` ago to
+``FEED_FUTURE`` ahead without a login, since calendar apps can't log in.
+Resetting the token revokes the old URL.
+
+Calendar apps poll feeds every few minutes. ``feed_etag`` hashes the id and
+``updated_at`` of each appointment in the window together with the names
+shown in its summary, read as narrow tuples over the (user or doctor,
+datetime) index, so an unchanged feed is answered with a 304 without
+rendering anything. A deletion offset by an older appointment entering the
+window, or a renamed patient or doctor, still changes the ETag. Otherwise
+``feed_lines`` streams the events straight from the same range query.
+"""
+import hashlib
+import secrets
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .models import Appointment
+from .slots import SLOT_MINUTES
+
+FEED_PAST = timedelta(days=30)
+FEED_FUTURE = timedelta(days=365)
+CHUNK_SIZE = 500
+STATUSES = {
+    'Scheduled': 'TENTATIVE',
+    'Confirmed': 'CONFIRMED',
+    'Completed': 'CONFIRMED',
+    'No-show': 'CONFIRMED',
+}
+
+
+def get_token(profile):
+    """The calendar token of ``profile``, created the first time."""
+    if not profile.calendar_token:
+        profile.calendar_token = secrets.token_urlsafe(32)
+        profile.save(update_fields=['calendar_token'])
+    return profile.calendar_token
+
+
+def reset_token(profile):
+    """Give ``profile`` a new calendar token, so the old feed URL stops working."""
+    profile.calendar_token = secrets.token_urlsafe(32)
+    profile.save(update_fields=['calendar_token'])
+    return profile.calendar_token
+
+
+def feed_appointments(profile, now=None):
+    """The appointments in the feed of ``profile``, oldest first."""
+    now = now or timezone.now()
+    owner = {'doctor__user': profile.user} if profile.is_doctor else {'user': profile.user}
+    return Appointment.objects.filter(
+        datetime__gte=now - FEED_PAST,
+        datetime__lt=now + FEED_FUTURE,
+        status__in=STATUSES,
+        **owner,
+    )
+
+
+def feed_etag(profile, appointments):
+    """An ETag that changes whenever an appointment enters, leaves or changes in the feed."""
+    # The summary names the other party: the patient in a doctor's feed, the doctor otherwise.
+    other = 'user__' if profile.is_doctor else 'doctor__user__'
+    rows = appointments.order_by('pk').values_list(
+        'pk', 'updated_at', f'{other}first_name', f'{other}last_name', f'{other}username',
+    )
+    digest = hashlib.md5(f'{profile.calendar_token}:{profile.is_doctor}'.encode())
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        digest.update(repr(row).encode())
+    return quote_etag(digest.hexdigest())
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Split ``line`` into the 75-octet pieces iCalendar allows, continued with a space."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces = []
+    while encoded:
+        size = 75 if not pieces else 74
+        # Don't cut a UTF-8 character in half.
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        pieces.append(encoded[:size].decode())
+        encoded = encoded[size:]
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _timestamp(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(appointment, is_doctor, domain):
+    if is_doctor:
+        patient = appointment.user
+        summary = f'{appointment.appointment_type}: {patient.get_full_name() or patient.username}'
+    else:
+        summary = f'{appointment.appointment_type} with {appointment.doctor}'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{appointment.pk}@{domain}',
+        f'DTSTAMP:{_timestamp(appointment.updated_at)}',
+        f'LAST-MODIFIED:{_timestamp(appointment.updated_at)}',
+        f'DTSTART:{_timestamp(appointment.datetime)}',
+        f'DTEND:{_timestamp(appointment.datetime + timedelta(minutes=SLOT_MINUTES))}',
+        f'SUMMARY:{_escape(summary)}',
+        f'STATUS:{STATUSES[appointment.status]}',
+    ]
+    if appointment.symptoms:
+        lines.append(f'DESCRIPTION:{_escape(appointment.symptoms)}')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def feed_lines(profile, appointments, domain):
+    """Yield the feed of ``profile`` as iCalendar text, one event at a time."""
+    yield _fold('BEGIN:VCALENDAR')
+    yield _fold('VERSION:2.0')
+    yield _fold(f'PRODID:-//{domain}//Online Health Consultation//EN')
+    yield _fold('CALSCALE:GREGORIAN')
+    yield _fold(f'X-WR-CALNAME:{_escape("Patient appointments" if profile.is_doctor else "My appointments")}')
+    appointments = appointments.select_related('user', 'doctor__user').order_by('datetime', 'pk')
+    for appointment in appointments.iterator(chunk_size=CHUNK_SIZE):
+        yield _event(appointment, profile.is_doctor, domain)
+    yield _fold('END:VCALENDAR')
@@ -0,0 +1,140 @@
+"""
+Resized WebP/AVIF derivatives for uploaded images.
+
+Originals are kept as uploaded. After a profile picture or article image is
+saved, a background thread pool writes downscaled copies next to the original
+(``profile_pics/me.jpg`` -> ``profile_pics/me.thumb.webp`` and so on), and the
+``image_tags`` template library picks the right one at render time, falling
+back to the original until the derivatives exist.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    'thumb': (96, 96),
+    'card': (480, 480),
+    'full': (1200, 1200),
+}
+FORMATS = [('webp', 'WEBP')] + ([('avif', 'AVIF')] if features.check('avif') else [])
+QUALITY = 80
+CACHE_PREFIX = 'image_derivatives:'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+    thread_name_prefix='image-derivatives',
+)
+
+
+def derivative_name(name, size, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}.{extension}'
+
+
+def available_derivatives(fieldfile):
+    """Return ``{(size, extension): name}`` for the derivatives of ``fieldfile`` that exist."""
+    key = CACHE_PREFIX + fieldfile.name
+    available = cache.get(key)
+    if available is None:
+        available = {
+            (size, extension): derivative_name(fieldfile.name, size, extension)
+            for size in SIZES
+            for extension, _ in FORMATS
+            if fieldfile.storage.exists(derivative_name(fieldfile.name, size, extension))
+        }
+        cache.set(key, available, CACHE_TIMEOUT)
+    return available
+
+
+def generate_derivatives(storage, name):
+    """Write every missing derivative of the image ``name`` in ``storage``."""
+    missing = [
+        (size, extension, pil_format)
+        for size in SIZES
+        for extension, pil_format in FORMATS
+        if not storage.exists(derivative_name(name, size, extension))
+    ]
+    if not missing or not storage.exists(name):
+        return 0
+
+    with storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        # Let JPEG decode at reduced scale instead of inflating the full bitmap.
+        largest = max(SIZES.values())
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image.load()
+
+    for size, extension, pil_format in missing:
+        resized = image.copy()
+        resized.thumbnail(SIZES[size], Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, pil_format, quality=QUALITY)
+        storage.save(derivative_name(name, size, extension), ContentFile(buffer.getvalue()))
+
+    cache.delete(CACHE_PREFIX + name)
+    return len(missing)
+
+
+def _run(storage, name):
+    close_old_connections()
+    try:
+        generate_derivatives(storage, name)
+    except Exception:
+        logger.exception('Failed to generate derivatives for %s', name)
+
+
+def schedule_derivatives(fieldfile):
+    """Queue derivative generation for ``fieldfile`` once the current transaction commits."""
+    if not fieldfile or not fieldfile.name:
+        return
+    storage, name = fieldfile.storage, fieldfile.name
+    transaction.on_commit(lambda: _executor.submit(_run, storage, name))
+
+
+def _delete(storage, name):
+    for size in SIZES:
+        for extension, _ in FORMATS:
+            storage.delete(derivative_name(name, size, extension))
+    cache.delete(CACHE_PREFIX + name)
+
+
+def _is_default(fieldfile, name):
+    # The field default (e.g. profile_pics/default.jpg) is shared by every row
+    # without an upload of its own, so its derivatives are never removed.
+    return name == fieldfile.field.default
+
+
+def delete_derivatives(fieldfile):
+    """Remove the derivatives of ``fieldfile`` from its storage."""
+    if not fieldfile or not fieldfile.name or _is_default(fieldfile, fieldfile.name):
+        return
+    _delete(fieldfile.storage, fieldfile.name)
+
+
+def image_changed(fieldfile, previous):
+    """
+    Handle an image field saved with ``fieldfile`` where it held the file
+    named ``previous`` before: drop the old file's derivatives and queue the
+    new one's, after the current transaction. Nothing happens if the image
+    is the same, and the field default keeps its derivatives.
+    """
+    name = fieldfile.name if fieldfile else ''
+    if name == (previous or ''):
+        return
+    if previous and not _is_default(fieldfile, previous):
+        storage = fieldfile.storage
+        transaction.on_commit(lambda: _delete(storage, previous))
+    schedule_derivatives(fieldfile)
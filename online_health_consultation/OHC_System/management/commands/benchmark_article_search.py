@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from OHC_System.models import HealthArticle
+from OHC_System.search import index_articles, search
+
+WORDS = '''
+    allergy anemia anxiety arthritis asthma blood bone cancer cardiac cholesterol
+    cold cough dementia depression diabetes diet digestion exercise eye fatigue
+    fever flu fracture headache hearing heart hepatitis hormone hypertension
+    immunity infection insomnia kidney liver lung malaria measles medication
+    migraine nutrition obesity pain pneumonia pregnancy pressure rash sleep
+    skin stomach stress stroke sugar thyroid tuberculosis ulcer vaccine vitamin
+    water weight wellness wound
+'''.split()
+
+
+SYLLABLES = ['ba', 'ce', 'di', 'fo', 'gu', 'ka', 'le', 'mi', 'no', 'pu', 'ra', 'se', 'ti', 'vo', 'zu']
+
+
+class Command(BaseCommand):
+    help = 'Times article indexing and search on synthetic data (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def _text(self, rng, length):
+        # Zipf-like word frequencies, so common terms have long postings lists
+        return ' '.join(rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=length))
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        filler = {''.join(rng.sample(SYLLABLES, 3)) for _ in range(5000)}
+        self.vocabulary = WORDS + sorted(filler)
+        self.cum_weights = []
+        total = 0
+        for rank in range(1, len(self.vocabulary) + 1):
+            total += 1 / rank
+            self.cum_weights.append(total)
+        count = options['articles']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            author = User.objects.create(username='benchmark-author')
+
+            start = time.perf_counter()
+            for offset in range(0, count, batch_size):
+                articles = HealthArticle.objects.bulk_create([
+                    HealthArticle(
+                        title=self._text(rng, 6),
+                        slug=f'benchmark-{i}',
+                        summary=self._text(rng, 25),
+                        content=self._text(rng, 300),
+                        author=author,
+                    )
+                    for i in range(offset, min(offset + batch_size, count))
+                ])
+                index_articles(articles)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'Indexed {count} articles in {elapsed:.1f}s ({count / elapsed:.0f}/s)')
+
+            timings = []
+            for _ in range(options['queries']):
+                query = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+                start = time.perf_counter()
+                search(query, limit=20)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{len(timings)} queries: median {timings[len(timings) // 2] * 1000:.1f}ms, '
+                    f'p95 {timings[int(len(timings) * 0.95)] * 1000:.1f}ms, '
+                    f'max {timings[-1] * 1000:.1f}ms'
+                )
+            )
+            transaction.set_rollback(True)
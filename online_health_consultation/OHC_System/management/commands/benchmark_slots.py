@@ -0,0 +1,103 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from OHC_System.models import Appointment, Doctor
+from OHC_System.slots import SLOT_MINUTES, Availability
+
+
+class Command(BaseCommand):
+    help = 'Times free-slot lookups on synthetic doctors and appointments (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--appointments-per-day', type=int, default=6)
+        parser.add_argument('--queries', type=int, default=200)
+
+    def _time(self, label, func, repeat=1):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.stdout.write(
+            f'{label}: median {timings[len(timings) // 2] * 1000:.1f}ms, '
+            f'max {timings[-1] * 1000:.1f}ms'
+        )
+        return result
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        doctor_count, days = options['doctors'], options['days']
+        first_day = timezone.localdate() + datetime.timedelta(days=1)
+        last_day = first_day + datetime.timedelta(days=days - 1)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=f'benchmark-doctor-{i}') for i in range(doctor_count)
+            ])
+            patient = User.objects.create(username='benchmark-patient')
+            doctors = Doctor.objects.bulk_create([
+                Doctor(
+                    user=user,
+                    specialization=rng.choice(['Cardiology', 'Dermatology', 'General', 'Pediatrics']),
+                    license_number=f'BENCH-{i}',
+                    available_from=datetime.time(rng.choice([7, 8, 9, 10])),
+                    available_to=datetime.time(rng.choice([15, 16, 17, 18])),
+                )
+                for i, user in enumerate(users)
+            ])
+
+            start = time.perf_counter()
+            slot_starts = range(9 * 60, 15 * 60, SLOT_MINUTES)
+            appointments = []
+            for doctor in doctors:
+                for day in range(days):
+                    date = first_day + datetime.timedelta(days=day)
+                    for minutes in rng.sample(slot_starts, min(options['appointments_per_day'], len(slot_starts))):
+                        appointments.append(Appointment(
+                            user=patient,
+                            doctor=doctor,
+                            datetime=timezone.make_aware(
+                                datetime.datetime.combine(date, datetime.time()) + datetime.timedelta(minutes=minutes)
+                            ),
+                        ))
+            Appointment.objects.bulk_create(appointments, batch_size=5000)
+            self.stdout.write(
+                f'Created {doctor_count} doctors and {len(appointments)} appointments '
+                f'in {time.perf_counter() - start:.1f}s'
+            )
+
+            availability = self._time(
+                f'Build {doctor_count} doctors x {days} days',
+                lambda: Availability.for_range(first_day, last_day),
+            )
+            free = self._time(
+                'Free slots of every doctor',
+                lambda: sum(len(availability.free_slots(doctor.pk)) for doctor in doctors),
+            )
+            self.stdout.write(f'{free} free slots in total')
+
+            def one_doctor():
+                doctor = rng.choice(doctors)
+                return Availability([doctor], first_day, last_day).free_slots_by_date(doctor.pk)
+
+            self._time(f'One doctor x {days} days, {options["queries"]} times', one_doctor, repeat=options['queries'])
+
+            def free_at():
+                at = timezone.make_aware(datetime.datetime.combine(
+                    first_day + datetime.timedelta(days=rng.randrange(days)),
+                    datetime.time(rng.randrange(8, 17), rng.choice([0, 30])),
+                ))
+                day = timezone.localtime(at).date()
+                return Availability.for_range(day, day).free_doctors(at)
+
+            self._time(f'Doctors free at T, {options["queries"]} times', free_at, repeat=options['queries'])
+            self.stdout.write(self.style.SUCCESS('Successfully benchmarked slot availability'))
+            transaction.set_rollback(True)
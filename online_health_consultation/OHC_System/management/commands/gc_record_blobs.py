@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from OHC_System import record_storage
+
+class Command(BaseCommand):
+    help = 'Removes medical record files that no record has used for an hour'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        removed, freed = record_storage.collect_garbage('medical_records', dry_run=options['dry_run'])
+        verb = 'would remove' if options['dry_run'] else 'removed'
+        self.stdout.write(self.style.SUCCESS(f'Successfully {verb} {removed} unused files ({freed} bytes)'))
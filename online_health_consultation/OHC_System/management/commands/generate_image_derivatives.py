@@ -0,0 +1,31 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from OHC_System.images import generate_derivatives
+from OHC_System.models import HealthArticle, Profile
+
+class Command(BaseCommand):
+    help = 'Creates missing resized copies of profile pictures and article images'
+
+    def handle(self, *args, **kwargs):
+        profiles = Profile.objects.exclude(profile_picture='').only('profile_picture')
+        articles = HealthArticle.objects.exclude(image='').exclude(image=None).only('image')
+        fieldfiles = chain(
+            (profile.profile_picture for profile in profiles.iterator()),
+            (article.image for article in articles.iterator()),
+        )
+        created_count = 0
+        failed_count = 0
+
+        for fieldfile in fieldfiles:
+            try:
+                created_count += generate_derivatives(fieldfile.storage, fieldfile.name)
+            except Exception as e:
+                failed_count += 1
+                self.stderr.write(f'{fieldfile.name}: {e}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully created {created_count} derivatives ({failed_count} images failed)'
+            )
+        )
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from OHC_System import record_uploads
+
+class Command(BaseCommand):
+    help = 'Removes chunked record uploads that were never completed'
+
+    def handle(self, *args, **options):
+        removed = record_uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Successfully removed {removed} unfinished uploads'))
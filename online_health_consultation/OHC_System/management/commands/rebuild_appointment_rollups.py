@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from OHC_System import rollups
+
+class Command(BaseCommand):
+    help = 'Recomputes the appointment analytics rollups from the appointments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (default: the first appointment)')
+        parser.add_argument('--end', help='Last day to rebuild (default: the last appointment)')
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_date(options['start']) if options['start'] else None
+            end = parse_date(options['end']) if options['end'] else None
+        except ValueError:
+            start = end = None
+        if (options['start'] and start is None) or (options['end'] and end is None):
+            raise CommandError('--start and --end must be dates (YYYY-MM-DD)')
+
+        def progress(counted, last_day):
+            self.stdout.write(f'{counted} appointments counted, up to {last_day}')
+
+        counted = rollups.rebuild(start, end, progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Successfully rolled up {counted} appointments'))
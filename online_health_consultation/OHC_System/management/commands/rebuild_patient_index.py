@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from OHC_System import patient_lookup
+
+class Command(BaseCommand):
+    help = 'Rebuilds the patient lookup terms used by the patient autocomplete'
+
+    def handle(self, *args, **options):
+        stored = patient_lookup.index_patients()
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed {stored} patient lookup terms'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from OHC_System.models import MedicalRecord
+from OHC_System import record_search
+
+class Command(BaseCommand):
+    help = 'Extracts the text of medical record files that changed and rebuilds the record search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        records = MedicalRecord.objects.order_by('pk')
+        record_count = extracted = 0
+
+        for record in records.iterator(chunk_size=batch_size):
+            try:
+                extracted += record_search.extract_and_index(record)
+            except Exception as e:
+                self.stderr.write(f'Record {record.pk}: {e}')
+                continue
+            record_count += 1
+            if record_count % batch_size == 0:
+                self.stdout.write(f'{record_count} records indexed')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully indexed {record_count} records ({extracted} files extracted)'
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from OHC_System import similarity
+
+class Command(BaseCommand):
+    help = 'Recomputes related articles for every health article'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=similarity.TOP_K)
+        parser.add_argument('--max-features', type=int, default=similarity.MAX_FEATURES)
+
+    def handle(self, *args, **options):
+        stored = similarity.rebuild(top_k=options['top_k'], max_features=options['max_features'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully stored {stored} related article links'
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from OHC_System.models import HealthArticle
+from OHC_System.search import index_articles
+
+class Command(BaseCommand):
+    help = 'Rebuilds the health article search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        articles = HealthArticle.objects.only('id', 'title', 'summary', 'content').order_by('pk')
+        batch = []
+        article_count = term_count = 0
+
+        for article in articles.iterator(chunk_size=batch_size):
+            batch.append(article)
+            if len(batch) >= batch_size:
+                term_count += index_articles(batch)
+                article_count += len(batch)
+                batch = []
+        if batch:
+            term_count += index_articles(batch)
+            article_count += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully indexed {article_count} articles ({term_count} terms)'
+            )
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from OHC_System import doctor_stats
+
+class Command(BaseCommand):
+    help = 'Recomputes the doctor dashboard counters from the appointments table'
+
+    def handle(self, *args, **options):
+        drifted = doctor_stats.reconcile()
+        if drifted:
+            self.stdout.write(f'Corrected counters of {len(drifted)} doctor(s): {", ".join(map(str, drifted))}')
+        self.stdout.write(self.style.SUCCESS('Successfully reconciled doctor counters'))
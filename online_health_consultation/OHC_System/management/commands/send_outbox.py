@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from OHC_System import outbox
+
+class Command(BaseCommand):
+    help = 'Sends the queued emails that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(sent, failed):
+            self.stdout.write(f'{sent} sent, {failed} failed')
+
+        sent, failed = outbox.deliver(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Successfully sent {sent} emails ({failed} failed)'))
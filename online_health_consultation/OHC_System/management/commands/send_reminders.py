@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from OHC_System import reminders
+
+class Command(BaseCommand):
+    help = 'Queues the appointment reminder emails that are due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reminders.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(sent, skipped):
+            self.stdout.write(f'{sent} queued, {skipped} skipped')
+
+        sent, skipped = reminders.send_due(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Successfully queued {sent} reminders ({skipped} no longer needed)'))
@@ -0,0 +1,112 @@
+import datetime
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from OHC_System.booking import SlotUnavailable, book
+from OHC_System.models import Appointment, Doctor
+from OHC_System.slots import SLOT_MINUTES
+
+
+class Command(BaseCommand):
+    help = 'Fires simultaneous bookings at the same slots and checks that exactly one wins each'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=200)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--bookings', type=int, default=2000, help='Distinct slots booked for the throughput run')
+
+    def _run(self, thread_count, work):
+        """Run ``work(index)`` in ``thread_count`` threads released at the same moment."""
+        barrier = threading.Barrier(thread_count)
+        results = [None] * thread_count
+
+        def target(index):
+            barrier.wait()
+            try:
+                results[index] = work(index)
+            except Exception as exc:
+                results[index] = type(exc).__name__
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(thread_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        first_day = timezone.localdate() + datetime.timedelta(days=1)
+        # The doctor works 00:00-23:59, so the last slot of each day is out of hours.
+        slots_per_day = 24 * 60 // SLOT_MINUTES - 1
+
+        def slot(index):
+            day, minutes = divmod(index, slots_per_day)
+            return timezone.make_aware(datetime.datetime.combine(
+                first_day + datetime.timedelta(days=day), datetime.time()
+            ) + datetime.timedelta(minutes=minutes * SLOT_MINUTES))
+
+        patients = User.objects.bulk_create([User(username=f'stress-patient-{i}') for i in range(threads)])
+        doctor = Doctor.objects.create(
+            user=User.objects.create(username='stress-doctor'),
+            specialization='General',
+            license_number='STRESS-1',
+            available_from=datetime.time(0),
+            available_to=datetime.time(23, 59),
+        )
+        try:
+            failed = False
+            for round_number in range(options['rounds']):
+                at = slot(round_number)
+
+                def attempt(index):
+                    try:
+                        book(patients[index], doctor, at)
+                        return 'booked'
+                    except SlotUnavailable:
+                        return 'conflict'
+
+                results, elapsed = self._run(threads, attempt)
+                outcome = Counter(results)
+                stored = Appointment.objects.filter(doctor=doctor, datetime=at).count()
+                self.stdout.write(
+                    f'Round {round_number + 1}: {dict(outcome)} in {elapsed * 1000:.0f}ms, '
+                    f'{stored} appointment(s) stored'
+                )
+                failed |= outcome['booked'] != 1 or stored != 1
+
+            # Throughput without contention: every thread books its own slots.
+            offset = options['rounds']
+            total = options['bookings']
+            per_thread = -(-total // threads)
+
+            def book_many(index):
+                booked = 0
+                for n in range(index * per_thread, min((index + 1) * per_thread, total)):
+                    book(patients[index], doctor, slot(offset + n))
+                    booked += 1
+                return booked
+
+            results, elapsed = self._run(threads, book_many)
+            booked = sum(result for result in results if isinstance(result, int))
+            errors = Counter(result for result in results if not isinstance(result, int))
+            self.stdout.write(
+                f'Throughput: {booked} bookings by {threads} threads in {elapsed:.2f}s '
+                f'({booked / elapsed:.0f}/s){f", errors: {dict(errors)}" if errors else ""}'
+            )
+        finally:
+            Appointment.objects.filter(doctor=doctor).delete()
+            doctor.user.delete()
+            User.objects.filter(pk__in=[patient.pk for patient in patients]).delete()
+
+        if failed:
+            raise CommandError('A slot was booked more or less than exactly once')
+        self.stdout.write(self.style.SUCCESS('Successfully booked every contended slot exactly once'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from OHC_System import no_shows
+
+class Command(BaseCommand):
+    help = 'Marks appointments that were never attended as no-shows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=no_shows.SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(swept, last_pk):
+            self.stdout.write(f'{swept} marked, up to appointment #{last_pk}')
+
+        swept = no_shows.sweep(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Successfully marked {swept} appointments as no-shows'))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0009_healtharticle_views'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healtharticle',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='OHC_System.category'),
+        ),
+        migrations.AddField(
+            model_name='healtharticle',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='ArticleSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.FloatField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='OHC_System.healtharticle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'article'], name='article_search_term_idx')],
+                'constraints': [models.UniqueConstraint(fields=('article', 'term'), name='unique_article_search_term')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0010_healtharticle_summary_category_articlesearchterm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', '-datetime', '-id'], name='appointment_user_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', '-datetime', '-id'], name='appointment_doctor_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healtharticle',
+            index=models.Index(fields=['-created_at', '-id'], name='article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['user', '-date', '-id'], name='prescription_user_date_idx'),
+        ),
+    ]
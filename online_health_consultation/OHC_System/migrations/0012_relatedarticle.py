@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedArticle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='OHC_System.healtharticle')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_from', to='OHC_System.healtharticle')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['article', 'rank'], name='related_article_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('article', 'related'), name='unique_related_article')],
+            },
+        ),
+    ]
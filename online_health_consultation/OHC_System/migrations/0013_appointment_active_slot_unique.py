@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def cancel_double_bookings(apps, schema_editor):
+    # Keep the first booking of every slot that was booked more than once.
+    Appointment = apps.get_model('OHC_System', 'Appointment')
+    active = Appointment.objects.filter(status__in=['Scheduled', 'Confirmed'])
+    duplicates = (
+        active.values('doctor', 'datetime')
+        .annotate(bookings=Count('id'), first=Min('id'))
+        .filter(bookings__gt=1, datetime__isnull=False)
+    )
+    for slot in duplicates:
+        active.filter(doctor=slot['doctor'], datetime=slot['datetime']).exclude(
+            id=slot['first']
+        ).update(status='Cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0012_relatedarticle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Scheduled', 'Confirmed'])), fields=('doctor', 'datetime'), name='appointment_active_slot_unique'),
+        ),
+    ]
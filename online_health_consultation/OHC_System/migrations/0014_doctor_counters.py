@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalise_statuses(apps, schema_editor):
+    # Cancelling and completing used to store lowercase statuses the counters would not recognise.
+    Appointment = apps.get_model('OHC_System', 'Appointment')
+    for status in ('Completed', 'Cancelled'):
+        Appointment.objects.filter(status__iexact=status).exclude(status=status).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0013_appointment_active_slot_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalise_statuses, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DoctorStats',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='OHC_System.doctor')),
+                ('pending_consultations', models.PositiveIntegerField(default=0)),
+                ('completed_sessions', models.PositiveIntegerField(default=0)),
+                ('total_patients', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DoctorPatient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointments', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_links', to='OHC_System.doctor')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='doctor_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'user'), name='unique_doctor_patient')],
+            },
+        ),
+    ]
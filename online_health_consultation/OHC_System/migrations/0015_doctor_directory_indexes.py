@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0014_doctor_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization', 'consultation_fee'], name='doctor_specialization_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['consultation_fee'], name='doctor_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['experience_years'], name='doctor_experience_idx'),
+        ),
+    ]
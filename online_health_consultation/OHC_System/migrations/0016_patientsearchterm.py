@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:21
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# A copy of OHC_System.patient_lookup.patient_terms as it was when this
+# migration was written, so later changes to that module don't alter it.
+WORD_RE = re.compile(r'\w+')
+DIGITS_RE = re.compile(r'\d')
+MAX_TERM_LENGTH = 50
+MIN_PHONE_DIGITS = 4
+
+
+def patient_terms(user, profile):
+    terms = set()
+    for value in (user.first_name, user.last_name, user.username):
+        terms.update(word[:MAX_TERM_LENGTH] for word in WORD_RE.findall((value or '').lower()))
+    phone = ''.join(DIGITS_RE.findall(profile.phone_number or '')) if profile else ''
+    phone = phone[-MAX_TERM_LENGTH:]
+    terms.update(phone[start:] for start in range(len(phone) - MIN_PHONE_DIGITS + 1))
+    return terms
+
+
+def index_patients(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    PatientSearchTerm = apps.get_model('OHC_System', 'PatientSearchTerm')
+    batch = []
+    for user in User.objects.filter(profile__is_doctor=False).select_related('profile').iterator(chunk_size=1000):
+        batch.extend(PatientSearchTerm(user=user, term=term) for term in patient_terms(user, user.profile))
+        if len(batch) >= 1000:
+            PatientSearchTerm.objects.bulk_create(batch)
+            batch = []
+    PatientSearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0015_doctor_directory_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term'], name='patient_search_term_idx', opclasses=['varchar_pattern_ops'])],
+                'constraints': [models.UniqueConstraint(fields=('user', 'term'), name='unique_patient_search_term')],
+            },
+        ),
+        migrations.RunPython(index_patients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:25
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# OHC_System.reminders.OFFSETS as it was when this migration was written.
+OFFSETS = {
+    '24h': timedelta(hours=24),
+    '1h': timedelta(hours=1),
+}
+
+
+def schedule_upcoming(apps, schema_editor):
+    Appointment = apps.get_model('OHC_System', 'Appointment')
+    AppointmentReminder = apps.get_model('OHC_System', 'AppointmentReminder')
+    now = timezone.now()
+    upcoming = Appointment.objects.filter(status__in=['Scheduled', 'Confirmed'], datetime__gt=now)
+    AppointmentReminder.objects.bulk_create([
+        AppointmentReminder(appointment_id=appointment_id, kind=kind, due_at=start - offset)
+        for appointment_id, start in upcoming.values_list('pk', 'datetime').iterator()
+        for kind, offset in OFFSETS.items()
+        if start - offset > now
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0017_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('24h', '24 hours before'), ('1h', '1 hour before')], max_length=5)),
+                ('due_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='OHC_System.appointment')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['due_at'], name='appointment_reminder_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'kind'), name='unique_appointment_reminder')],
+            },
+        ),
+        migrations.RunPython(schedule_upcoming, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0018_appointmentreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('period_start', models.DateField()),
+                ('appointment_type', models.CharField(choices=[('Consultation', 'Consultation'), ('Follow-up', 'Follow-up'), ('Test', 'Test'), ('Procedure', 'Procedure')], max_length=20)),
+                ('status', models.CharField(choices=[('Scheduled', 'Scheduled'), ('Confirmed', 'Confirmed'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled'), ('No-show', 'No-show')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_rollups', to='OHC_System.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start'], name='appointment_rollup_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'doctor', 'appointment_type', 'status'), name='unique_appointment_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:33
+
+import OHC_System.record_storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    MedicalRecord = apps.get_model('OHC_System', 'MedicalRecord')
+    RecordBlob = apps.get_model('OHC_System', 'RecordBlob')
+    storage = MedicalRecord._meta.get_field('file').storage
+    blobs = []
+    for row in MedicalRecord.objects.exclude(file='').values('file').annotate(references=Count('pk')).order_by().iterator():
+        try:
+            size = storage.size(row['file'])
+        except OSError:
+            size = 0
+        blobs.append(RecordBlob(name=row['file'], size=size, references=row['references']))
+    RecordBlob.objects.bulk_create(blobs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0021_recordupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='medicalrecord',
+            name='file',
+            field=models.FileField(storage=OHC_System.record_storage.record_storage, upload_to='medical_records/'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OHC_System', '0022_recordblob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordText',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='OHC_System.medicalrecord')),
+                ('source', models.CharField(max_length=255)),
+                ('content', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecordSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=50)),
+                ('weight', models.FloatField()),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='OHC_System.medicalrecord')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='record_search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'term', 'record'], name='record_search_term_idx')],
+                'constraints': [models.UniqueConstraint(fields=('record', 'term'), name='unique_record_search_term')],
+            },
+        ),
+    ]
@@ -1,7 +1,12 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 
+from .record_storage import record_storage
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     is_doctor = models.BooleanField(default=False)
@@ -11,6 +16,7 @@ class Profile(models.Model):
     blood_group = models.CharField(max_length=3, blank=True)
     emergency_contact_name = models.CharField(max_length=100, null=True, blank=True)  # Making it nullable for existing records
     emergency_contact_phone = models.CharField(max_length=15, null=True, blank=True)  # Making it nullable for existing records
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Secret in the .ics feed URL
 
     def __str__(self):
         return f"{self.user.username} - {'Doctor' if self.is_doctor else 'Patient'}"
@@ -25,6 +31,13 @@ class Doctor(models.Model):
     consultation_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     experience_years = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['specialization', 'consultation_fee'], name='doctor_specialization_fee_idx'),
+            models.Index(fields=['consultation_fee'], name='doctor_fee_idx'),
+            models.Index(fields=['experience_years'], name='doctor_experience_idx'),
+        ]
+
     def __str__(self):
         return f"Dr. {self.user.get_full_name() or self.user.username}"
 
@@ -66,13 +79,13 @@ class Category(models.Model):
 class HealthArticle(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
-    summary = models.TextField()
+    summary = models.TextField(blank=True)
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     image = models.ImageField(upload_to='article_images/', null=True, blank=True)
     featured = models.BooleanField(default=False)
-    views = models.IntegerField(default=0)
+    views = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -81,21 +94,71 @@ class HealthArticle(models.Model):
             self.slug = slugify(self.title)
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='article_created_idx'),
+        ]
+
     def get_related_articles(self):
+        # Neighbours are precomputed by OHC_System.similarity
         return HealthArticle.objects.filter(
-            category=self.category
-        ).exclude(id=self.id).order_by('-views')[:5]
+            related_from__article=self
+        ).order_by('related_from__rank')[:5]
 
     def __str__(self):
         return self.title
-    experience_years = models.IntegerField()
-    consultation_fee = models.DecimalField(max_digits=10, decimal_places=2)
-    available_from = models.TimeField()
-    available_to = models.TimeField()
-    is_available = models.BooleanField(default=True)
+
+class RelatedArticle(models.Model):
+    """A precomputed nearest neighbour of an article by TF-IDF cosine similarity."""
+    article = models.ForeignKey(HealthArticle, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(HealthArticle, on_delete=models.CASCADE, related_name='related_from')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'related'], name='unique_related_article'),
+        ]
+        indexes = [
+            models.Index(fields=['article', 'rank'], name='related_article_rank_idx'),
+        ]
 
     def __str__(self):
-        return f"Dr. {self.user.get_full_name()}"
+        return f"{self.related_id} related to {self.article_id}"
+
+class ArticleSearchTerm(models.Model):
+    """One row of the article search index: a term and its weight in an article."""
+    article = models.ForeignKey(HealthArticle, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=50)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['article', 'term'], name='unique_article_search_term'),
+        ]
+        indexes = [
+            models.Index(fields=['term', 'article'], name='article_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.article_id}"
+
+class PatientSearchTerm(models.Model):
+    """A lowercase name part or phone number of a patient, for prefix lookups."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_search_terms')
+    term = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'term'], name='unique_patient_search_term'),
+        ]
+        indexes = [
+            # varchar_pattern_ops lets PostgreSQL use the index for LIKE 'prefix%'.
+            models.Index(fields=['term'], name='patient_search_term_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} for {self.user_id}"
 
 class Appointment(models.Model):
     APPOINTMENT_TYPE_CHOICES = [
@@ -132,10 +195,98 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['-datetime']
+        indexes = [
+            models.Index(fields=['user', '-datetime', '-id'], name='appointment_user_dt_idx'),
+            models.Index(fields=['doctor', '-datetime', '-id'], name='appointment_doctor_dt_idx'),
+        ]
+        constraints = [
+            # A doctor's slot can only be held by one active appointment.
+            models.UniqueConstraint(
+                fields=['doctor', 'datetime'],
+                condition=models.Q(status__in=['Scheduled', 'Confirmed']),
+                name='appointment_active_slot_unique',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.appointment_type} with Dr. {self.doctor} on {self.datetime}"
 
+class DoctorStats(models.Model):
+    """Counters for the doctor dashboard, kept up to date as appointments change."""
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    pending_consultations = models.PositiveIntegerField(default=0)
+    completed_sessions = models.PositiveIntegerField(default=0)
+    total_patients = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats for {self.doctor_id}"
+
+class DoctorPatient(models.Model):
+    """How many appointments a patient has with a doctor, to count distinct patients."""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='patient_links')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_links')
+    appointments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'user'], name='unique_doctor_patient'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} seen by {self.doctor_id}"
+
+class AppointmentReminder(models.Model):
+    """A reminder email due some time before an appointment."""
+    KIND_CHOICES = [
+        ('24h', '24 hours before'),
+        ('1h', '1 hour before')
+    ]
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    due_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'kind'], name='unique_appointment_reminder'),
+        ]
+        indexes = [
+            # Only reminders still to be sent are indexed, so finding the due ones stays cheap.
+            models.Index(fields=['due_at'], condition=models.Q(sent_at__isnull=True), name='appointment_reminder_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} reminder for appointment {self.appointment_id}"
+
+class AppointmentRollup(models.Model):
+    """Number of appointments of a doctor per day or week, type and status."""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week')
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointment_rollups')
+    appointment_type = models.CharField(max_length=20, choices=Appointment.APPOINTMENT_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'doctor', 'appointment_type', 'status'],
+                name='unique_appointment_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='appointment_rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.count} {self.status} {self.appointment_type} for {self.doctor_id} in {self.period} {self.period_start}"
+
 class Question(models.Model):
     patient = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -169,13 +320,66 @@ class MedicalRecord(models.Model):
     title = models.CharField(max_length=200)
     date = models.DateField()
     record_type = models.CharField(max_length=50)
-    file = models.FileField(upload_to='medical_records/')
+    file = models.FileField(upload_to='medical_records/', storage=record_storage)
     notes = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
+class RecordText(models.Model):
+    """Text extracted from a medical record's file, and the stored file it came from."""
+    record = models.OneToOneField(MedicalRecord, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    source = models.CharField(max_length=255)
+    content = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.record_id} from {self.source}"
+
+class RecordSearchTerm(models.Model):
+    """One row of a patient's record search index: a term and its weight in one of their records."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='record_search_terms')
+    record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=50)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['record', 'term'], name='unique_record_search_term'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'term', 'record'], name='record_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.record_id}"
+
+class RecordBlob(models.Model):
+    """A stored medical record file and how many records use it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
+
+class RecordUpload(models.Model):
+    """A medical record file being uploaded in chunks, kept until it is completed or expires."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='record_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # Expected digest, if the client sent one
+    received = models.PositiveBigIntegerField(default=0)
+    chunks = models.JSONField(default=list)  # [offset, size, storage name, sha256] of every stored chunk, in order
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes) for {self.user.username}"
+
 class Prescription(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
@@ -186,27 +390,13 @@ class Prescription(models.Model):
     next_visit = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
-    def __str__(self):
-        return f"Prescription for {self.user.username} by {self.doctor}"
-
-class HealthArticle(models.Model):
-    title = models.CharField(max_length=200)
-    slug = models.SlugField(unique=True)
-    content = models.TextField()
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    featured = models.BooleanField(default=False)
-    image = models.ImageField(upload_to='article_images/', null=True, blank=True)
-    views = models.PositiveIntegerField(default=0)
-    
-    def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='prescription_user_date_idx'),
+        ]
 
     def __str__(self):
-        return self.title
+        return f"Prescription for {self.user.username} by {self.doctor}"
 
 class EmergencyContact(models.Model):
     name = models.CharField(max_length=100)
@@ -219,3 +409,31 @@ class EmergencyContact(models.Model):
 
     def __str__(self):
         return f"Emergency - {self.name} - {self.emergency_type}"
+
+class OutboundEmail(models.Model):
+    """An email waiting in the outbox, or the record of one that was sent or given up on."""
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed')
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,131 @@
+"""
+Marking overdue appointments as no-shows.
+
+An appointment still ``Scheduled`` or ``Confirmed`` ``NO_SHOW_GRACE_MINUTES``
+after its start is set to ``No-show``. ``sweep`` walks the appointments
+table in primary-key ranges of ``batch_size`` and changes each range with
+one short transaction: the overdue rows are locked (skipping rows another
+sweeper or a request holds), updated in a single ``UPDATE`` and the doctor
+counters and rollups adjusted to match, since ``update()`` doesn't send the signals
+that normally keep them current. Appointments that are no longer active
+don't match, so running it again or in several processes is harmless.
+
+The ``sweep_no_shows`` command runs one sweep, e.g. from cron. Dashboard
+requests also start a daemon thread that sweeps every
+``NO_SHOW_SWEEP_INTERVAL`` seconds; set it to 0 to leave it to the command.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import dashboard_stats, rollups
+from .models import Appointment, Doctor, DoctorStats
+from .slots import ACTIVE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+_sweeper = None
+
+
+def _grace():
+    return timedelta(minutes=getattr(settings, 'NO_SHOW_GRACE_MINUTES', 60))
+
+
+def _sweep_interval():
+    return getattr(settings, 'NO_SHOW_SWEEP_INTERVAL', 300)
+
+
+def overdue(now=None):
+    """Active appointments that should have started more than the grace period ago."""
+    cutoff = (now or timezone.now()) - _grace()
+    return Appointment.objects.filter(status__in=ACTIVE_STATUSES, datetime__lt=cutoff)
+
+
+def _sweep_range(appointments, start, end, now):
+    """Mark the overdue appointments with ``start <= pk < end``. Returns their number."""
+    with transaction.atomic():
+        rows = list(
+            appointments.filter(pk__gte=start, pk__lt=end)
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'doctor_id', 'user_id', 'status', 'appointment_type', 'datetime')
+        )
+        if not rows:
+            return 0
+        Appointment.objects.filter(pk__in=[row[0] for row in rows]).update(status='No-show', updated_at=now)
+
+        pending = Counter(
+            doctor_id for _, doctor_id, _, status, appointment_type, _ in rows
+            if status == 'Scheduled' and appointment_type == 'Consultation'
+        )
+        for doctor_id, count in pending.items():
+            # Clamped so counters that drifted low can't fail the sweep; reconcile() repairs them.
+            DoctorStats.objects.filter(doctor_id=doctor_id).update(
+                pending_consultations=Greatest(F('pending_consultations') - count, 0)
+            )
+
+        deltas = Counter()
+        for _, doctor_id, user_id, status, appointment_type, start in rows:
+            previous = {'doctor_id': doctor_id, 'appointment_type': appointment_type, 'status': status, 'datetime': start}
+            deltas.update(rollups.changes(previous, {**previous, 'status': 'No-show'}))
+        rollups.apply(deltas)
+
+        doctor_ids = {row[1] for row in rows}
+        user_ids = {row[2] for row in rows}
+        user_ids.update(Doctor.objects.filter(pk__in=doctor_ids).values_list('user_id', flat=True))
+        transaction.on_commit(lambda: dashboard_stats.invalidate(*user_ids))
+    return len(rows)
+
+
+def sweep(batch_size=SWEEP_BATCH_SIZE, now=None, progress=None):
+    """
+    Mark every overdue appointment as a no-show and return how many were.
+
+    ``progress`` is called after each batch with the number marked so far
+    and the last primary key covered.
+    """
+    now = now or timezone.now()
+    appointments = overdue(now)
+    bounds = appointments.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+
+    swept = 0
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        swept += _sweep_range(appointments, start, start + batch_size, now)
+        if progress is not None:
+            progress(swept, min(start + batch_size - 1, bounds['last']))
+    return swept
+
+
+def _sweep_loop():
+    while True:
+        close_old_connections()
+        try:
+            swept = sweep()
+            if swept:
+                logger.info('Marked %d overdue appointments as no-shows', swept)
+        except Exception:
+            logger.exception('Failed to sweep overdue appointments')
+        time.sleep(_sweep_interval())
+
+
+def start_sweeper():
+    """Start the background sweeper of this process unless it runs already or is disabled."""
+    global _sweeper
+    if _sweep_interval() <= 0:
+        return
+    with _lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_loop, name='no-show-sweeper', daemon=True)
+            _sweeper.start()
@@ -0,0 +1,178 @@
+"""
+A database outbox for outgoing email.
+
+``enqueue`` stores the message as an ``OutboundEmail`` row, which costs a
+request one INSERT instead of an SMTP conversation. ``deliver`` sends the
+due rows in batches over a single connection from ``get_connection()``, so
+whichever ``EMAIL_BACKEND`` is configured (SMTP, locmem in tests, the file
+backend in development) is used as is.
+
+A batch is claimed by pushing its ``next_attempt_at`` past ``CLAIM_TIMEOUT``
+in a short transaction, so concurrent workers skip it and the messages are
+retried if the worker dies while sending. A message that fails is retried
+with exponential backoff and marked ``Failed`` after ``MAX_ATTEMPTS``; those
+stay in the table for the admin to look at and requeue.
+
+The ``send_outbox`` command drains the outbox, e.g. from cron. Enqueuing
+also starts a daemon thread that delivers as soon as the transaction
+commits and polls every ``EMAIL_OUTBOX_INTERVAL`` seconds after that; set
+it to 0 to leave delivery to the command.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=6)
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+
+
+def _interval():
+    return getattr(settings, 'EMAIL_OUTBOX_INTERVAL', 10)
+
+
+def enqueue(subject, recipients, body='', html_body='', from_email=None):
+    """Queue an email for delivery and return its ``OutboundEmail``."""
+    email = OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+    if _interval() > 0:
+        transaction.on_commit(_wake_worker)
+    return email
+
+
+def retry_delay(attempts):
+    """How long to wait before the next try after ``attempts`` failed ones."""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def _claim(batch_size, now):
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.filter(status='Pending', next_attempt_at__lte=now)
+            .select_for_update(skip_locked=True)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        if emails:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + CLAIM_TIMEOUT,
+            )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _failed(email, error, now):
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'Failed'
+        logger.error('Giving up on email %s after %d attempts: %s', email.pk, email.attempts, email.last_error)
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+    email.save(update_fields=['status', 'last_error', 'next_attempt_at'])
+
+
+def deliver_batch(batch_size=BATCH_SIZE):
+    """Send one batch of due emails. Returns ``(sent, failed)``."""
+    now = timezone.now()
+    emails = _claim(batch_size, now)
+    if not emails:
+        return 0, 0
+
+    sent = []
+    failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for email in emails:
+            try:
+                connection.open()
+                _message(email, connection).send()
+            except Exception as e:
+                # The connection may be unusable now; the next message reopens it.
+                connection.close()
+                _failed(email, e, now)
+                failed += 1
+            else:
+                sent.append(email.pk)
+    finally:
+        connection.close()
+        OutboundEmail.objects.filter(pk__in=sent).update(status='Sent', sent_at=timezone.now(), last_error='')
+    return len(sent), failed
+
+
+def deliver(batch_size=BATCH_SIZE, progress=None):
+    """
+    Send every due email and return ``(sent, failed)``.
+
+    ``progress`` is called after each batch with the running totals.
+    """
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = deliver_batch(batch_size)
+        if not batch_sent and not batch_failed:
+            return sent, failed
+        sent += batch_sent
+        failed += batch_failed
+        if progress is not None:
+            progress(sent, failed)
+
+
+def requeue(emails):
+    """Give failed emails a fresh set of attempts. Returns how many were requeued."""
+    return emails.filter(status='Failed').update(
+        status='Pending', attempts=0, next_attempt_at=timezone.now(), last_error=''
+    )
+
+
+def _worker_loop():
+    while True:
+        _wakeup.wait(_interval())
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            deliver()
+        except Exception:
+            logger.exception('Failed to deliver queued emails')
+
+
+def _wake_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name='email-outbox', daemon=True)
+            _worker.start()
+    _wakeup.set()
@@ -0,0 +1,178 @@
+"""
+Keyset (cursor) pagination for long listings.
+
+Instead of ``OFFSET n`` and a ``COUNT(*)`` for page numbers, each page is
+fetched with ``WHERE (key, id) < (last key, last id) ORDER BY key, id LIMIT n``,
+so every page costs the same no matter how deep it is. Cursors are signed
+tokens carrying the sort key of the first/last row on the current page.
+"""
+import datetime
+import decimal
+import json
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.db.models import F, Q
+
+CURSOR_SALT = 'OHC_System.pagination'
+
+
+class CursorEncoder(json.JSONEncoder):
+    # Unlike DjangoJSONEncoder, keep full microsecond precision so that
+    # equality on the sort key still matches after a round trip.
+    def default(self, o):
+        if isinstance(o, (datetime.date, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        return super().default(o)
+
+
+class CursorSerializer(signing.JSONSerializer):
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=CursorEncoder).encode('latin-1')
+
+
+class KeysetPage:
+    """One page of results plus opaque tokens for the neighbouring pages."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, params, param):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._params = params
+        self._param = param
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _querystring(self, cursor):
+        params = self._params.copy()
+        params[self._param] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self):
+        return self._querystring(self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_querystring(self):
+        return self._querystring(self.previous_cursor) if self.has_previous else ''
+
+
+def _encode(direction, values):
+    return signing.dumps([direction, values], salt=CURSOR_SALT, serializer=CursorSerializer)
+
+
+def _key_field(queryset, name):
+    """The model field or annotation output field a sort key reads."""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _decode(token, fields):
+    """Return ``(direction, values)`` from a cursor, or None if it is missing or invalid."""
+    if not token:
+        return None
+    try:
+        direction, values = signing.loads(token, salt=CURSOR_SALT)
+        if direction not in ('next', 'prev') or len(values) != len(fields):
+            return None
+        return direction, [
+            None if value is None else field.to_python(value)
+            for field, value in zip(fields, values)
+        ]
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+def _ordering(keys, nullable, backwards):
+    # Forward pages put NULLs last; walking backwards reverses that too.
+    ordering = []
+    for (name, descending), null in zip(keys, nullable):
+        descending = descending != backwards
+        if null:
+            nulls = {'nulls_first': True} if backwards else {'nulls_last': True}
+            ordering.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+        else:
+            ordering.append(F(name).desc() if descending else F(name).asc())
+    return ordering
+
+
+def _after(keys, nullable, values, backwards):
+    """Build the filter matching rows that sort after ``values``."""
+    clauses = []
+    equal = Q()
+    for (name, descending), null, value in zip(keys, nullable, values):
+        if value is None:
+            after = Q(**{f'{name}__isnull': False}) if backwards else None
+            same = Q(**{f'{name}__isnull': True})
+        else:
+            lookup = 'lt' if descending != backwards else 'gt'
+            after = Q(**{f'{name}__{lookup}': value})
+            if null and not backwards:
+                after |= Q(**{f'{name}__isnull': True})
+            same = Q(**{name: value})
+        if after is not None:
+            clauses.append(equal & after)
+        equal &= same
+    return reduce(or_, clauses) if clauses else Q(pk__in=[])
+
+
+def paginate(request, queryset, ordering, per_page=20, param='cursor'):
+    """
+    Return a ``KeysetPage`` of ``queryset`` for the cursor in ``request.GET``.
+
+    ``ordering`` lists the sort keys like ``order_by()`` does and must end in
+    a unique field (usually ``'-id'``) so that cursors are stable. Keys may
+    name annotations of ``queryset``; those are treated as nullable.
+    """
+    keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    fields = [_key_field(queryset, name) for name, _ in keys]
+    annotated = [name in queryset.query.annotations for name, _ in keys]
+    nullable = [annotation or field.null for annotation, field in zip(annotated, fields)]
+    attributes = [name if annotation else field.attname for (name, _), annotation, field in zip(keys, annotated, fields)]
+    cursor = _decode(request.GET.get(param), fields)
+    backwards = cursor is not None and cursor[0] == 'prev'
+
+    if cursor is not None:
+        queryset = queryset.filter(_after(keys, nullable, cursor[1], backwards))
+    rows = list(queryset.order_by(*_ordering(keys, nullable, backwards))[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key_of(obj):
+        return [getattr(obj, attribute) for attribute in attributes]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = _encode('next', key_of(rows[-1]))
+        if cursor is not None and (has_more or not backwards):
+            previous_cursor = _encode('prev', key_of(rows[0]))
+
+    params = request.GET.copy()
+    params.pop(param, None)
+    return KeysetPage(rows, next_cursor, previous_cursor, params, param)
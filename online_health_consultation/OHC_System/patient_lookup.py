@@ -0,0 +1,83 @@
+"""
+Prefix lookup of patients by name, username or phone number.
+
+Each patient's lowercase first name, last name, username and phone digits
+are stored as ``PatientSearchTerm`` rows, kept current by signal handlers
+on ``User`` and ``Profile``. A lookup matches every word of the query as a
+prefix of one of the patient's terms, which an index on ``term`` answers
+without scanning the user table, so lookups cost the same however many
+patients there are.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import PatientSearchTerm, Profile
+
+WORD_RE = re.compile(r'\w+')
+DIGITS_RE = re.compile(r'\d')
+PHONE_RE = re.compile(r'[\d\s()+.-]+')
+MAX_TERM_LENGTH = 50
+# Phone numbers are also stored from each of their digits down to the last
+# MIN_PHONE_DIGITS, so they match with or without country and area codes.
+MIN_PHONE_DIGITS = 4
+LOOKUP_LIMIT = 10
+
+
+def patient_terms(user, profile):
+    """The lookup terms of a patient."""
+    terms = set()
+    for value in (user.first_name, user.last_name, user.username):
+        terms.update(word[:MAX_TERM_LENGTH] for word in WORD_RE.findall((value or '').lower()))
+    phone = ''.join(DIGITS_RE.findall(profile.phone_number or '')) if profile else ''
+    phone = phone[-MAX_TERM_LENGTH:]
+    terms.update(phone[start:] for start in range(len(phone) - MIN_PHONE_DIGITS + 1))
+    return terms
+
+
+def index_patient(user, profile=None):
+    """Bring the lookup terms of ``user`` up to date; doctors get none."""
+    if profile is None:
+        profile = Profile.objects.filter(user=user).first()
+    wanted = set() if profile is not None and profile.is_doctor else patient_terms(user, profile)
+    existing = set(PatientSearchTerm.objects.filter(user=user).values_list('term', flat=True))
+    with transaction.atomic():
+        if existing - wanted:
+            PatientSearchTerm.objects.filter(user=user, term__in=existing - wanted).delete()
+        PatientSearchTerm.objects.bulk_create(
+            [PatientSearchTerm(user=user, term=term) for term in wanted - existing],
+            ignore_conflicts=True,
+        )
+
+
+def index_patients(batch_size=1000):
+    """Rebuild the lookup terms of every patient. Returns the number of terms stored."""
+    stored = 0
+    with transaction.atomic():
+        PatientSearchTerm.objects.all().delete()
+        users = User.objects.filter(profile__is_doctor=False).select_related('profile').order_by('pk')
+        batch = []
+        for user in users.iterator(chunk_size=batch_size):
+            batch.extend(PatientSearchTerm(user=user, term=term) for term in patient_terms(user, user.profile))
+            if len(batch) >= batch_size:
+                PatientSearchTerm.objects.bulk_create(batch)
+                stored += len(batch)
+                batch = []
+        PatientSearchTerm.objects.bulk_create(batch)
+    return stored + len(batch)
+
+
+def lookup(query, limit=LOOKUP_LIMIT):
+    """Up to ``limit`` patients with a term starting with each word of ``query``."""
+    if PHONE_RE.fullmatch(query) and DIGITS_RE.search(query):
+        words = [''.join(DIGITS_RE.findall(query))]
+    else:
+        words = WORD_RE.findall(query.lower())
+    if not words:
+        return []
+    patients = User.objects.all()
+    for word in words:
+        # One join per word, so every word has to match some term of the patient.
+        patients = patients.filter(patient_search_terms__term__startswith=word[:MAX_TERM_LENGTH])
+    return list(patients.distinct().order_by('first_name', 'last_name', 'pk')[:limit])
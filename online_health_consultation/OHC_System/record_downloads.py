@@ -0,0 +1,159 @@
+"""
+Authorized downloads of medical record files.
+
+Record files aren't served from ``MEDIA_URL`` outside development, so every
+download goes through ``serve()`` after ``can_download()`` has approved it.
+With ``RECORD_DOWNLOAD_SERVER`` set, the view only answers with headers and
+the front server sends the bytes: ``'nginx'`` emits ``X-Accel-Redirect`` to
+``RECORD_DOWNLOAD_INTERNAL_URL`` (an ``internal`` location aliasing
+``MEDIA_ROOT``) and ``'sendfile'`` emits ``X-Sendfile`` with the file's path,
+for Apache's mod_xsendfile or lighttpd. Both handle ranges themselves.
+
+Without one, the file is streamed by a ``FileResponse`` that honours a
+single ``Range`` (and ``If-Range``), so viewers can seek in large scans
+without fetching them again from the start. ETags and ``Last-Modified`` let
+browsers revalidate a cached file with a 304.
+"""
+import hashlib
+import mimetypes
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.utils.text import slugify
+
+from .models import Appointment
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def treats(user, patient_id):
+    """Whether ``user`` is a doctor with an appointment, not cancelled, with the patient."""
+    return (
+        hasattr(user, 'doctor')
+        and Appointment.objects.filter(doctor=user.doctor, user_id=patient_id).exclude(status='Cancelled').exists()
+    )
+
+
+def can_download(user, record):
+    """Whether ``user`` may read ``record``: its patient or one of the patient's doctors."""
+    return record.user_id == user.pk or treats(user, record.user_id)
+
+
+def filename(record):
+    """The name to offer for the file: the record's title with the stored extension."""
+    extension = posixpath.splitext(record.file.name)[1].lower()
+    return f"{slugify(record.title) or 'record'}{extension}"
+
+
+def parse_range(header, size):
+    """
+    The ``(start, end)`` byte span, end exclusive, of a single-range ``Range``
+    header. Returns None to send the whole file (no, multiple or malformed
+    ranges) and ``()`` when the range can't be satisfied.
+    """
+    match = RANGE_RE.fullmatch(header.strip()) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix: the last ``last`` bytes.
+        length = int(last)
+        return (max(size - length, 0), size) if length else ()
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return ()
+    return start, end
+
+
+class _RangeReader:
+    """Read ``length`` bytes of ``file`` from ``start``."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _offload(record, response):
+    server = getattr(settings, 'RECORD_DOWNLOAD_SERVER', '')
+    if server == 'nginx':
+        prefix = getattr(settings, 'RECORD_DOWNLOAD_INTERNAL_URL', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + record.file.name
+    elif server == 'sendfile':
+        response['X-Sendfile'] = record.file.path
+    else:
+        return False
+    response['Content-Type'] = mimetypes.guess_type(filename(record))[0] or 'application/octet-stream'
+    return True
+
+
+def serve(request, record, as_attachment=False):
+    """
+    The response sending ``record``'s file, or a 304/206/416 as the request
+    calls for. Raises ``Http404`` if the file is missing from the storage.
+    """
+    storage, name = record.file.storage, record.file.name
+    if not name:
+        raise Http404('The record has no file')
+    try:
+        size = storage.size(name)
+        modified = storage.get_modified_time(name)
+    except OSError:
+        raise Http404('The record file is missing')
+    etag = quote_etag(hashlib.md5(f'{name}:{size}:{modified.timestamp()}'.encode()).hexdigest())
+    last_modified = modified.timestamp()
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    response = HttpResponse()
+    if _offload(record, response):
+        disposition = 'attachment' if as_attachment else 'inline'
+        response['Content-Disposition'] = f'{disposition}; filename="{filename(record)}"'
+    else:
+        span = None
+        if_range = request.headers.get('If-Range')
+        # A stale If-Range asks for the whole, current file instead.
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == int(last_modified):
+            span = parse_range(request.headers.get('Range'), size)
+        if span == ():
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        try:
+            file = storage.open(name, 'rb')
+        except OSError:
+            raise Http404('The record file is missing')
+        if span is None:
+            response = FileResponse(file, as_attachment=as_attachment, filename=filename(record))
+        else:
+            start, end = span
+            response = FileResponse(
+                _RangeReader(file, start, end - start), status=206,
+                as_attachment=as_attachment, filename=filename(record),
+            )
+            response['Content-Length'] = end - start
+            response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
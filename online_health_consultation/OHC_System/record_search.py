@@ -0,0 +1,210 @@
+"""
+Search over the contents of a patient's medical records.
+
+A record is indexed from its title, type and notes, and from the text of its
+file: plain text files are decoded, PDFs go through ``pypdf``, and other
+files (scans, images) contribute nothing. Extraction runs in a background
+thread pool after the save commits, and its result is kept in
+``RecordText`` together with the stored file name it came from. Since files
+are stored by content hash, the name only changes with the file, so saves
+that touch only the details reuse the kept text instead of extracting it
+again. A corrupt or encrypted PDF is kept as an empty text for the same
+reason; a file that can't be opened is tried again on the next save.
+
+The index (``RecordSearchTerm``) is an inverted index like the article one
+in ``search``, with each row carrying the patient, so a search only reads
+that patient's postings for the query terms. Rows are updated in place as a
+record changes: its details are indexed straight away, and the file's text
+is added once it has been extracted.
+"""
+import logging
+import math
+import posixpath
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+
+from .models import MedicalRecord, RecordSearchTerm, RecordText
+from .search import highlight, tokenize
+
+try:
+    from pypdf import PdfReader
+    from pypdf.errors import PyPdfError
+except ImportError:
+    PdfReader = None
+
+    class PyPdfError(Exception):
+        """Never raised; stands in for pypdf's base error when it isn't installed."""
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = (('title', 3.0), ('record_type', 2.0), ('notes', 2.0))
+FILE_WEIGHT = 1.0
+INDEXED_FIELDS = frozenset(field for field, _ in FIELD_WEIGHTS) | {'file', 'user'}
+TEXT_EXTENSIONS = frozenset({'.txt', '.csv', '.md', '.json', '.xml', '.html', '.htm'})
+MAX_TEXT_LENGTH = 200_000
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RECORD_TEXT_WORKERS', 2),
+    thread_name_prefix='record-text',
+)
+
+
+def extract_text(storage, name):
+    """The text of the stored file ``name``, at most ``MAX_TEXT_LENGTH`` characters."""
+    extension = posixpath.splitext(name)[1].lower()
+    with storage.open(name, 'rb') as source:
+        if extension in TEXT_EXTENSIONS:
+            return source.read(MAX_TEXT_LENGTH).decode('utf-8', errors='replace')
+        if extension == '.pdf' and PdfReader is not None:
+            parts, length = [], 0
+            for page in PdfReader(source).pages:
+                text = page.extract_text() or ''
+                parts.append(text)
+                length += len(text)
+                if length >= MAX_TEXT_LENGTH:
+                    break
+            return '\n'.join(parts)[:MAX_TEXT_LENGTH]
+    return ''
+
+
+def record_terms(record, text=''):
+    """Return ``{term: weight}`` for a record and the text of its file."""
+    counts = Counter()
+    for field, field_weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(record, field)):
+            counts[term] += field_weight
+    for term in tokenize(text):
+        counts[term] += FILE_WEIGHT
+    return {term: 1 + math.log(count) for term, count in counts.items()}
+
+
+def index_record(record, text=''):
+    """Bring one record's index rows in line with its details and file ``text``."""
+    terms = record_terms(record, text)
+    with transaction.atomic():
+        existing = {row.term: row for row in RecordSearchTerm.objects.filter(record=record)}
+        stale = [row.pk for term, row in existing.items() if term not in terms]
+        changed = []
+        for term, weight in terms.items():
+            row = existing.get(term)
+            if row is not None and (row.weight != weight or row.user_id != record.user_id):
+                row.weight = weight
+                row.user_id = record.user_id
+                changed.append(row)
+        RecordSearchTerm.objects.filter(pk__in=stale).delete()
+        RecordSearchTerm.objects.bulk_update(changed, ['weight', 'user'], batch_size=500)
+        RecordSearchTerm.objects.bulk_create([
+            RecordSearchTerm(user_id=record.user_id, record=record, term=term, weight=weight)
+            for term, weight in terms.items() if term not in existing
+        ], batch_size=500)
+
+
+def _current_text(record):
+    """The kept text of ``record``'s file, or None if it hasn't been extracted from this file."""
+    if not record.file.name:
+        return ''
+    text = RecordText.objects.filter(record=record).values_list('source', 'content').first()
+    if text is not None and text[0] == record.file.name:
+        return text[1]
+    return None
+
+
+def extract_and_index(record):
+    """Extract the text of ``record``'s file unless it was already, and index the record."""
+    text = _current_text(record)
+    if text is None:
+        name = record.file.name
+        try:
+            text = extract_text(record.file.storage, name)
+        except OSError:
+            logger.warning('The file %s of medical record %s could not be read', name, record.pk)
+            index_record(record)
+            return False
+        except PyPdfError:
+            # Reading it again won't help, so keep an empty text for this file.
+            logger.warning('The file %s of medical record %s is not a readable PDF', name, record.pk)
+            text = ''
+        with transaction.atomic():
+            # Drop the result if the file was replaced while it was read; that save queued its own run.
+            if not MedicalRecord.objects.select_for_update().filter(pk=record.pk, file=name).exists():
+                return False
+            RecordText.objects.update_or_create(record=record, defaults={'source': name, 'content': text})
+            index_record(record, text)
+        return True
+    index_record(record, text)
+    return False
+
+
+def _run(record_id):
+    close_old_connections()
+    try:
+        record = MedicalRecord.objects.filter(pk=record_id).first()
+        if record is not None:
+            extract_and_index(record)
+    except Exception:
+        logger.exception('Failed to extract the text of medical record %s', record_id)
+
+
+def record_saved(record):
+    """
+    Index a saved record's details now and, if its file is new, queue the
+    extraction of the file's text for after the current transaction.
+    """
+    text = _current_text(record)
+    index_record(record, text or '')
+    if text is None:
+        record_id = record.pk
+        transaction.on_commit(lambda: _executor.submit(_run, record_id))
+
+
+def search(user, query, limit=20):
+    """
+    Return ``user``'s medical records matching ``query``, best first.
+
+    Records that contain more of the query terms rank first; ties are broken
+    by TF-IDF score over the user's records. Each record gets a
+    ``search_snippet`` from its notes or file text.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+
+    postings = RecordSearchTerm.objects.filter(user=user, term__in=terms)
+    doc_freqs = dict(postings.values_list('term').annotate(df=Count('id')).order_by())
+    if not doc_freqs:
+        return []
+    total = max(MedicalRecord.objects.filter(user=user).count(), 1)
+    idf = {
+        term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for term, df in doc_freqs.items()
+    }
+    score = Sum(
+        Case(
+            *[When(term=term, then=F('weight') * Value(weight)) for term, weight in idf.items()],
+            output_field=FloatField(),
+        )
+    )
+    ranked = list(
+        postings
+        .values('record')
+        .annotate(matched=Count('id'), score=score)
+        .order_by('-matched', '-score', 'record')[:limit]
+    )
+
+    records = MedicalRecord.objects.select_related('text').in_bulk([row['record'] for row in ranked])
+    results = []
+    for row in ranked:
+        record = records.get(row['record'])
+        if record is None:
+            continue
+        content = getattr(record, 'text', None)
+        source = record.notes
+        if content is not None and not set(tokenize(source)) & set(terms):
+            source = content.content
+        record.search_snippet = highlight(source, terms)
+        results.append(record)
+    return results
@@ -0,0 +1,209 @@
+"""
+Content-addressed storage for medical record files.
+
+``ContentAddressedStorage`` hashes a file while streaming it to a temporary
+file and stores it as ``<upload_to>/ab/cd/<sha256><ext>``. A file that is
+already stored is not written again, so every copy of the same upload
+shares one blob, and the name saved on the record is the blob's; views keep
+using ``record.file`` as before. Names from before this storage still open
+as they are.
+
+Shared blobs can't be removed when one record lets go of them, so the
+storage's ``delete()`` does nothing. ``RecordBlob`` rows count the records
+using each blob, kept current by signal handlers, and ``gc_record_blobs``
+removes blobs nobody has used for ``GC_GRACE``. Saving a file creates or
+touches its row before the file is looked up, and the collector deletes a
+blob only while holding its row, so a blob being saved again is never
+removed under the save.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+GC_GRACE = timedelta(hours=1)
+BLOB_RE = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage keeping one file per distinct content, named by its SHA-256."""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is replaced by the content's hash in _save(), and an existing
+        # blob of the same content is exactly what should be reused.
+        return name
+
+    def _save(self, name, content):
+        directory, extension = posixpath.dirname(name), posixpath.splitext(name)[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temporary = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+            sha256 = digest.hexdigest()
+            blob = posixpath.join(directory, sha256[:2], sha256[2:4], sha256 + extension)
+            path = self.path(blob)
+            # Before looking for the file: collect_garbage() holds the row while it
+            # removes a blob, so this waits for it and then writes the file anew.
+            _claim(blob, os.path.getsize(temporary))
+            if os.path.exists(path):
+                os.unlink(temporary)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        return blob
+
+    def delete(self, name):
+        """Leave the blob for ``gc_record_blobs``; other records may share it."""
+
+    def purge(self, name):
+        """Remove a blob for good."""
+        super().delete(name)
+
+
+_storage = ContentAddressedStorage()
+
+
+def record_storage():
+    """The storage of ``MedicalRecord.file``."""
+    return _storage
+
+
+def _claim(name, size):
+    """Mark the blob ``name`` as just saved, so collect_garbage() leaves it until a record uses it."""
+    from .models import RecordBlob
+
+    blobs = RecordBlob.objects.filter(name=name)
+    if blobs.update(updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            RecordBlob.objects.create(name=name, size=size)
+    except IntegrityError:
+        # Created concurrently.
+        blobs.update(updated_at=timezone.now())
+
+
+def referenced(name):
+    """Count one more record using the blob ``name``."""
+    from .models import RecordBlob
+
+    if not name:
+        return
+    blobs = RecordBlob.objects.filter(name=name)
+    if blobs.update(references=F('references') + 1, updated_at=timezone.now()):
+        return
+    try:
+        size = _storage.size(name)
+    except OSError:
+        size = 0
+    try:
+        with transaction.atomic():
+            RecordBlob.objects.create(name=name, size=size, references=1)
+    except IntegrityError:
+        # Created concurrently.
+        blobs.update(references=F('references') + 1, updated_at=timezone.now())
+
+
+def released(name):
+    """Count one record fewer using the blob ``name``."""
+    from .models import RecordBlob
+
+    if name:
+        RecordBlob.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1, updated_at=timezone.now()
+        )
+
+
+def _stored_blobs(directory):
+    """Yield the names of the content-addressed blobs under ``directory``."""
+    def walk(path, depth):
+        directories, files = _storage.listdir(path)
+        if depth == 2:
+            for filename in files:
+                yield posixpath.join(path, filename)
+        for subdirectory in directories:
+            if re.fullmatch(r'[0-9a-f]{2}', subdirectory):
+                yield from walk(posixpath.join(path, subdirectory), depth + 1)
+
+    if _storage.exists(directory):
+        for name in walk(directory, 0):
+            if BLOB_RE.fullmatch(name[len(directory) + 1:]):
+                yield name
+
+
+def _written_since(name, cutoff):
+    return _storage.exists(name) and _storage.get_modified_time(name) >= cutoff
+
+
+def collect_garbage(directory, dry_run=False, now=None):
+    """
+    Remove the blobs under ``directory`` that no record has used for
+    ``GC_GRACE``. Returns ``(blobs removed, bytes freed)``.
+    """
+    from .models import RecordBlob
+
+    cutoff = (now or timezone.now()) - GC_GRACE
+    removed = freed = 0
+    unused = RecordBlob.objects.filter(name__startswith=directory + '/', references=0, updated_at__lt=cutoff)
+    for blob in unused.iterator():
+        if dry_run:
+            if not _written_since(blob.name, cutoff):
+                removed += 1
+                freed += blob.size
+            continue
+        with transaction.atomic():
+            # Checked again under the row lock, since a record or a save may
+            # have picked the blob up since the query.
+            locked = RecordBlob.objects.select_for_update().filter(
+                pk=blob.pk, references=0, updated_at__lt=cutoff
+            ).first()
+            if locked is None or _written_since(blob.name, cutoff):
+                continue
+            locked.delete()
+            _storage.purge(blob.name)
+        removed += 1
+        freed += blob.size
+
+    # Blobs without a row are left from before the rows were kept.
+    known = set(RecordBlob.objects.filter(name__startswith=directory + '/').values_list('name', flat=True))
+    for name in _stored_blobs(directory):
+        if name in known or _written_since(name, cutoff):
+            continue
+        size = _storage.size(name)
+        if not dry_run:
+            purged = False
+            try:
+                with transaction.atomic():
+                    # Holds the name against a concurrent save until the file is gone.
+                    placeholder = RecordBlob.objects.create(name=name, size=size)
+                    if not _written_since(name, cutoff):
+                        _storage.purge(name)
+                        purged = True
+                    placeholder.delete()
+            except IntegrityError:
+                pass  # Saved concurrently.
+            if not purged:
+                continue
+        removed += 1
+        freed += size
+    return removed, freed
@@ -0,0 +1,201 @@
+"""
+Chunked, resumable uploads of medical record files.
+
+A client starts an upload with the file's name and size, then appends it
+in chunks of at most ``RECORD_UPLOAD_CHUNK_SIZE`` bytes, each sent with the
+offset it starts at. Every chunk is streamed from the request straight into
+the record storage as its own file, hashing it on the way, so a request
+holds one read buffer whatever the chunk or file size. ``received`` is the
+acknowledged offset: after a dropped connection the client asks for it and
+carries on from there, and a chunk sent for the wrong offset is refused.
+
+Completing the upload streams the chunks, in order, into the record's file
+through the storage API while computing the SHA-256 of the whole file,
+which is checked against the digest given at the start, if any. Uploads
+left unfinished for ``RECORD_UPLOAD_EXPIRY_HOURS`` are removed by the
+``purge_record_uploads`` command.
+"""
+import hashlib
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RecordUpload
+
+READ_SIZE = 64 * 1024
+CHUNK_DIRECTORY = 'record_uploads'
+
+
+class UploadError(Exception):
+    """A request that doesn't fit the state of the upload; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_chunk_size():
+    return getattr(settings, 'RECORD_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def max_file_size():
+    return getattr(settings, 'RECORD_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+def _storage():
+    # Chunks are plain files; only the assembled file goes to the record storage.
+    return default_storage
+
+
+def _chunk_name(upload, offset):
+    # One flat directory, since storages can delete files but not directories.
+    return posixpath.join(CHUNK_DIRECTORY, f'{upload.pk}.{offset:015d}')
+
+
+class _Reader:
+    """Read at most ``limit`` bytes from ``stream``, hashing and counting them."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+        self.length = 0
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(min(size, READ_SIZE)) if size else b''
+        self.remaining -= len(data)
+        self.length += len(data)
+        self.hash.update(data)
+        return data
+
+
+class _ChunksReader:
+    """Read the stored chunks of an upload one after another, hashing them."""
+
+    def __init__(self, storage, names):
+        self.storage = storage
+        self.names = iter(names)
+        self.current = None
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        size = READ_SIZE if size is None or size < 0 else size
+        while True:
+            if self.current is None:
+                name = next(self.names, None)
+                if name is None:
+                    return b''
+                self.current = self.storage.open(name, 'rb')
+            data = self.current.read(size)
+            if data:
+                self.hash.update(data)
+                return data
+            self.current.close()
+            self.current = None
+
+
+def start(user, filename, size, sha256=''):
+    """Begin an upload of ``size`` bytes and return its ``RecordUpload``."""
+    filename = posixpath.basename(filename.replace('\\', '/')).strip()
+    if not filename:
+        raise UploadError('A file name is required')
+    if size <= 0 or size > max_file_size():
+        raise UploadError(f'The file size must be between 1 and {max_file_size()} bytes')
+    sha256 = sha256.lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be a hex SHA-256 digest')
+    return RecordUpload.objects.create(user=user, filename=filename[:255], size=size, sha256=sha256)
+
+
+def append(upload, offset, stream, length, sha256=''):
+    """
+    Store ``length`` bytes read from ``stream`` as the chunk at ``offset``.
+
+    Returns the new acknowledged offset. The upload row is locked while the
+    chunk is written, so concurrent appends to one upload take turns.
+    """
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError(f'Chunks must be between 1 and {max_chunk_size()} bytes', status=413)
+    storage = _storage()
+    with transaction.atomic():
+        upload = RecordUpload.objects.select_for_update().get(pk=upload.pk)
+        if offset != upload.received:
+            raise UploadError(f'Expected the chunk at offset {upload.received}', status=409)
+        if offset + length > upload.size:
+            raise UploadError('The chunk runs past the end of the file', status=413)
+
+        name = _chunk_name(upload, offset)
+        # Left over from an attempt that failed before it was acknowledged.
+        if storage.exists(name):
+            storage.delete(name)
+        reader = _Reader(stream, length)
+        saved = storage.save(name, File(reader, name=name))
+        digest = reader.hash.hexdigest()
+        if reader.length != length or (sha256 and sha256.lower() != digest):
+            storage.delete(saved)
+            raise UploadError('The chunk was incomplete or corrupted; send it again')
+
+        upload.chunks.append([offset, length, saved, digest])
+        upload.received = offset + length
+        upload.save(update_fields=['chunks', 'received', 'updated_at'])
+    return upload.received
+
+
+def _delete_chunks(upload):
+    storage = _storage()
+    for chunk in upload.chunks:
+        storage.delete(chunk[2])
+
+
+def complete(upload, record):
+    """
+    Assemble the chunks into the file of the unsaved ``record`` and save it.
+
+    The upload is removed afterwards; returns the file's SHA-256.
+    """
+    storage = record.file.storage
+    # Locked throughout, so completing the same upload twice can't create two records.
+    with transaction.atomic():
+        upload = RecordUpload.objects.select_for_update().filter(pk=upload.pk).first()
+        if upload is None:
+            raise UploadError('The upload was already completed or discarded', status=409)
+        if upload.received != upload.size:
+            raise UploadError(f'Only {upload.received} of {upload.size} bytes have been received', status=409)
+        reader = _ChunksReader(_storage(), [chunk[2] for chunk in upload.chunks])
+        name = record.file.field.generate_filename(record, upload.filename)
+        saved = storage.save(name, File(reader, name=name))
+        digest = reader.hash.hexdigest()
+        if upload.sha256 and upload.sha256 != digest:
+            storage.delete(saved)
+            raise UploadError('The file does not match its SHA-256 digest; upload it again', status=422)
+
+        record.user = upload.user
+        record.file.name = saved
+        record.save()
+        upload.delete()
+    _delete_chunks(upload)
+    return digest
+
+
+def abort(upload):
+    """Discard an upload and its chunks."""
+    upload.delete()
+    _delete_chunks(upload)
+
+
+def purge_expired(now=None):
+    """Discard uploads left unfinished for too long. Returns how many were removed."""
+    hours = getattr(settings, 'RECORD_UPLOAD_EXPIRY_HOURS', 24)
+    cutoff = (now or timezone.now()) - timedelta(hours=hours)
+    removed = 0
+    for upload in RecordUpload.objects.filter(updated_at__lt=cutoff).iterator():
+        abort(upload)
+        removed += 1
+    return removed
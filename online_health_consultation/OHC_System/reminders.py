@@ -0,0 +1,162 @@
+"""
+Reminder emails before appointments.
+
+Every active upcoming appointment has an ``AppointmentReminder`` row per
+entry of ``OFFSETS``, due that long before it starts. ``schedule`` brings an
+appointment's rows in line with its current time and status whenever it is
+saved, so rescheduling moves them and cancelling drops the unsent ones.
+Reminders that are already overdue when an appointment is booked are left
+out, except the last one, which goes out straight away.
+
+``send_due`` only reads unsent reminders whose ``due_at`` has passed, through
+an index holding nothing else, so a run costs the same however many
+appointments there are. Each batch is queued in the email outbox and marked
+sent in the same transaction, so a reminder is sent once even if the worker
+restarts half way. Appointments changed by bulk updates don't send signals,
+so every reminder is checked against its appointment before it is sent.
+
+The ``send_reminders`` command runs one pass, e.g. from cron. Dashboard
+requests also start a daemon thread that runs one every
+``APPOINTMENT_REMINDER_INTERVAL`` seconds; set it to 0 to leave it to the
+command.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import outbox
+from .models import AppointmentReminder
+from .slots import ACTIVE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# How long before the appointment each reminder is due, longest first.
+OFFSETS = {
+    '24h': timedelta(hours=24),
+    '1h': timedelta(hours=1),
+}
+BATCH_SIZE = 100
+
+_lock = threading.Lock()
+_scheduler = None
+
+
+def _interval():
+    return getattr(settings, 'APPOINTMENT_REMINDER_INTERVAL', 60)
+
+
+def _is_current(reminder, appointment, now):
+    return (
+        appointment.status in ACTIVE_STATUSES
+        and appointment.datetime is not None
+        and appointment.datetime > now
+        and reminder.due_at == appointment.datetime - OFFSETS[reminder.kind]
+    )
+
+
+def wanted_reminders(appointment, now=None):
+    """``{kind: due_at}`` of the reminders ``appointment`` should have."""
+    now = now or timezone.now()
+    if appointment.status not in ACTIVE_STATUSES or appointment.datetime is None or appointment.datetime <= now:
+        return {}
+    due = {kind: appointment.datetime - offset for kind, offset in OFFSETS.items()}
+    last = list(OFFSETS)[-1]
+    return {kind: due_at for kind, due_at in due.items() if due_at > now or kind == last}
+
+
+def schedule(appointment, now=None):
+    """Create, move or drop the reminders of ``appointment`` to match its time and status."""
+    wanted = wanted_reminders(appointment, now)
+    existing = {reminder.kind: reminder for reminder in appointment.reminders.all()}
+    # Sent reminders are kept while still right, so they aren't sent twice.
+    stale = [
+        reminder.pk for kind, reminder in existing.items()
+        if (kind not in wanted and reminder.sent_at is None) or (kind in wanted and reminder.due_at != wanted[kind])
+    ]
+    missing = [
+        AppointmentReminder(appointment=appointment, kind=kind, due_at=due_at)
+        for kind, due_at in wanted.items()
+        if kind not in existing or existing[kind].pk in stale
+    ]
+    if not stale and not missing:
+        return
+    with transaction.atomic():
+        AppointmentReminder.objects.filter(pk__in=stale).delete()
+        AppointmentReminder.objects.bulk_create(missing, ignore_conflicts=True)
+
+
+def _queue_email(reminder):
+    appointment = reminder.appointment
+    context = {'appointment': appointment, 'patient': appointment.user, 'doctor': appointment.doctor}
+    outbox.enqueue(
+        subject=f'Reminder: your appointment on {timezone.localtime(appointment.datetime):%d %b %Y at %H:%M}',
+        recipients=[appointment.user.email],
+        body=render_to_string('online_health_consultation/email/appointment_reminder.txt', context),
+        html_body=render_to_string('online_health_consultation/email/appointment_reminder.html', context),
+    )
+
+
+def send_batch(batch_size=BATCH_SIZE, now=None):
+    """Queue the emails of one batch of due reminders. Returns ``(sent, skipped)``."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        reminders = list(
+            AppointmentReminder.objects.filter(sent_at__isnull=True, due_at__lte=now)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('appointment__user', 'appointment__doctor__user')
+            .order_by('due_at')[:batch_size]
+        )
+        sent, skipped = [], []
+        for reminder in reminders:
+            if _is_current(reminder, reminder.appointment, now) and reminder.appointment.user.email:
+                _queue_email(reminder)
+                sent.append(reminder.pk)
+            else:
+                skipped.append(reminder.pk)
+        AppointmentReminder.objects.filter(pk__in=sent).update(sent_at=now)
+        AppointmentReminder.objects.filter(pk__in=skipped).delete()
+    return len(sent), len(skipped)
+
+
+def send_due(batch_size=BATCH_SIZE, now=None, progress=None):
+    """
+    Queue every due reminder and return ``(sent, skipped)``.
+
+    ``progress`` is called after each batch with the running totals.
+    """
+    sent = skipped = 0
+    while True:
+        batch_sent, batch_skipped = send_batch(batch_size, now)
+        if not batch_sent and not batch_skipped:
+            return sent, skipped
+        sent += batch_sent
+        skipped += batch_skipped
+        if progress is not None:
+            progress(sent, skipped)
+
+
+def _scheduler_loop():
+    while True:
+        close_old_connections()
+        try:
+            send_due()
+        except Exception:
+            logger.exception('Failed to send appointment reminders')
+        time.sleep(_interval())
+
+
+def start_scheduler():
+    """Start the background reminder thread of this process unless it runs already or is disabled."""
+    global _scheduler
+    if _interval() <= 0:
+        return
+    with _lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=_scheduler_loop, name='appointment-reminders', daemon=True)
+            _scheduler.start()
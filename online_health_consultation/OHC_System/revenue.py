@@ -0,0 +1,73 @@
+"""
+Revenue and utilisation per doctor and day or week.
+
+Rows come from the appointment rollups: revenue is the doctor's
+consultation fee times their completed sessions, booked hours count every
+appointment that wasn't cancelled (no-shows still held the slot) at one
+slot each, and capacity is the slots their working hours hold on the days
+of the period. Fees and working hours are the doctor's current ones; the
+models keep no history of either.
+
+``rows`` reads the rollups through one grouped query with ``iterator()``
+and yields one row at a time, so a report streamed from it uses the same
+memory for a week as for ten years.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+
+from .models import AppointmentRollup
+from .rollups import period_start
+from .slots import SLOT_MINUTES, daily_slots
+
+COLUMNS = [
+    'period_start', 'doctor', 'doctor_name', 'specialization', 'consultation_fee',
+    'completed_sessions', 'revenue', 'booked_hours', 'capacity_hours', 'utilisation',
+]
+PERIOD_DAYS = {'day': 1, 'week': 7}
+CHUNK_SIZE = 2000
+
+
+def _hours(slots):
+    return Decimal(slots * SLOT_MINUTES) / 60
+
+
+def rows(period, start, end):
+    """
+    Yield a ``COLUMNS`` dict per doctor with appointments in each ``period``
+    from ``start`` to ``end`` (dates, inclusive). Weekly reports cover the
+    whole weeks that ``start`` and ``end`` fall in.
+    """
+    totals = (
+        AppointmentRollup.objects.filter(
+            period=period, period_start__gte=period_start(period, start), period_start__lte=end,
+        )
+        .values(
+            'period_start', 'doctor', 'doctor__user__username', 'doctor__specialization',
+            'doctor__consultation_fee', 'doctor__available_from', 'doctor__available_to',
+        )
+        .annotate(
+            completed=Sum('count', filter=Q(status='Completed')),
+            booked=Sum('count', filter=~Q(status='Cancelled')),
+        )
+        .order_by('period_start', 'doctor')
+    )
+    for row in totals.iterator(chunk_size=CHUNK_SIZE):
+        completed = row['completed'] or 0
+        booked_hours = _hours(row['booked'] or 0)
+        capacity_hours = _hours(
+            daily_slots(row['doctor__available_from'], row['doctor__available_to']) * PERIOD_DAYS[period]
+        )
+        yield {
+            'period_start': row['period_start'],
+            'doctor': row['doctor'],
+            'doctor_name': row['doctor__user__username'],
+            'specialization': row['doctor__specialization'],
+            'consultation_fee': row['doctor__consultation_fee'],
+            'completed_sessions': completed,
+            'revenue': row['doctor__consultation_fee'] * completed,
+            'booked_hours': booked_hours.quantize(Decimal('0.01')),
+            'capacity_hours': capacity_hours.quantize(Decimal('0.01')),
+            'utilisation': (booked_hours / capacity_hours).quantize(Decimal('0.001')) if capacity_hours else '',
+        }
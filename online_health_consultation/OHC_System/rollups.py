@@ -0,0 +1,186 @@
+"""
+Appointment counts per day and week, doctor, type and status.
+
+``AppointmentRollup`` rows hold the number of appointments for each
+combination, with the day or week taken from the appointment's date in
+``TIME_ZONE`` (weeks start on Monday). Reports group and sum these rows
+instead of scanning the appointments table.
+
+Signal handlers pass every appointment change to ``appointment_changed``,
+which moves the appointment from its old rows to its new ones with ``F()``
+updates; the no-show sweeper applies its bulk changes through ``apply``.
+``rebuild`` recomputes a date range from the appointments table, a few weeks
+per query and transaction, for the backfill and to repair drift.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentRollup
+
+PERIODS = ('day', 'week')
+REBUILD_WEEKS = 4
+
+# Report columns for each grouping, as ``values()`` arguments.
+GROUPS = {
+    'doctor': {'doctor': None, 'doctor_name': F('doctor__user__username')},
+    'specialization': {'specialization': F('doctor__specialization')},
+    'type': {'appointment_type': None},
+    'status': {'status': None},
+}
+
+
+def period_start(period, day):
+    """The first day of the ``period`` containing ``day``."""
+    return day - timedelta(days=day.weekday()) if period == 'week' else day
+
+
+def _keys(state):
+    if state is None or state['datetime'] is None:
+        return []
+    day = timezone.localtime(state['datetime'], timezone.get_default_timezone()).date()
+    return [
+        (period, period_start(period, day), state['doctor_id'], state['appointment_type'], state['status'])
+        for period in PERIODS
+    ]
+
+
+def _row(key):
+    period, start, doctor_id, appointment_type, status = key
+    return AppointmentRollup.objects.filter(
+        period=period, period_start=start, doctor_id=doctor_id, appointment_type=appointment_type, status=status,
+    )
+
+
+def _increment(key, delta):
+    rows = _row(key)
+    if rows.update(count=F('count') + delta):
+        return
+    period, start, doctor_id, appointment_type, status = key
+    try:
+        with transaction.atomic():
+            AppointmentRollup.objects.create(
+                period=period, period_start=start, doctor_id=doctor_id,
+                appointment_type=appointment_type, status=status, count=delta,
+            )
+    except IntegrityError:
+        # Created concurrently.
+        rows.update(count=F('count') + delta)
+
+
+def _decrement(key, delta):
+    rows = _row(key)
+    # Clamped so rows that drifted low can't fail the change; rebuild() repairs them.
+    rows.update(count=Greatest(F('count') - delta, 0))
+    rows.filter(count=0).delete()
+
+
+def changes(previous, current):
+    """The rollup deltas of an appointment going from ``previous`` to ``current``."""
+    deltas = Counter()
+    for key in _keys(previous):
+        deltas[key] -= 1
+    for key in _keys(current):
+        deltas[key] += 1
+    return deltas
+
+
+def apply(deltas):
+    """Add ``{key: delta}`` from ``changes()`` to the rollups."""
+    with transaction.atomic():
+        # In key order, so concurrent changes lock rows in the same order.
+        for key, delta in sorted(deltas.items()):
+            if delta > 0:
+                _increment(key, delta)
+            elif delta < 0:
+                _decrement(key, -delta)
+
+
+def appointment_changed(previous, current):
+    """
+    Apply an appointment changing from ``previous`` to ``current``.
+
+    Both are ``doctor_stats.snapshot()`` dicts; ``previous`` is None for a new
+    appointment and ``current`` is None for a deleted one.
+    """
+    apply(changes(previous, current))
+
+
+def _rebuild_weeks(first_monday, weeks):
+    tz = timezone.get_default_timezone()
+    last_day = first_monday + timedelta(weeks=weeks)
+    counts = (
+        Appointment.objects.filter(
+            datetime__gte=timezone.make_aware(datetime.combine(first_monday, time.min), tz),
+            datetime__lt=timezone.make_aware(datetime.combine(last_day, time.min), tz),
+        )
+        .annotate(day=TruncDate('datetime', tzinfo=tz))
+        .values('day', 'doctor_id', 'appointment_type', 'status')
+        .annotate(appointments=Count('pk'))
+        .order_by()
+    )
+    totals = Counter()
+    for row in counts:
+        for period in PERIODS:
+            key = (period, period_start(period, row['day']), row['doctor_id'], row['appointment_type'], row['status'])
+            totals[key] += row['appointments']
+
+    with transaction.atomic():
+        AppointmentRollup.objects.filter(period_start__gte=first_monday, period_start__lt=last_day).delete()
+        AppointmentRollup.objects.bulk_create([
+            AppointmentRollup(
+                period=period, period_start=start, doctor_id=doctor_id,
+                appointment_type=appointment_type, status=status, count=count,
+            )
+            for (period, start, doctor_id, appointment_type, status), count in totals.items()
+        ], batch_size=1000)
+    return sum(count for key, count in totals.items() if key[0] == 'day')
+
+
+def rebuild(start=None, end=None, progress=None):
+    """
+    Recompute the rollups of the weeks from ``start`` to ``end`` (dates,
+    default: every appointment) and return the number of appointments counted.
+
+    ``progress`` is called after each chunk of weeks with the running total
+    and the last day covered.
+    """
+    if start is None or end is None:
+        bounds = Appointment.objects.aggregate(first=Min('datetime'), last=Max('datetime'))
+        if bounds['first'] is None:
+            return 0
+        tz = timezone.get_default_timezone()
+        start = start or timezone.localtime(bounds['first'], tz).date()
+        end = end or timezone.localtime(bounds['last'], tz).date()
+
+    monday = period_start('week', start)
+    counted = 0
+    while monday <= end:
+        counted += _rebuild_weeks(monday, REBUILD_WEEKS)
+        monday += timedelta(weeks=REBUILD_WEEKS)
+        if progress is not None:
+            progress(counted, monday - timedelta(days=1))
+    return counted
+
+
+def columns(group_by=()):
+    """The columns of a ``report()`` split by ``group_by``, in order."""
+    return ['period_start', *[name for group in group_by for name in GROUPS[group]], 'appointments']
+
+
+def report(period, start, end, group_by=()):
+    """Appointments per ``period`` from ``start`` to ``end`` (dates, inclusive), split by ``group_by``."""
+    columns = {}
+    for group in group_by:
+        columns.update(GROUPS[group])
+    return (
+        AppointmentRollup.objects.filter(period=period, period_start__gte=start, period_start__lte=end)
+        .values('period_start', *[name for name, expression in columns.items() if expression is None],
+                **{name: expression for name, expression in columns.items() if expression is not None})
+        .annotate(appointments=Sum('count'))
+        .order_by('period_start', *columns)
+    )
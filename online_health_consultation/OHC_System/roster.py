@@ -0,0 +1,80 @@
+"""
+A doctor's patient list with per-patient numbers.
+
+``patient_roster`` returns one row per patient who has had an appointment
+with the doctor, annotated with correlated subqueries for their visits,
+last and next visit and active prescriptions, and with the profile joined
+in. The page therefore costs one query whatever its size, and every
+annotation can be sorted on and paged through with ``pagination.paginate``.
+"""
+from django.contrib.auth.models import User
+from django.db.models import (
+    Count, DateTimeField, Exists, IntegerField, Max, Min, OuterRef, Q, Subquery, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Appointment, Prescription
+from .slots import ACTIVE_STATUSES
+
+# Sort choices offered to the user, as ``paginate()`` orderings.
+SORTS = {
+    'recent': ('-last_visit', '-id'),
+    'upcoming': ('next_visit', 'id'),
+    'visits': ('-visits', '-id'),
+    'name': ('first_name', 'last_name', 'id'),
+}
+DEFAULT_SORT = 'recent'
+
+
+def _aggregate(queryset, expression, output_field):
+    """``expression`` over ``queryset``'s rows for the outer patient, as a subquery."""
+    return Subquery(
+        queryset.filter(user=OuterRef('pk'))
+        .order_by()
+        .values('user')
+        .annotate(value=expression)
+        .values('value'),
+        output_field=output_field,
+    )
+
+
+def patient_roster(doctor, query='', upcoming_only=False, with_prescriptions=False):
+    """Patients of ``doctor`` with their visit and prescription numbers."""
+    now = timezone.now()
+    appointments = Appointment.objects.filter(doctor=doctor)
+    patients = (
+        User.objects.filter(Exists(appointments.filter(user=OuterRef('pk'))))
+        .select_related('profile')
+        .annotate(
+            visits=Coalesce(
+                _aggregate(appointments, Count('pk', filter=Q(status='Completed')), IntegerField()),
+                Value(0),
+            ),
+            last_visit=_aggregate(
+                appointments.filter(datetime__lt=now).exclude(status='Cancelled'),
+                Max('datetime'),
+                DateTimeField(),
+            ),
+            next_visit=_aggregate(
+                appointments.filter(datetime__gte=now, status__in=ACTIVE_STATUSES),
+                Min('datetime'),
+                DateTimeField(),
+            ),
+            active_prescriptions=Coalesce(
+                _aggregate(Prescription.objects.filter(doctor=doctor, is_active=True), Count('pk'), IntegerField()),
+                Value(0),
+            ),
+        )
+    )
+    if query:
+        patients = patients.filter(
+            Q(first_name__icontains=query) | Q(last_name__icontains=query)
+            | Q(username__icontains=query) | Q(email__icontains=query)
+            | Q(profile__phone_number__icontains=query)
+        )
+    if upcoming_only:
+        patients = patients.filter(next_visit__isnull=False)
+    if with_prescriptions:
+        patients = patients.filter(active_prescriptions__gt=0)
+    return patients
@@ -0,0 +1,179 @@
+"""
+Full-text search over health articles.
+
+Articles are tokenized into an inverted index (``ArticleSearchTerm``) that is
+kept up to date from ``post_save``, so a search only touches the index rows
+for the query terms instead of scanning every article body. Results are
+ranked in the database by a field-weighted TF-IDF score.
+
+An article matches when it contains any of the query terms; those with more
+of them rank first. The admin filters by ``matching_article_ids``, which
+selects the same articles as ``search``, so a query finds the same set in
+both places.
+"""
+import math
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from .models import ArticleSearchTerm, HealthArticle
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+MAX_TERM_LENGTH = 50
+FIELD_WEIGHTS = (('title', 3.0), ('summary', 2.0), ('content', 1.0))
+INDEXED_FIELDS = frozenset(field for field, _ in FIELD_WEIGHTS)
+STOP_WORDS = frozenset('''
+    a an and are as at be but by for from has have he her his how i if in into is it its
+    of on or our she so than that the their them then there these they this to was we
+    were what when which who will with you your
+'''.split())
+DOC_COUNT_CACHE_KEY = 'article_search_doc_count'
+DOC_COUNT_TIMEOUT = 300
+
+
+def tokenize(text):
+    """Split text (which may contain HTML) into lowercase index terms."""
+    words = TOKEN_RE.findall(strip_tags(text or '').lower())
+    return [w[:MAX_TERM_LENGTH] for w in words if len(w) > 1 and w not in STOP_WORDS]
+
+
+def article_terms(article):
+    """Return ``{term: weight}`` for an article, weighting title over summary over content."""
+    counts = Counter()
+    for field, field_weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(article, field)):
+            counts[term] += field_weight
+    return {term: 1 + math.log(count) for term, count in counts.items()}
+
+
+def index_article(article):
+    """Bring one article's index rows in line with its current text."""
+    terms = article_terms(article)
+    with transaction.atomic():
+        existing = {row.term: row for row in ArticleSearchTerm.objects.filter(article=article)}
+        stale = [row.pk for term, row in existing.items() if term not in terms]
+        changed = []
+        for term, weight in terms.items():
+            row = existing.get(term)
+            if row is not None and row.weight != weight:
+                row.weight = weight
+                changed.append(row)
+        ArticleSearchTerm.objects.filter(pk__in=stale).delete()
+        ArticleSearchTerm.objects.bulk_update(changed, ['weight'], batch_size=500)
+        ArticleSearchTerm.objects.bulk_create([
+            ArticleSearchTerm(article=article, term=term, weight=weight)
+            for term, weight in terms.items() if term not in existing
+        ], batch_size=500)
+    cache.delete(DOC_COUNT_CACHE_KEY)
+
+
+def index_articles(articles):
+    """Rebuild the index rows for a batch of articles in a few queries."""
+    articles = list(articles)
+    rows = [
+        ArticleSearchTerm(article=article, term=term, weight=weight)
+        for article in articles
+        for term, weight in article_terms(article).items()
+    ]
+    with transaction.atomic():
+        ArticleSearchTerm.objects.filter(article__in=[a.pk for a in articles]).delete()
+        ArticleSearchTerm.objects.bulk_create(rows, batch_size=1000)
+    cache.delete(DOC_COUNT_CACHE_KEY)
+    return len(rows)
+
+
+def _document_count():
+    count = cache.get(DOC_COUNT_CACHE_KEY)
+    if count is None:
+        count = HealthArticle.objects.count()
+        cache.set(DOC_COUNT_CACHE_KEY, count, DOC_COUNT_TIMEOUT)
+    return count
+
+
+def matching_article_ids(query):
+    """Return a subquery of ids of the articles ``search`` matches: those containing any query term."""
+    terms = set(tokenize(query))
+    if not terms:
+        return HealthArticle.objects.none().values('pk')
+    return ArticleSearchTerm.objects.filter(term__in=terms).values('article')
+
+
+def search(query, limit=20, offset=0, category=None):
+    """
+    Return articles matching ``query``, best first.
+
+    Articles that contain more of the query terms rank first; ties are broken
+    by TF-IDF score. ``category`` optionally restricts results to a category
+    slug. Each article gets ``search_score`` and ``search_snippet`` attributes
+    for display.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return []
+
+    doc_freqs = dict(
+        ArticleSearchTerm.objects.filter(term__in=terms)
+        .values_list('term')
+        .annotate(df=Count('id'))
+    )
+    if not doc_freqs:
+        return []
+    total = max(_document_count(), 1)
+    idf = {
+        term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for term, df in doc_freqs.items()
+    }
+
+    score = Sum(
+        Case(
+            *[When(term=term, then=F('weight') * Value(weight)) for term, weight in idf.items()],
+            output_field=FloatField(),
+        )
+    )
+    postings = ArticleSearchTerm.objects.filter(term__in=idf)
+    if category:
+        postings = postings.filter(article__category__slug=category)
+    ranked = list(
+        postings
+        .values('article')
+        .annotate(matched=Count('id'), score=score)
+        .order_by('-matched', '-score', 'article')[offset:offset + limit]
+    )
+
+    articles = HealthArticle.objects.select_related('author', 'category').in_bulk(
+        [row['article'] for row in ranked]
+    )
+    results = []
+    for row in ranked:
+        article = articles.get(row['article'])
+        if article is None:
+            continue
+        article.search_score = row['score']
+        source = article.summary if set(tokenize(article.summary)) & set(terms) else article.content
+        article.search_snippet = highlight(source, terms)
+        results.append(article)
+    return results
+
+
+def highlight(text, terms, length=200):
+    """Return an HTML-safe excerpt of ``text`` around the first match, with matches in <mark>."""
+    text = ' '.join(strip_tags(text or '').split())
+    pattern = re.compile(r'\b(%s)\w*' % '|'.join(re.escape(t) for t in terms), re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(match.start() - length // 4, 0) if match else 0
+    excerpt = text[start:start + length]
+    parts, last = [], 0
+    for m in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[last:m.start()]))
+        parts.append('<mark>%s</mark>' % escape(m.group(0)))
+        last = m.end()
+    parts.append(escape(excerpt[last:]))
+    marked = ''.join(parts)
+    prefix = '&hellip;' if start > 0 else ''
+    suffix = '&hellip;' if start + length < len(text) else ''
+    return mark_safe(prefix + marked + suffix)
@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, HealthArticle, Category, Doctor, Appointment, MedicalRecord, Prescription
+from .search import INDEXED_FIELDS, index_article
+from . import (
+    article_facets, dashboard_stats, directory, doctor_stats, images, patient_lookup, record_search, record_storage,
+    reminders, rollups, similarity,
+)
+from .conditional import touch_articles
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
@@ -11,3 +17,148 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
     else:
         # Get or create the profile if it doesn't exist
         Profile.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=HealthArticle)
+def update_article_search_index(sender, instance, update_fields=None, **kwargs):
+    """Re-index an article and its related articles when its text may have changed"""
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    index_article(instance)
+    similarity.update_article(instance)
+
+@receiver(pre_delete, sender=HealthArticle)
+def remember_article_neighbour_lists(sender, instance, **kwargs):
+    """Keep the full related-article lists a deleted article is about to be removed from"""
+    instance._listed_in = similarity.full_lists_containing(instance)
+
+@receiver(post_delete, sender=HealthArticle)
+def refill_article_neighbour_lists(sender, instance, **kwargs):
+    """Refill the related-article lists a deleted article left short"""
+    similarity.refill(getattr(instance, '_listed_in', []))
+
+@receiver([post_save, post_delete], sender=HealthArticle)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_article_facets(sender, **kwargs):
+    """Retire the cached article facets after an article or category changes"""
+    article_facets.invalidate()
+
+@receiver(pre_save, sender=Profile)
+def remember_profile_picture(sender, instance, **kwargs):
+    """Keep the name of the profile picture from before the save"""
+    instance._picture_previous = None
+    if instance.pk:
+        instance._picture_previous = Profile.objects.filter(pk=instance.pk).values_list('profile_picture', flat=True).first()
+
+@receiver(post_save, sender=Profile)
+def schedule_profile_picture_derivatives(sender, instance, created, **kwargs):
+    """Replace the resized copies of a profile picture in the background when it changed"""
+    images.image_changed(instance.profile_picture, None if created else getattr(instance, '_picture_previous', None))
+
+@receiver(pre_save, sender=HealthArticle)
+def remember_article_image(sender, instance, **kwargs):
+    """Keep the name of the article image from before the save"""
+    instance._image_previous = None
+    if instance.pk:
+        instance._image_previous = HealthArticle.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+@receiver(post_save, sender=HealthArticle)
+def schedule_article_image_derivatives(sender, instance, created, **kwargs):
+    """Replace the resized copies of an article image in the background when it changed"""
+    images.image_changed(instance.image, None if created else getattr(instance, '_image_previous', None))
+
+@receiver([post_save, post_delete], sender=HealthArticle)
+def touch_article_pages(sender, **kwargs):
+    """Invalidate the validators of pages built from health articles"""
+    touch_articles()
+
+@receiver([post_save, post_delete], sender=Appointment)
+def invalidate_appointment_dashboards(sender, instance, **kwargs):
+    """Drop the cached dashboard numbers of an appointment's patient and doctor, before and after a move"""
+    previous = getattr(instance, '_counters_previous', None) or {}
+    doctor_ids = {instance.doctor_id, previous.get('doctor_id')} - {None}
+    doctor_user_ids = Doctor.objects.filter(pk__in=doctor_ids).values_list('user_id', flat=True)
+    dashboard_stats.invalidate(instance.user_id, previous.get('user_id'), *doctor_user_ids)
+
+@receiver([post_save, post_delete], sender=MedicalRecord)
+@receiver([post_save, post_delete], sender=Prescription)
+def invalidate_patient_dashboard(sender, instance, **kwargs):
+    """Drop the cached dashboard numbers of a record's or prescription's patient"""
+    dashboard_stats.invalidate(instance.user_id)
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_counters(sender, instance, **kwargs):
+    """Keep the fields the doctor counters and rollups depend on from before the save"""
+    instance._counters_previous = None
+    if instance.pk:
+        instance._counters_previous = (
+            Appointment.objects.filter(pk=instance.pk).values(*doctor_stats.TRACKED_FIELDS).first()
+        )
+
+@receiver(post_save, sender=Appointment)
+def update_doctor_counters(sender, instance, **kwargs):
+    """Apply an appointment's status or ownership change to the doctor counters"""
+    doctor_stats.appointment_changed(getattr(instance, '_counters_previous', None), doctor_stats.snapshot(instance))
+
+@receiver(post_save, sender=Appointment)
+def update_appointment_rollups(sender, instance, **kwargs):
+    """Move an appointment between the analytics rollups after it changes"""
+    rollups.appointment_changed(getattr(instance, '_counters_previous', None), doctor_stats.snapshot(instance))
+
+@receiver(post_delete, sender=Appointment)
+def remove_appointment_rollups(sender, instance, **kwargs):
+    """Take a deleted appointment out of the analytics rollups"""
+    rollups.appointment_changed(doctor_stats.snapshot(instance), None)
+
+@receiver(post_save, sender=Appointment)
+def schedule_appointment_reminders(sender, instance, **kwargs):
+    """Create, move or drop an appointment's reminders after it is booked, rescheduled or cancelled"""
+    reminders.schedule(instance)
+
+@receiver(post_delete, sender=Appointment)
+def remove_doctor_counters(sender, instance, **kwargs):
+    """Take a deleted appointment out of the doctor counters"""
+    doctor_stats.appointment_changed(doctor_stats.snapshot(instance), None)
+
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_doctor_facets(sender, **kwargs):
+    """Drop the cached directory facet counts after a doctor changes"""
+    directory.invalidate_facets()
+
+@receiver(post_save, sender=User)
+def update_patient_lookup(sender, instance, update_fields=None, **kwargs):
+    """Re-index a patient's name parts unless only unrelated fields were saved"""
+    if update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return
+    patient_lookup.index_patient(instance)
+
+@receiver(post_save, sender=Profile)
+def update_patient_lookup_profile(sender, instance, **kwargs):
+    """Re-index a patient's phone number, or drop the terms of a doctor"""
+    patient_lookup.index_patient(instance.user, instance)
+
+@receiver(pre_save, sender=MedicalRecord)
+def remember_record_blob(sender, instance, **kwargs):
+    """Keep the name of the file a record used before the save"""
+    instance._blob_previous = None
+    if instance.pk:
+        instance._blob_previous = MedicalRecord.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+
+@receiver(post_save, sender=MedicalRecord)
+def update_record_blob_references(sender, instance, created, **kwargs):
+    """Move a record's reference from its old file blob to the new one"""
+    previous = None if created else getattr(instance, '_blob_previous', None)
+    if instance.file.name != previous:
+        record_storage.referenced(instance.file.name)
+        record_storage.released(previous)
+
+@receiver(post_delete, sender=MedicalRecord)
+def release_record_blob(sender, instance, **kwargs):
+    """Drop a deleted record's reference to its file blob"""
+    record_storage.released(instance.file.name)
+
+@receiver(post_save, sender=MedicalRecord)
+def update_record_search_index(sender, instance, update_fields=None, **kwargs):
+    """Re-index a record, queueing text extraction if its file is new, unless only unrelated fields were saved"""
+    if update_fields is not None and not record_search.INDEXED_FIELDS.intersection(update_fields):
+        return
+    record_search.record_saved(instance)
@@ -0,0 +1,206 @@
+"""
+Related-article recommendations from TF-IDF cosine similarity.
+
+Article vectors are built with NumPy from the term weights already stored
+in the search index (``ArticleSearchTerm``), scaled by inverse document
+frequency and L2-normalised. The top ``TOP_K`` neighbours of every article
+are stored in ``RelatedArticle`` so the detail page only does one indexed
+lookup.
+
+``rebuild()`` recomputes everything in blocks of matrix products. After an
+article is saved, ``update_article()`` rescores it against the articles that
+share its strongest terms and patches its new score into their neighbour
+lists. Only a full list it falls to the bottom of is recomputed, since an
+article outside that list may now outrank it. When an article is deleted,
+``refill()`` recomputes the full lists it was removed from.
+
+Incremental updates weigh terms by IDF over the candidates' vocabulary only,
+without ``rebuild()``'s feature cap, so their scores drift slightly from a
+full rebuild's until the next one.
+"""
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import ArticleSearchTerm, HealthArticle, RelatedArticle
+
+TOP_K = 5
+MAX_DF_RATIO = 0.5
+MAX_FEATURES = 5000
+BLOCK_SIZE = 512
+CANDIDATE_TERMS = 20
+CANDIDATE_LIMIT = 200
+
+
+def _idf(document_count, doc_freqs):
+    """Map terms to IDF, dropping terms too rare or too common to relate articles."""
+    max_df = max(MAX_DF_RATIO * document_count, 2)
+    return {
+        term: math.log((1 + document_count) / (1 + df)) + 1
+        for term, df in doc_freqs.items()
+        if 2 <= df <= max_df
+    }
+
+
+def _vectors(article_ids, idf, postings=None):
+    """
+    Return an L2-normalised TF-IDF matrix with one row per article id.
+
+    ``postings`` defaults to the index rows of ``article_ids``; a full rebuild
+    passes every row instead of a huge ``IN`` list.
+    """
+    vocabulary = {term: i for i, term in enumerate(idf)}
+    weights = np.array(list(idf.values()), dtype=np.float32)
+    rows = {pk: i for i, pk in enumerate(article_ids)}
+    matrix = np.zeros((len(article_ids), len(vocabulary)), dtype=np.float32)
+
+    if postings is None:
+        postings = ArticleSearchTerm.objects.filter(article__in=article_ids)
+    postings = postings.values_list('article_id', 'term', 'weight')
+    for article_id, term, weight in postings.iterator(chunk_size=5000):
+        column = vocabulary.get(term)
+        if column is not None and article_id in rows:
+            matrix[rows[article_id], column] = weight
+    matrix *= weights
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Return (indices, scores) of the ``k`` best positive scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return [], []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    best = best[scores[best] > 0]
+    return best, scores[best]
+
+
+def rebuild(top_k=TOP_K, max_features=MAX_FEATURES):
+    """Recompute the neighbours of every article. Returns the number of rows stored."""
+    article_ids = list(HealthArticle.objects.order_by('pk').values_list('pk', flat=True))
+    doc_freqs = dict(ArticleSearchTerm.objects.values_list('term').annotate(df=Count('id')))
+    idf = _idf(len(article_ids), doc_freqs)
+    # Keep the most widespread terms when the vocabulary has to be capped.
+    kept = sorted(idf, key=lambda term: doc_freqs[term], reverse=True)[:max_features]
+    idf = {term: idf[term] for term in kept}
+
+    matrix = _vectors(article_ids, idf, postings=ArticleSearchTerm.objects.all())
+    neighbours = []
+    for start in range(0, len(article_ids), BLOCK_SIZE):
+        block = matrix[start:start + BLOCK_SIZE] @ matrix.T
+        for offset, scores in enumerate(block):
+            row = start + offset
+            scores[row] = -1
+            best, best_scores = _top_k(scores, top_k)
+            neighbours.extend(
+                RelatedArticle(
+                    article_id=article_ids[row], related_id=article_ids[col],
+                    score=float(score), rank=rank,
+                )
+                for rank, (col, score) in enumerate(zip(best, best_scores))
+            )
+
+    with transaction.atomic():
+        RelatedArticle.objects.all().delete()
+        RelatedArticle.objects.bulk_create(neighbours, batch_size=1000)
+    return len(neighbours)
+
+
+def _doc_freqs(terms):
+    return dict(
+        ArticleSearchTerm.objects.filter(term__in=terms).values_list('term').annotate(df=Count('id'))
+    )
+
+
+def _candidates(article_id, document_count):
+    """Ids of the articles sharing the most weight on the strongest terms of ``article_id``."""
+    weights = dict(ArticleSearchTerm.objects.filter(article_id=article_id).values_list('term', 'weight'))
+    idf = _idf(document_count, _doc_freqs(list(weights)))
+    top_terms = sorted(idf, key=lambda term: weights[term] * idf[term], reverse=True)[:CANDIDATE_TERMS]
+    return list(
+        ArticleSearchTerm.objects.filter(term__in=top_terms)
+        .exclude(article_id=article_id)
+        .values('article')
+        .annotate(overlap=Sum('weight'))
+        .order_by('-overlap')
+        .values_list('article', flat=True)[:CANDIDATE_LIMIT]
+    )
+
+
+def _store(article_id, scored, top_k):
+    """Replace an article's neighbour rows with the best of ``scored`` ({id: score})."""
+    best = sorted(scored.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    RelatedArticle.objects.filter(article_id=article_id).delete()
+    RelatedArticle.objects.bulk_create([
+        RelatedArticle(article_id=article_id, related_id=related_id, score=score, rank=rank)
+        for rank, (related_id, score) in enumerate(best)
+        if score > 0
+    ])
+
+
+def _scores(article_id, document_count):
+    """Score ``article_id`` against its candidates; returns ``{id: cosine similarity}``."""
+    candidates = _candidates(article_id, document_count)
+    article_ids = [article_id] + candidates
+    terms = ArticleSearchTerm.objects.filter(article__in=article_ids).values('term')
+    idf = _idf(document_count, _doc_freqs(terms))
+    matrix = _vectors(article_ids, idf)
+    scores = matrix[1:] @ matrix[0]
+    return {pk: float(score) for pk, score in zip(candidates, scores)}
+
+
+def update_article(article, top_k=TOP_K):
+    """Recompute ``article``'s neighbours and its place in its neighbours' lists."""
+    document_count = HealthArticle.objects.count()
+    scored = _scores(article.pk, document_count)
+
+    with transaction.atomic():
+        _store(article.pk, scored, top_k)
+
+        # Patch the lists of articles this one now belongs in, or has dropped out of.
+        listed_in = dict(RelatedArticle.objects.filter(related=article).values_list('article_id', 'score'))
+        affected = set(listed_in) | {pk for pk, score in scored.items() if score > 0}
+        existing = {}
+        for row in RelatedArticle.objects.filter(article__in=affected).exclude(related=article):
+            existing.setdefault(row.article_id, {})[row.related_id] = row.score
+        for other in affected:
+            neighbours = existing.get(other, {})
+            score = scored.get(other, 0)
+            weakest = min(neighbours.values(), default=0)
+            if other in listed_in:
+                if score == listed_in[other]:
+                    continue
+                if len(neighbours) + 1 >= top_k and (score <= 0 or score < weakest):
+                    # Now last in a full list, it may be outranked by an article outside it.
+                    _store(other, _scores(other, document_count), top_k)
+                    continue
+            elif len(neighbours) >= top_k and score <= weakest:
+                continue
+            if score > 0:
+                neighbours[article.pk] = score
+            _store(other, neighbours, top_k)
+
+
+def full_lists_containing(article, top_k=TOP_K):
+    """Ids of the articles whose full neighbour list includes ``article``."""
+    return list(
+        RelatedArticle.objects.filter(article__neighbours__related=article)
+        .values('article')
+        .annotate(size=Count('id'))
+        .filter(size__gte=top_k)
+        .values_list('article', flat=True)
+    )
+
+
+def refill(article_ids, top_k=TOP_K):
+    """Recompute the neighbour lists of ``article_ids``, e.g. after one of their neighbours was deleted."""
+    document_count = HealthArticle.objects.count()
+    with transaction.atomic():
+        for article_id in article_ids:
+            _store(article_id, _scores(article_id, document_count), top_k)
@@ -0,0 +1,153 @@
+"""
+Free appointment slots for doctors.
+
+A day is split into fixed ``APPOINTMENT_SLOT_MINUTES`` slots. For a set of
+doctors and a range of dates, ``Availability`` keeps one integer bitmap per
+doctor with a bit for every slot in the range: working hours set bits, active
+appointments and slots already in the past clear them. Building it costs one
+query for the doctors and one for their appointments, after which "free slots
+for this doctor" and "which doctors are free at T" are bit operations.
+"""
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment, Doctor
+
+SLOT_MINUTES = getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30)
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+# Working hours for doctors who have not set their own.
+DEFAULT_HOURS = (datetime.time(9), datetime.time(17))
+# Appointments in these states hold their slot.
+ACTIVE_STATUSES = ('Scheduled', 'Confirmed')
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _hours_mask(start, end):
+    """Bits of the slots lying entirely between ``start`` and ``end`` on one day."""
+    first = -(-_minutes(start) // SLOT_MINUTES)
+    last = _minutes(end) // SLOT_MINUTES
+    if start <= end:
+        return ((1 << last) - 1) & ~((1 << first) - 1)
+    # Hours running past midnight, e.g. 22:00 - 06:00.
+    return ((1 << last) - 1) | (DAY_MASK & ~((1 << first) - 1))
+
+
+def daily_slots(available_from, available_to):
+    """How many slots a day working hours from ``available_from`` to ``available_to`` hold."""
+    return bin(_hours_mask(available_from or DEFAULT_HOURS[0], available_to or DEFAULT_HOURS[1])).count('1')
+
+
+def _repeat(day_mask, days):
+    mask = 0
+    for day in range(days):
+        mask |= day_mask << (day * SLOTS_PER_DAY)
+    return mask
+
+
+class Availability:
+    """Free-slot bitmaps for ``doctors`` from ``start_date`` to ``end_date`` inclusive."""
+
+    def __init__(self, doctors, start_date, end_date, now=None):
+        self.doctors = {doctor.pk: doctor for doctor in doctors}
+        self.start_date = start_date
+        # Adding a timedelta to an aware datetime moves the wall clock, so slot
+        # times stay on the grid across DST changes.
+        self._tz = timezone.get_current_timezone()
+        self._origin = datetime.datetime.combine(start_date, datetime.time(), tzinfo=self._tz)
+        self.days = max((end_date - start_date).days + 1, 0)
+        self._free = {}
+
+        patterns = {}
+        for doctor in self.doctors.values():
+            if not doctor.is_available:
+                self._free[doctor.pk] = 0
+                continue
+            hours = (doctor.available_from or DEFAULT_HOURS[0], doctor.available_to or DEFAULT_HOURS[1])
+            if hours not in patterns:
+                patterns[hours] = _repeat(_hours_mask(*hours), self.days)
+            self._free[doctor.pk] = patterns[hours]
+
+        busy = {}
+        appointments = Appointment.objects.filter(
+            doctor__in=list(self.doctors),
+            status__in=ACTIVE_STATUSES,
+            datetime__gte=self._to_datetime(0),
+            datetime__lt=self._to_datetime(self.days * SLOTS_PER_DAY),
+        ).values_list('doctor_id', 'datetime')
+        for doctor_id, start in appointments:
+            # An appointment lasts one slot; off-grid ones block both slots they overlap.
+            offset = self._offset(start)
+            first, last = offset // SLOT_MINUTES, (offset + SLOT_MINUTES - 1) // SLOT_MINUTES
+            busy[doctor_id] = busy.get(doctor_id, 0) | (((1 << (last + 1)) - 1) & ~((1 << first) - 1))
+
+        past = (1 << max(-(-self._offset(now or timezone.now()) // SLOT_MINUTES), 0)) - 1
+        for doctor_id in self._free:
+            self._free[doctor_id] &= ~(busy.get(doctor_id, 0) | past)
+
+    @classmethod
+    def for_range(cls, start_date, end_date, doctors=None, now=None):
+        """Build availability for ``doctors`` (default: every doctor)."""
+        if doctors is None:
+            doctors = Doctor.objects.select_related('user')
+        return cls(doctors, start_date, end_date, now=now)
+
+    def _to_datetime(self, bit):
+        return self._origin + datetime.timedelta(minutes=bit * SLOT_MINUTES)
+
+    def _offset(self, value):
+        """Minutes from the start of the range to ``value`` in local time."""
+        if timezone.is_aware(value):
+            value = value.astimezone(self._tz)
+        day = (value.date() - self.start_date).days
+        return day * 24 * 60 + _minutes(value)
+
+    def _bit(self, value):
+        """Slot bit starting exactly at ``value``, or None if it is off the grid or out of range."""
+        if value.second or value.microsecond:
+            return None
+        offset = self._offset(value)
+        if offset % SLOT_MINUTES or not 0 <= offset < self.days * 24 * 60:
+            return None
+        return offset // SLOT_MINUTES
+
+    def _bits(self, doctor_id):
+        mask = self._free.get(doctor_id, 0)
+        while mask:
+            lowest = mask & -mask
+            yield lowest.bit_length() - 1
+            mask ^= lowest
+
+    def free_slots(self, doctor_id):
+        """Start times of the free slots of a doctor, in order."""
+        return [self._to_datetime(bit) for bit in self._bits(doctor_id)]
+
+    def free_slots_by_date(self, doctor_id):
+        """Free slots of a doctor grouped as ``{date: [datetime, ...]}``."""
+        by_date = {}
+        for bit in self._bits(doctor_id):
+            day = self.start_date + datetime.timedelta(days=bit // SLOTS_PER_DAY)
+            by_date.setdefault(day, []).append(self._to_datetime(bit))
+        return by_date
+
+    def is_free(self, doctor_id, at):
+        bit = self._bit(at)
+        return bit is not None and bool(self._free.get(doctor_id, 0) >> bit & 1)
+
+    def free_doctors(self, at):
+        """Doctors with a free slot starting at ``at``."""
+        bit = self._bit(at)
+        if bit is None:
+            return []
+        return [doctor for pk, doctor in self.doctors.items() if self._free[pk] >> bit & 1]
+
+
+def is_slot_free(doctor, at):
+    """Whether ``doctor`` can be booked for the slot starting at ``at``."""
+    day = timezone.localtime(at).date() if timezone.is_aware(at) else at.date()
+    return Availability([doctor], day, day).is_free(doctor.pk, at)
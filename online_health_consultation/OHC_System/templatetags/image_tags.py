@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from OHC_System import images
+
+register = template.Library()
+
+
+@register.filter
+def derivative_url(fieldfile, size='card'):
+    """URL of the WebP derivative of an image at ``size``, or of the original."""
+    if not fieldfile:
+        return ''
+    name = images.available_derivatives(fieldfile).get((size, 'webp'))
+    return fieldfile.storage.url(name) if name else fieldfile.url
+
+
+@register.simple_tag
+def picture(fieldfile, size='card', alt='', **attrs):
+    """
+    Render a <picture> offering the AVIF/WebP derivatives at ``size``.
+
+    The original upload stays the <img> fallback, so browsers without
+    AVIF/WebP support (and images whose derivatives aren't ready yet)
+    still get a picture.
+    """
+    if not fieldfile:
+        return ''
+    available = images.available_derivatives(fieldfile)
+    sources = format_html_join(
+        '', '<source srcset="{}" type="image/{}">',
+        (
+            (fieldfile.storage.url(available[(size, extension)]), extension)
+            for extension, _ in reversed(images.FORMATS)
+            if (size, extension) in available
+        ),
+    )
+    img_attrs = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        sources, fieldfile.url, alt, img_attrs,
+    )
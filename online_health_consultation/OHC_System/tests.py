@@ -1,3 +1,1581 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    article_facets, booking, dashboard_stats, directory, doctor_stats, ical, images, no_shows, outbox, patient_lookup,
+    record_search, record_storage, record_uploads, reminders, revenue, rollups, roster, search, similarity, slots,
+    view_counter, views,
+)
+from .forms import AppointmentForm
+from .models import (
+    Appointment, AppointmentReminder, AppointmentRollup, ArticleSearchTerm, Category, Doctor, DoctorPatient,
+    DoctorStats, HealthArticle, MedicalRecord, OutboundEmail, PatientSearchTerm, Prescription, RecordBlob, RecordText,
+    RecordUpload, RelatedArticle,
+)
+from .pagination import CURSOR_SALT, paginate
+
+
+class ArticleFacetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pw')
+        self.category = Category.objects.create(name='Heart')
+
+    def add_article(self, title, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return HealthArticle.objects.create(
+                title=title, content=f'{title} body text', author=self.author, category=self.category, **fields
+            )
+
+    def test_snapshot_holds_display_fields_only(self):
+        self.add_article('Blood pressure', featured=True)
+        article_facets.get_facets()
+        snapshot = cache.get(article_facets._snapshot_key())
+        row = snapshot['featured'][0]
+        self.assertNotIn('content', row)
+        self.assertEqual(row['teaser'], 'Blood pressure body text')
+
+        featured = article_facets.get_facets()['featured']
+        self.assertEqual([a.title for a in featured], ['Blood pressure'])
+        self.assertEqual(featured[0].teaser, 'Blood pressure body text')
+
+    def test_changes_are_visible_after_commit(self):
+        self.assertEqual(article_facets.get_facets()['categories'][0]['article_count'], 0)
+        article = self.add_article('Cholesterol')
+        facets = article_facets.get_facets()
+        self.assertEqual(facets['categories'][0]['article_count'], 1)
+        self.assertEqual([a.pk for a in facets['recent']], [article.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            article.featured = True
+            article.save()
+        self.assertEqual([a.pk for a in article_facets.get_facets()['featured']], [article.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            article.delete()
+        facets = article_facets.get_facets()
+        self.assertEqual(facets['featured'], [])
+        self.assertEqual(facets['categories'][0]['article_count'], 0)
+
+    def test_snapshot_built_before_a_change_is_not_used(self):
+        stale_key = article_facets._snapshot_key()
+        stale = article_facets.build()
+        self.add_article('Diabetes')
+        # A reader that started before the commit stores what it read under the old version.
+        cache.set(stale_key, stale, article_facets.CACHE_TIMEOUT)
+        self.assertEqual([a.title for a in article_facets.get_facets()['recent']], ['Diabetes'])
+
+    def test_flushed_views_reorder_popular(self):
+        first = self.add_article('First')
+        second = self.add_article('Second')
+        self.assertEqual([a.pk for a in article_facets.get_facets()['popular']], [second.pk, first.pk])
+        snapshot_key = article_facets._snapshot_key()
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthArticle.objects.filter(pk=first.pk).update(views=10)
+            article_facets.invalidate_popular()
+        # Only the popular list is rebuilt; categories, featured and recent stay cached.
+        with self.assertNumQueries(1):
+            popular = article_facets.get_facets()['popular']
+        self.assertEqual([(a.pk, a.views) for a in popular], [(first.pk, 10), (second.pk, 0)])
+        self.assertEqual(article_facets._snapshot_key(), snapshot_key)
+
+    def test_article_changes_rebuild_the_popular_list(self):
+        first = self.add_article('First')
+        article_facets.get_facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.title = 'Renamed'
+            first.save()
+        self.assertEqual([a.title for a in article_facets.get_facets()['popular']], ['Renamed'])
+
+
+class RelatedArticleTests(TestCase):
+    WORDS = ['heart', 'blood', 'pressure', 'sugar', 'insulin', 'diet', 'sleep', 'stress', 'exercise', 'lungs']
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pw')
+        self.articles = []
+        for i in range(12):
+            words = [self.WORDS[(i + j) % len(self.WORDS)] for j in range(4)]
+            self.articles.append(HealthArticle.objects.create(
+                title=f'Article {i}', content=' '.join(words), author=self.author,
+            ))
+        similarity.rebuild()
+
+    def related_ids(self, article):
+        return list(RelatedArticle.objects.filter(article=article).order_by('rank').values_list('related_id', flat=True))
+
+    def test_lists_an_article_leaves_are_refilled(self):
+        edited = self.articles[0]
+        listing = [a for a in self.articles if edited.pk in self.related_ids(a)]
+        self.assertTrue(listing)
+        before = {a.pk: len(self.related_ids(a)) for a in listing}
+
+        edited.content = 'vaccination schedule for travel abroad'
+        edited.save()
+
+        for article in listing:
+            related = self.related_ids(article)
+            self.assertNotIn(edited.pk, related)
+            self.assertEqual(len(related), before[article.pk])
+
+    def test_new_article_joins_its_neighbours_lists(self):
+        article = HealthArticle.objects.create(
+            title='Twin', content=self.articles[3].content, author=self.author,
+        )
+        self.assertEqual(self.related_ids(article)[0], self.articles[3].pk)
+        self.assertEqual(self.related_ids(self.articles[3])[0], article.pk)
+
+    def test_lists_the_article_stays_in_are_patched_without_rescoring(self):
+        edited = self.articles[0]
+        edited.content += ' heart'
+        with mock.patch.object(similarity, '_scores', wraps=similarity._scores) as scores:
+            edited.save()
+        self.assertEqual([call.args[0] for call in scores.call_args_list], [edited.pk])
+        for article in self.articles[1:]:
+            self.assertEqual(len(self.related_ids(article)), similarity.TOP_K)
+
+    def test_deleting_an_article_refills_the_lists_it_was_in(self):
+        deleted = self.articles[0]
+        listing = [a for a in self.articles if deleted.pk in self.related_ids(a)]
+        self.assertTrue(listing)
+        deleted.delete()
+        for article in listing:
+            related = self.related_ids(article)
+            self.assertNotIn(deleted.pk, related)
+            self.assertEqual(len(related), similarity.TOP_K)
+
+
+def image_file(name='photo.png', color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class MediaTestCase(TestCase):
+    """Keeps files written by a test in a temporary MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ImageDerivativeTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('patient', password='pw')
+        self.profile = self.user.profile
+        patcher = mock.patch.object(images._executor, 'submit')
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_profile(self, **fields):
+        for name, value in fields.items():
+            setattr(self.profile, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+
+    def test_only_a_changed_picture_is_scheduled(self):
+        self.save_profile(profile_picture=image_file())
+        self.assertEqual(self.submit.call_count, 1)
+        self.save_profile(phone_number='5550100')
+        self.assertEqual(self.submit.call_count, 1)
+
+    def test_replaced_picture_loses_its_derivatives(self):
+        self.save_profile(profile_picture=image_file('old.png'))
+        old = self.profile.profile_picture.name
+        images.generate_derivatives(default_storage, old)
+        derivative = images.derivative_name(old, 'thumb', 'webp')
+        self.assertTrue(default_storage.exists(derivative))
+
+        self.save_profile(profile_picture=image_file('new.png', 'blue'))
+        self.assertFalse(default_storage.exists(derivative))
+        self.assertEqual(self.submit.call_count, 2)
+
+    def test_default_picture_keeps_its_derivatives(self):
+        default = self.profile.profile_picture.name
+        self.assertEqual(default, 'profile_pics/default.jpg')
+        default_storage.save(default, image_file())
+        images.generate_derivatives(default_storage, default)
+        derivative = images.derivative_name(default, 'thumb', 'webp')
+
+        self.save_profile(profile_picture=image_file('mine.png'))
+        self.assertTrue(default_storage.exists(derivative))
+
+
+class ConditionalPageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('viewer', password='pw')
+        self.client.force_login(self.user)
+        patcher = mock.patch.object(images._executor, 'submit')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_revalidates(self, change):
+        etag = self.client.get('/')['ETag']
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_new_username_is_rendered(self):
+        def rename():
+            self.user.username = 'renamed'
+            self.user.save()
+        self.assert_revalidates(rename)
+
+    def test_new_role_is_rendered(self):
+        self.assert_revalidates(lambda: type(self.user.profile).objects.filter(user=self.user).update(is_doctor=True))
+
+    def test_new_profile_picture_is_rendered(self):
+        def change_photo():
+            profile = self.user.profile
+            profile.profile_picture = image_file()
+            profile.save()
+        self.assert_revalidates(change_photo)
+
+
+def make_doctor(username='doctor', **fields):
+    user = User.objects.create_user(username, password='pw')
+    user.profile.is_doctor = True
+    user.profile.save()
+    fields = {'specialization': 'Cardiology', 'available_from': time(9), 'available_to': time(17), **fields}
+    return Doctor.objects.create(user=user, license_number=f'LIC-{username}', **fields)
+
+
+def next_slot(hour=10, days=1):
+    """An aware datetime ``days`` from today at ``hour`` o'clock, local time."""
+    day = timezone.localdate() + timedelta(days=days)
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+        self.slot = next_slot()
+
+    def test_books_a_free_slot(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        self.assertEqual(appointment.status, 'Scheduled')
+        self.assertEqual(appointment.datetime, self.slot)
+
+    def test_taken_slot_is_refused(self):
+        booking.book(self.patient, self.doctor, self.slot)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book(self.other, self.doctor, self.slot)
+
+    def test_slot_outside_hours_is_refused(self):
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book(self.patient, self.doctor, next_slot(hour=20))
+
+    def test_constraint_allows_one_active_appointment_per_slot(self):
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.slot, status='Confirmed')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.create(user=self.other, doctor=self.doctor, datetime=self.slot)
+
+    def test_constraint_ignores_inactive_appointments(self):
+        for status in ('Cancelled', 'Completed', 'No-show', 'Scheduled'):
+            Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.slot, status=status)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, datetime=self.slot).count(), 4)
+
+    def test_cancelled_slot_can_be_booked_again(self):
+        first = booking.book(self.patient, self.doctor, self.slot)
+        first.status = 'Cancelled'
+        first.save()
+        second = booking.book(self.other, self.doctor, self.slot)
+        self.assertEqual(second.user, self.other)
+
+    def test_race_lost_at_the_database_is_slot_unavailable(self):
+        booking.book(self.patient, self.doctor, self.slot)
+        # Both requests passed the availability check before either saved.
+        with mock.patch.object(booking, 'is_slot_free', return_value=True):
+            with self.assertRaises(booking.SlotUnavailable):
+                booking.book(self.other, self.doctor, self.slot)
+        # The savepoint leaves the surrounding transaction usable.
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers instead of racing them')
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_one_of_many_concurrent_bookings_wins(self):
+        doctor = make_doctor()
+        patients = [User.objects.create_user(f'patient{i}', password='pw') for i in range(5)]
+        slot = next_slot()
+        barrier = threading.Barrier(len(patients))
+        outcomes = []
+
+        def attempt(patient):
+            try:
+                barrier.wait()
+                booking.book(patient, doctor, slot)
+                outcomes.append('booked')
+            except booking.SlotUnavailable:
+                outcomes.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(patient,)) for patient in patients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['booked'] + ['refused'] * (len(patients) - 1))
+        self.assertEqual(Appointment.objects.filter(doctor=doctor, datetime=slot).count(), 1)
+
+
+class SlotAvailabilityTests(TestCase):
+    DAY = date(2026, 3, 2)
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', password='pw')
+
+    def at(self, hour, minute=0, days=0):
+        return timezone.make_aware(datetime.combine(self.DAY + timedelta(days=days), time(hour, minute)))
+
+    def free_times(self, doctor, days=1, now=None):
+        end = self.DAY + timedelta(days=days - 1)
+        availability = slots.Availability([doctor], self.DAY, end, now=now or self.at(0))
+        return [timezone.localtime(slot).strftime('%H:%M') for slot in availability.free_slots(doctor.pk)]
+
+    def test_working_hours_set_the_slots_inside_them(self):
+        expected = [f'{hour:02}:{minute:02}' for hour in range(9, 17) for minute in (0, 30)]
+        self.assertEqual(self.free_times(self.doctor), expected)
+        self.assertEqual(slots.daily_slots(time(9), time(17)), 16)
+
+    def test_off_grid_hours_keep_only_whole_slots(self):
+        doctor = make_doctor('partial', available_from=time(9, 15), available_to=time(10, 45))
+        self.assertEqual(self.free_times(doctor), ['09:30', '10:00'])
+
+    def test_hours_ending_before_they_start_run_past_midnight(self):
+        doctor = make_doctor('night', available_from=time(22), available_to=time(1))
+        self.assertEqual(self.free_times(doctor), ['00:00', '00:30', '22:00', '22:30', '23:00', '23:30'])
+        self.assertEqual(slots.daily_slots(time(22), time(1)), 6)
+
+    def test_overnight_span_continues_into_the_next_day(self):
+        doctor = make_doctor('night', available_from=time(23), available_to=time(1))
+        availability = slots.Availability([doctor], self.DAY, self.DAY + timedelta(days=1), now=self.at(0))
+        night = [self.at(23), self.at(23, 30), self.at(0, days=1), self.at(0, 30, days=1)]
+        self.assertEqual(availability.free_slots(doctor.pk)[2:6], night)
+
+    def test_equal_hours_leave_no_slots(self):
+        doctor = make_doctor('never', available_from=time(9), available_to=time(9))
+        self.assertEqual(self.free_times(doctor), [])
+
+    def test_missing_hours_fall_back_to_the_defaults(self):
+        unset = make_doctor('unset', available_from=None, available_to=None)
+        self.assertEqual(self.free_times(unset), self.free_times(self.doctor))
+        afternoon = make_doctor('afternoon', available_from=time(15), available_to=None)
+        self.assertEqual(self.free_times(afternoon), ['15:00', '15:30', '16:00', '16:30'])
+        self.assertEqual(slots.daily_slots(None, None), 16)
+
+    def test_unavailable_doctor_has_no_slots(self):
+        doctor = make_doctor('away', is_available=False)
+        self.assertEqual(self.free_times(doctor), [])
+
+    def test_active_appointments_clear_their_slots(self):
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.at(10), status='Scheduled')
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.at(11), status='Cancelled')
+        # Off the grid, so it overlaps both the 12:00 and the 12:30 slot.
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.at(12, 15), status='Confirmed')
+        free = self.free_times(self.doctor)
+        for taken in ('10:00', '12:00', '12:30'):
+            self.assertNotIn(taken, free)
+        for open_slot in ('10:30', '11:00', '13:00'):
+            self.assertIn(open_slot, free)
+
+    def test_past_slots_are_cleared(self):
+        self.assertEqual(self.free_times(self.doctor, now=self.at(15, 10)), ['15:30', '16:00', '16:30'])
+
+    def test_free_doctors_at_a_time(self):
+        other = make_doctor('other')
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=self.at(10))
+        availability = slots.Availability([self.doctor, other], self.DAY, self.DAY, now=self.at(0))
+        self.assertEqual(availability.free_doctors(self.at(10)), [other])
+        self.assertEqual(availability.free_doctors(self.at(11)), [self.doctor, other])
+        self.assertEqual(availability.free_doctors(self.at(10, 15)), [])
+        self.assertTrue(availability.is_free(other.pk, self.at(10)))
+        self.assertFalse(availability.is_free(other.pk, self.at(10, days=1)))
+
+
+class AppointmentSlotsApiTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', password='pw')
+        self.client.force_login(self.patient)
+        self.start = timezone.localdate() + timedelta(days=1)
+
+    def get(self, **params):
+        return self.client.get('/appointments/slots/', params)
+
+    def test_lists_a_doctors_free_slots_by_date(self):
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=next_slot(hour=9))
+        end = self.start + timedelta(days=1)
+        response = self.get(doctor=self.doctor.pk, start=self.start.isoformat(), end=end.isoformat())
+        self.assertEqual(response.status_code, 200)
+        days = response.json()['slots']
+        self.assertEqual(list(days), [self.start.isoformat(), end.isoformat()])
+        self.assertEqual(days[self.start.isoformat()][0], '09:30')
+        self.assertEqual(days[end.isoformat()][0], '09:00')
+
+    def test_range_is_limited(self):
+        last = self.start + timedelta(days=views.SLOT_SEARCH_MAX_DAYS - 1)
+        response = self.get(doctor=self.doctor.pk, start=self.start.isoformat(), end=last.isoformat())
+        self.assertEqual(len(response.json()['slots']), views.SLOT_SEARCH_MAX_DAYS)
+        for end in (last + timedelta(days=1), self.start - timedelta(days=1)):
+            response = self.get(doctor=self.doctor.pk, start=self.start.isoformat(), end=end.isoformat())
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_parameters_are_rejected(self):
+        self.assertEqual(self.get(doctor='abc').status_code, 400)
+        self.assertEqual(self.get(doctor=self.doctor.pk, start='2026-13-01').status_code, 400)
+        self.assertEqual(self.get(at='tomorrow').status_code, 400)
+        self.assertEqual(self.get(doctor=self.doctor.pk + 100).status_code, 404)
+
+    def test_lists_the_doctors_free_at_a_time(self):
+        other = make_doctor('other', specialization='Dermatology')
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=next_slot())
+        doctors = self.get(at=next_slot().isoformat()).json()['doctors']
+        self.assertEqual([doctor['id'] for doctor in doctors], [other.pk])
+        doctors = self.get(at=next_slot(hour=11).isoformat(), specialization='cardio').json()['doctors']
+        self.assertEqual([doctor['id'] for doctor in doctors], [self.doctor.pk])
+
+
+class AppointmentFormTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+
+    def form(self, at):
+        return AppointmentForm(data={
+            'doctor': self.doctor.pk,
+            'datetime': timezone.localtime(at).strftime('%Y-%m-%d %H:%M'),
+            'appointment_type': 'Consultation',
+        })
+
+    def test_free_slot_is_accepted(self):
+        self.assertTrue(self.form(next_slot()).is_valid())
+
+    def test_past_slot_is_rejected(self):
+        self.assertFalse(self.form(next_slot(days=-1)).is_valid())
+
+    def test_slot_outside_working_hours_is_rejected(self):
+        form = self.form(next_slot(hour=20))
+        self.assertFalse(form.is_valid())
+        self.assertIn('not available', form.non_field_errors()[0])
+
+    def test_taken_slot_is_rejected(self):
+        patient = User.objects.create_user('patient', password='pw')
+        Appointment.objects.create(user=patient, doctor=self.doctor, datetime=next_slot())
+        self.assertFalse(self.form(next_slot()).is_valid())
+
+
+class PatientLookupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice.k', first_name='Alice', last_name='Kowalski', password='pw')
+        self.alice.profile.phone_number = '+48 (22) 555-0199'
+        self.alice.profile.save()
+        self.bob = User.objects.create_user('bobby', first_name='Bob', last_name='Kowal', password='pw')
+
+    def usernames(self, query):
+        return [user.username for user in patient_lookup.lookup(query)]
+
+    def test_every_word_must_prefix_a_term(self):
+        self.assertEqual(self.usernames('kow'), ['alice.k', 'bobby'])
+        self.assertEqual(self.usernames('kow ali'), ['alice.k'])
+        self.assertEqual(self.usernames('kow zed'), [])
+
+    def test_phone_matches_with_or_without_codes(self):
+        self.assertEqual(self.usernames('+48 22 555 0199'), ['alice.k'])
+        self.assertEqual(self.usernames('555-01'), ['alice.k'])
+
+    def test_terms_follow_renames_and_role_changes(self):
+        self.bob.last_name = 'Nowak'
+        self.bob.save()
+        self.assertEqual(self.usernames('kowal'), ['alice.k'])
+        profile = self.alice.profile
+        profile.is_doctor = True
+        profile.save()
+        self.assertEqual(self.usernames('alice'), [])
+
+    def test_migration_backfill_matches_the_module(self):
+        expected = set(PatientSearchTerm.objects.values_list('user_id', 'term'))
+        PatientSearchTerm.objects.all().delete()
+        migration = importlib.import_module('OHC_System.migrations.0016_patientsearchterm')
+        migration.index_patients(apps, None)
+        self.assertEqual(set(PatientSearchTerm.objects.values_list('user_id', 'term')), expected)
+
+
+@override_settings(EMAIL_OUTBOX_INTERVAL=0)
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', email='patient@example.com', password='pw')
+        self.slot = next_slot(days=3)
+
+    def due(self, appointment):
+        return dict(AppointmentReminder.objects.filter(appointment=appointment).values_list('kind', 'due_at'))
+
+    def test_booking_schedules_every_offset(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        self.assertEqual(self.due(appointment), {kind: self.slot - offset for kind, offset in reminders.OFFSETS.items()})
+
+    def test_reminders_follow_reschedules_and_cancellations(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        appointment.datetime = self.slot + timedelta(days=1)
+        appointment.save()
+        self.assertEqual(self.due(appointment)['1h'], appointment.datetime - timedelta(hours=1))
+        appointment.status = 'Cancelled'
+        appointment.save()
+        self.assertEqual(self.due(appointment), {})
+
+    def test_only_the_last_overdue_reminder_is_kept(self):
+        soon = timezone.now() + timedelta(minutes=30)
+        appointment = Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=soon)
+        self.assertEqual(list(self.due(appointment)), ['1h'])
+
+    def test_due_reminders_are_queued_once(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        now = self.slot - timedelta(hours=12)
+        self.assertEqual(reminders.send_due(now=now), (1, 0))
+        self.assertEqual(reminders.send_due(now=now), (0, 0))
+        self.assertEqual(OutboundEmail.objects.get().recipients, ['patient@example.com'])
+        self.assertIsNotNone(appointment.reminders.get(kind='24h').sent_at)
+
+    def test_reminders_of_bulk_cancelled_appointments_are_skipped(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        Appointment.objects.filter(pk=appointment.pk).update(status='Cancelled')
+        self.assertEqual(reminders.send_due(now=self.slot - timedelta(minutes=30)), (0, 2))
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_migration_backfill_matches_the_module(self):
+        appointment = booking.book(self.patient, self.doctor, self.slot)
+        expected = self.due(appointment)
+        AppointmentReminder.objects.all().delete()
+        migration = importlib.import_module('OHC_System.migrations.0018_appointmentreminder')
+        migration.schedule_upcoming(apps, None)
+        self.assertEqual(self.due(appointment), expected)
+
+
+class RecordTestCase(MediaTestCase):
+    """Logs a patient in and keeps record text extraction out of the way."""
+
+    def setUp(self):
+        super().setUp()
+        self.patient = User.objects.create_user('patient', password='pw')
+        self.client.force_login(self.patient)
+        patcher = mock.patch.object(record_search._executor, 'submit')
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class RecordUploadTests(RecordTestCase):
+    CONTENT = b'0123456789' * 10
+    DETAILS = {'title': 'Blood test', 'date': '2026-01-05', 'record_type': 'Lab report', 'notes': ''}
+
+    def start(self, content=CONTENT, sha256=None):
+        response = self.client.post('/records/uploads/', {
+            'filename': 'blood.txt',
+            'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest() if sha256 is None else sha256,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+
+    def send(self, url, offset, chunk, sha256=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if sha256 is not None:
+            headers['HTTP_X_CHUNK_SHA256'] = sha256
+        return self.client.generic('PATCH', url, chunk, content_type='application/octet-stream', **headers)
+
+    def upload(self, url, content=CONTENT, chunk_size=40):
+        for offset in range(0, len(content), chunk_size):
+            chunk = content[offset:offset + chunk_size]
+            response = self.send(url, offset, chunk, hashlib.sha256(chunk).hexdigest())
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_chunks_are_assembled_into_a_record(self):
+        url = self.start()
+        self.assertEqual(self.upload(url).json(), {'offset': 100, 'size': 100})
+        response = self.client.post(url + 'complete/', self.DETAILS)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.CONTENT).hexdigest())
+        record = MedicalRecord.objects.get(pk=response.json()['id'])
+        self.assertEqual(record.user, self.patient)
+        with record.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+        self.assertFalse(RecordUpload.objects.exists())
+        self.assertEqual(default_storage.listdir(record_uploads.CHUNK_DIRECTORY)[1], [])
+
+    def test_chunk_for_the_wrong_offset_is_refused(self):
+        url = self.start()
+        self.send(url, 0, self.CONTENT[:40])
+        response = self.send(url, 60, self.CONTENT[60:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 40)
+
+    def test_chunk_past_the_end_is_refused(self):
+        url = self.start()
+        response = self.send(url, 0, self.CONTENT + b'extra')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_corrupted_chunk_is_not_acknowledged(self):
+        url = self.start()
+        response = self.send(url, 0, self.CONTENT[:40], hashlib.sha256(b'something else').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(RecordUpload.objects.get().chunks, [])
+
+    def test_incomplete_upload_cannot_be_completed(self):
+        url = self.start()
+        self.send(url, 0, self.CONTENT[:40])
+        self.assertEqual(self.client.post(url + 'complete/', self.DETAILS).status_code, 409)
+
+    def test_upload_is_completed_once(self):
+        url = self.start()
+        self.upload(url)
+        upload = RecordUpload.objects.get()
+        self.assertEqual(self.client.post(url + 'complete/', self.DETAILS).status_code, 201)
+        self.assertEqual(self.client.post(url + 'complete/', self.DETAILS).status_code, 404)
+        # A request that loaded the upload before the first one completed it.
+        with self.assertRaises(record_uploads.UploadError) as raised:
+            record_uploads.complete(upload, MedicalRecord(**self.DETAILS))
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(MedicalRecord.objects.count(), 1)
+
+    def test_file_not_matching_its_digest_is_refused(self):
+        url = self.start(sha256=hashlib.sha256(b'another file').hexdigest())
+        self.upload(url)
+        self.assertEqual(self.client.post(url + 'complete/', self.DETAILS).status_code, 422)
+        self.assertFalse(MedicalRecord.objects.exists())
+        self.assertTrue(RecordUpload.objects.exists())
+
+    def test_expired_uploads_are_purged(self):
+        url = self.start()
+        self.send(url, 0, self.CONTENT[:40])
+        chunk = RecordUpload.objects.get().chunks[0][2]
+        self.assertEqual(record_uploads.purge_expired(), 0)
+        self.assertEqual(record_uploads.purge_expired(now=timezone.now() + timedelta(hours=25)), 1)
+        self.assertFalse(RecordUpload.objects.exists())
+        self.assertFalse(default_storage.exists(chunk))
+
+
+class RecordBlobTests(RecordTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = record_storage.record_storage()
+        self.later = timezone.now() + record_storage.GC_GRACE * 2
+
+    def save_blob(self, content=b'scan'):
+        return self.storage.save('medical_records/scan.pdf', ContentFile(content))
+
+    def add_record(self, content=b'scan'):
+        return MedicalRecord.objects.create(
+            user=self.patient, title='Scan', date='2026-01-05', record_type='Imaging',
+            file=ContentFile(content, name='scan.pdf'),
+        )
+
+    def age(self, name):
+        """Make ``name`` look as if it was last saved before the grace period."""
+        then = timezone.now() - record_storage.GC_GRACE * 2
+        RecordBlob.objects.filter(name=name).update(updated_at=then)
+        os.utime(self.storage.path(name), (then.timestamp(), then.timestamp()))
+
+    def collect(self, **kwargs):
+        return record_storage.collect_garbage('medical_records', **kwargs)
+
+    def test_saved_blob_has_a_row_before_a_record_uses_it(self):
+        name = self.save_blob()
+        blob = RecordBlob.objects.get(name=name)
+        self.assertEqual((blob.size, blob.references), (4, 0))
+        record = self.add_record()
+        blob.refresh_from_db()
+        self.assertEqual((record.file.name, blob.size, blob.references), (name, 4, 1))
+
+    def test_shared_blob_outlives_one_of_its_records(self):
+        first, second = self.add_record(), self.add_record()
+        self.assertEqual(first.file.name, second.file.name)
+        first.delete()
+        self.assertEqual(self.collect(now=self.later), (0, 0))
+        self.assertTrue(self.storage.exists(second.file.name))
+
+    def test_unused_blob_is_collected_after_the_grace_period(self):
+        record = self.add_record()
+        name = record.file.name
+        record.delete()
+        self.assertEqual(self.collect(), (0, 0))
+        self.assertEqual(self.collect(now=self.later, dry_run=True), (1, 4))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.collect(now=self.later), (1, 4))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(RecordBlob.objects.exists())
+
+    def test_blob_saved_again_is_not_collected(self):
+        name = self.save_blob()
+        self.age(name)
+        # An upload of the same file lands before the collector gets to it.
+        self.assertEqual(self.save_blob(), name)
+        self.assertEqual(self.collect(now=timezone.now()), (0, 0))
+        self.assertTrue(self.storage.exists(name))
+
+    def test_blob_picked_up_after_the_query_is_kept(self):
+        name = self.save_blob()
+        self.age(name)
+        original_iterator = QuerySet.iterator
+
+        def iterator(queryset, *args, **kwargs):
+            for blob in original_iterator(queryset, *args, **kwargs):
+                # A record starts using the blob between the query and the delete.
+                record_storage.referenced(blob.name)
+                yield blob
+
+        with mock.patch.object(QuerySet, 'iterator', iterator):
+            self.assertEqual(self.collect(now=timezone.now()), (0, 0))
+        self.assertTrue(self.storage.exists(name))
+
+    def test_blob_without_a_row_is_collected(self):
+        name = self.save_blob()
+        self.age(name)
+        RecordBlob.objects.all().delete()
+        self.assertEqual(self.collect(now=timezone.now()), (1, 4))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(RecordBlob.objects.exists())
+
+
+class RecordDownloadTests(RecordTestCase):
+    CONTENT = b'0123456789'
+
+    def setUp(self):
+        super().setUp()
+        self.record = MedicalRecord.objects.create(
+            user=self.patient, title='Chest X-ray', date='2026-01-05', record_type='Imaging',
+            file=ContentFile(self.CONTENT, name='xray.png'),
+        )
+        self.url = f'/records/{self.record.pk}/file/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_patient_gets_the_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('chest-x-ray.png', response['Content-Disposition'])
+
+    def test_range_is_honoured(self):
+        response = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(self.body(self.get(HTTP_RANGE='bytes=-3')), b'789')
+
+    def test_unsatisfiable_range_is_refused(self):
+        response = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response = self.get(HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_cached_copy_is_revalidated(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_only_the_patient_and_their_doctors_may_download(self):
+        doctor = make_doctor()
+        self.client.force_login(doctor.user)
+        self.assertEqual(self.get().status_code, 403)
+        Appointment.objects.create(user=self.patient, doctor=doctor, datetime=next_slot())
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_missing_file_is_not_found(self):
+        self.record.file.storage.purge(self.record.file.name)
+        self.assertEqual(self.get().status_code, 404)
+
+    @override_settings(RECORD_DOWNLOAD_SERVER='nginx', RECORD_DOWNLOAD_INTERNAL_URL='/protected-media/')
+    def test_front_server_sends_the_bytes(self):
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.record.file.name)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response.content, b'')
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', password='pw')
+
+    def book(self, days=1, **fields):
+        return Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=next_slot(days=days), **fields)
+
+    def test_counts_only_active_appointments(self):
+        self.book(appointment_type='Consultation')
+        self.book(days=2, appointment_type='Follow-up')
+        self.book(days=3, status='Cancelled')
+        stats = dashboard_stats.get_stats(self.patient, False)
+        self.assertEqual((stats['appointments_count'], stats['consultations_count']), (2, 1))
+        self.assertEqual(len(stats['upcoming_appointments']), 2)
+        self.assertEqual(dashboard_stats.get_stats(self.doctor.user, True)['appointments_count'], 2)
+
+    def test_cached_numbers_need_no_queries(self):
+        dashboard_stats.get_stats(self.patient, False)
+        with self.assertNumQueries(0):
+            dashboard_stats.get_stats(self.patient, False)
+
+    def test_patient_and_doctor_entries_are_dropped_on_changes(self):
+        dashboard_stats.get_stats(self.patient, False)
+        dashboard_stats.get_stats(self.doctor.user, True)
+        appointment = self.book()
+        self.assertEqual(dashboard_stats.get_stats(self.patient, False)['appointments_count'], 1)
+        self.assertEqual(dashboard_stats.get_stats(self.doctor.user, True)['appointments_count'], 1)
+        appointment.delete()
+        self.assertEqual(dashboard_stats.get_stats(self.doctor.user, True)['appointments_count'], 0)
+
+    def test_moved_appointment_drops_the_previous_owners_entries(self):
+        appointment = self.book()
+        other_doctor = make_doctor('other')
+        other_patient = User.objects.create_user('other-patient', password='pw')
+        self.assertEqual(dashboard_stats.get_stats(self.patient, False)['appointments_count'], 1)
+        self.assertEqual(dashboard_stats.get_stats(self.doctor.user, True)['appointments_count'], 1)
+        appointment.doctor = other_doctor
+        appointment.user = other_patient
+        appointment.save()
+        self.assertEqual(dashboard_stats.get_stats(self.patient, False)['appointments_count'], 0)
+        self.assertEqual(dashboard_stats.get_stats(self.doctor.user, True)['appointments_count'], 0)
+        self.assertEqual(dashboard_stats.get_stats(other_patient, False)['appointments_count'], 1)
+        self.assertEqual(dashboard_stats.get_stats(other_doctor.user, True)['appointments_count'], 1)
+
+    def test_new_record_is_counted(self):
+        self.assertEqual(dashboard_stats.get_stats(self.patient, False)['records_count'], 0)
+        with mock.patch.object(record_search._executor, 'submit'):
+            MedicalRecord.objects.create(user=self.patient, title='Scan', date='2026-01-05', record_type='Imaging')
+        self.assertEqual(dashboard_stats.get_stats(self.patient, False)['records_count'], 1)
+
+
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.other_doctor = make_doctor('other-doctor')
+        self.patients = [User.objects.create_user(f'patient{i}', password='pw') for i in range(2)]
+        doctor_stats.get_stats(self.doctor)
+        doctor_stats.get_stats(self.other_doctor)
+
+    def book(self, patient, days=1, **fields):
+        fields.setdefault('appointment_type', 'Consultation')
+        return Appointment.objects.create(user=patient, doctor=self.doctor, datetime=next_slot(days=days), **fields)
+
+    def counters(self, doctor=None):
+        stats = DoctorStats.objects.get(doctor=doctor or self.doctor)
+        return stats.pending_consultations, stats.completed_sessions, stats.total_patients
+
+    def test_counters_follow_appointment_changes(self):
+        first = self.book(self.patients[0])
+        self.book(self.patients[0], days=2)
+        self.book(self.patients[1], days=3)
+        self.assertEqual(self.counters(), (3, 0, 2))
+        first.status = 'Completed'
+        first.save()
+        self.assertEqual(self.counters(), (2, 1, 2))
+        first.delete()
+        self.assertEqual(self.counters(), (2, 0, 2))
+
+    def test_patient_leaves_with_their_last_appointment(self):
+        appointment = self.book(self.patients[0])
+        appointment.delete()
+        self.assertEqual(self.counters(), (0, 0, 0))
+        self.assertFalse(DoctorPatient.objects.exists())
+
+    def test_moving_an_appointment_moves_the_counters(self):
+        appointment = self.book(self.patients[0])
+        appointment.doctor = self.other_doctor
+        appointment.save()
+        self.assertEqual(self.counters(), (0, 0, 0))
+        self.assertEqual(self.counters(self.other_doctor), (1, 0, 1))
+
+    def test_reconcile_repairs_bulk_updates(self):
+        self.book(self.patients[0])
+        Appointment.objects.update(status='Completed')
+        self.assertEqual(doctor_stats.reconcile(), [self.doctor.pk])
+        self.assertEqual(self.counters(), (0, 1, 1))
+        self.assertEqual(doctor_stats.reconcile(), [])
+
+    @override_settings(NO_SHOW_SWEEP_INTERVAL=0, APPOINTMENT_REMINDER_INTERVAL=0)
+    def test_dashboard_reads_the_counters(self):
+        self.book(self.patients[0])
+        self.client.force_login(self.doctor.user)
+        response = self.client.get('/doctor/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['pending_consultations_count'], 1)
+        self.assertEqual(response.context['total_patients_count'], 1)
+
+
+class PatientRosterTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.alice = User.objects.create_user('alice', first_name='Alice', password='pw')
+        self.bob = User.objects.create_user('bob', first_name='Bob', password='pw')
+        self.stranger = User.objects.create_user('stranger', password='pw')
+        self.visit(self.alice, -10, 'Completed')
+        self.visit(self.alice, -5, 'Completed')
+        self.visit(self.alice, 2)
+        self.visit(self.bob, -3, 'Cancelled')
+        Prescription.objects.create(user=self.bob, doctor=self.doctor, diagnosis='Flu', medications='Rest')
+
+    def visit(self, patient, days, status='Scheduled'):
+        return Appointment.objects.create(user=patient, doctor=self.doctor, datetime=next_slot(days=days), status=status)
+
+    def roster(self, **kwargs):
+        return {patient.username: patient for patient in roster.patient_roster(self.doctor, **kwargs)}
+
+    def test_rows_carry_the_patient_numbers(self):
+        patients = self.roster()
+        self.assertEqual(set(patients), {'alice', 'bob'})
+        alice, bob = patients['alice'], patients['bob']
+        self.assertEqual((alice.visits, alice.last_visit, alice.next_visit), (2, next_slot(days=-5), next_slot(days=2)))
+        self.assertEqual((bob.visits, bob.last_visit, bob.next_visit, bob.active_prescriptions), (0, None, None, 1))
+
+    def test_filters(self):
+        self.assertEqual(set(self.roster(query='ali')), {'alice'})
+        self.assertEqual(set(self.roster(upcoming_only=True)), {'alice'})
+        self.assertEqual(set(self.roster(with_prescriptions=True)), {'bob'})
+
+    def test_page_costs_the_same_for_more_patients(self):
+        self.client.force_login(self.doctor.user)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/doctor/patients/', {'sort': 'visits'})
+        for i in range(5):
+            self.visit(User.objects.create_user(f'extra{i}', password='pw'), -1, 'Completed')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/doctor/patients/', {'sort': 'visits'})
+        self.assertEqual(len(response.context['patients']), 7)
+        self.assertEqual(len(many), len(few))
+
+
+class DoctorDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cardiologist = make_doctor('ann', consultation_fee=40, experience_years=12)
+        self.surgeon = make_doctor(
+            'ben', specialization='Surgery', consultation_fee=150, experience_years=3,
+            available_from=time(13), available_to=time(17),
+        )
+        self.retired = make_doctor('cal', consultation_fee=80, experience_years=30, is_available=False)
+
+    def names(self, doctors):
+        return sorted(doctor.user.username for doctor in doctors)
+
+    def test_filters_combine(self):
+        self.assertEqual(self.names(directory.search(specialization='Cardiology')), ['ann', 'cal'])
+        self.assertEqual(self.names(directory.search(query='sur')), ['ben'])
+        self.assertEqual(self.names(directory.search(fee_band=0)), ['ann'])
+        self.assertEqual(self.names(directory.search(specialization='Cardiology', experience_band=3)), ['cal'])
+
+    def test_free_at_asks_the_slot_engine(self):
+        self.assertEqual(self.names(directory.search(available_at=next_slot(hour=10))), ['ann'])
+        booking.book(User.objects.create_user('patient', password='pw'), self.cardiologist, next_slot(hour=14))
+        self.assertEqual(self.names(directory.search(available_at=next_slot(hour=14))), ['ben'])
+
+    def test_facets_are_cached_until_a_doctor_changes(self):
+        specializations = {row['specialization']: row['count'] for row in directory.get_facets()['specializations']}
+        self.assertEqual(specializations, {'Cardiology': 2, 'Surgery': 1})
+        with self.assertNumQueries(0):
+            directory.get_facets()
+        self.surgeon.consultation_fee = 20
+        self.surgeon.save()
+        self.assertEqual([band['count'] for band in directory.get_facets()['fees']], [2, 1, 0, 0])
+
+    def test_directory_page_lists_matches_and_facets(self):
+        response = self.client.get('/doctors/', {'specialization': 'Cardiology', 'fee': '0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'online_health_consultation/doctors.html')
+        self.assertEqual([doctor.pk for doctor in response.context['doctors']], [self.cardiologist.pk])
+        self.assertContains(response, 'Surgery')
+
+    def test_autocomplete_offers_bookable_doctors(self):
+        self.client.force_login(User.objects.create_user('patient', password='pw'))
+        results = self.client.get('/doctors/autocomplete/', {'q': 'c'}).json()['results']
+        self.assertEqual([result['id'] for result in results], [self.cardiologist.pk])
+
+
+def rollup_rows():
+    return set(AppointmentRollup.objects.values_list(
+        'period', 'period_start', 'doctor_id', 'appointment_type', 'status', 'count',
+    ))
+
+
+class NoShowSweepTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        doctor_stats.get_stats(self.doctor)
+        self.patient = User.objects.create_user('patient', password='pw')
+        self.now = timezone.now()
+
+    def add(self, when, status='Scheduled'):
+        return Appointment.objects.create(
+            user=self.patient, doctor=self.doctor, datetime=when, status=status, appointment_type='Consultation',
+        )
+
+    def test_only_overdue_active_appointments_are_marked(self):
+        overdue = self.add(self.now - timedelta(days=2))
+        confirmed = self.add(self.now - timedelta(hours=3), 'Confirmed')
+        within_grace = self.add(self.now - timedelta(minutes=10))
+        completed = self.add(self.now - timedelta(days=3), 'Completed')
+        upcoming = self.add(self.now + timedelta(days=1))
+        self.assertEqual(no_shows.sweep(now=self.now), 2)
+        statuses = dict(Appointment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[overdue.pk], 'No-show')
+        self.assertEqual(statuses[confirmed.pk], 'No-show')
+        self.assertEqual(
+            [statuses[a.pk] for a in (within_grace, completed, upcoming)], ['Scheduled', 'Completed', 'Scheduled'],
+        )
+        self.assertEqual(no_shows.sweep(now=self.now), 0)
+
+    def test_counters_and_rollups_stay_in_step(self):
+        for days in range(1, 6):
+            self.add(self.now - timedelta(days=days))
+        self.add(self.now + timedelta(days=1))
+        progress = []
+        self.assertEqual(no_shows.sweep(batch_size=2, now=self.now, progress=lambda *args: progress.append(args)), 5)
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(DoctorStats.objects.get(doctor=self.doctor).pending_consultations, 1)
+        self.assertEqual(doctor_stats.reconcile(), [])
+        swept = rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(rollup_rows(), swept)
+
+
+@override_settings(EMAIL_OUTBOX_INTERVAL=0)
+class OutboxTests(TestCase):
+    def enqueue(self, **fields):
+        fields = {'subject': 'Hello', 'recipients': ['patient@example.com'], 'body': 'Text', **fields}
+        return outbox.enqueue(**fields)
+
+    def test_queued_email_is_delivered_once(self):
+        email = self.enqueue(html_body='<p>Text</p>')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(outbox.deliver(), (1, 0))
+        self.assertEqual(outbox.deliver(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('Sent', 1))
+
+    def test_failing_email_backs_off_then_gives_up(self):
+        email = self.enqueue()
+        failing = mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('refused'))
+        with failing, self.assertLogs('OHC_System.outbox', 'ERROR'):
+            for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+                self.assertEqual(outbox.deliver(), (0, 1))
+                email.refresh_from_db()
+                self.assertEqual(email.attempts, attempt)
+                if attempt < outbox.MAX_ATTEMPTS:
+                    self.assertEqual(email.status, 'Pending')
+                    self.assertGreater(email.next_attempt_at, timezone.now() + outbox.retry_delay(attempt) / 2)
+                    OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual((email.status, email.last_error), ('Failed', 'OSError: refused'))
+
+        self.assertEqual(outbox.requeue(OutboundEmail.objects.all()), 1)
+        self.assertEqual(outbox.deliver(), (1, 0))
+
+    def test_claimed_email_is_left_to_its_worker(self):
+        self.enqueue()
+        claimed = outbox._claim(10, timezone.now())
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(outbox.deliver(), (0, 0))
+
+
+def at(day, hour=10):
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+class AppointmentRollupTests(TestCase):
+    MONDAY = date(2026, 3, 2)
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', password='pw')
+
+    def add(self, day, status='Completed', appointment_type='Consultation'):
+        return Appointment.objects.create(
+            user=self.patient, doctor=self.doctor, datetime=at(day), status=status, appointment_type=appointment_type,
+        )
+
+    def test_changes_match_a_rebuild(self):
+        first = self.add(self.MONDAY)
+        second = self.add(self.MONDAY + timedelta(days=1), 'Scheduled')
+        self.add(self.MONDAY + timedelta(days=8))
+        second.status = 'Cancelled'
+        second.datetime = at(self.MONDAY + timedelta(days=9))
+        second.save()
+        first.delete()
+        maintained = rollup_rows()
+        self.assertEqual(rollups.rebuild(), 2)
+        self.assertEqual(rollup_rows(), maintained)
+
+    def test_report_groups_days_into_weeks(self):
+        self.add(self.MONDAY)
+        self.add(self.MONDAY + timedelta(days=6), 'Cancelled')
+        self.add(self.MONDAY + timedelta(days=7))
+        weeks = list(rollups.report('week', self.MONDAY, self.MONDAY + timedelta(days=13), ['status']))
+        self.assertEqual([(row['period_start'], row['status'], row['appointments']) for row in weeks], [
+            (self.MONDAY, 'Cancelled', 1),
+            (self.MONDAY, 'Completed', 1),
+            (self.MONDAY + timedelta(days=7), 'Completed', 1),
+        ])
+
+    def test_report_view_is_for_staff(self):
+        self.add(self.MONDAY)
+        params = {'period': 'day', 'start': '2026-03-01', 'end': '2026-03-07', 'group': 'doctor'}
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get('/reports/appointments/', params).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        rows = self.client.get('/reports/appointments/', params).json()['rows']
+        self.assertEqual(rows, [
+            {'period_start': '2026-03-02', 'doctor': self.doctor.pk, 'doctor_name': 'doctor', 'appointments': 1},
+        ])
+        self.assertEqual(self.client.get('/reports/appointments/', {**params, 'period': 'year'}).status_code, 400)
+
+
+class RevenueReportTests(TestCase):
+    MONDAY = AppointmentRollupTests.MONDAY
+
+    def setUp(self):
+        self.doctor = make_doctor(consultation_fee=Decimal('50.00'))
+        patient = User.objects.create_user('patient', password='pw')
+        for status in ('Completed', 'Completed', 'No-show', 'Cancelled'):
+            Appointment.objects.create(user=patient, doctor=self.doctor, datetime=at(self.MONDAY), status=status)
+
+    def test_day_row(self):
+        [row] = revenue.rows('day', self.MONDAY, self.MONDAY)
+        self.assertEqual(row['completed_sessions'], 2)
+        self.assertEqual(row['revenue'], Decimal('100.00'))
+        self.assertEqual((row['booked_hours'], row['capacity_hours']), (Decimal('1.50'), Decimal('8.00')))
+        self.assertEqual(row['utilisation'], Decimal('0.188'))
+
+    def test_week_covers_the_whole_week(self):
+        [row] = revenue.rows('week', self.MONDAY + timedelta(days=3), self.MONDAY + timedelta(days=3))
+        self.assertEqual((row['period_start'], row['capacity_hours']), (self.MONDAY, Decimal('56.00')))
+
+    def test_report_streams_csv(self):
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        response = self.client.get('/reports/revenue/', {'period': 'day', 'start': '2026-03-02', 'end': '2026-03-02'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(revenue.COLUMNS))
+        self.assertEqual(lines[1], f'2026-03-02,{self.doctor.pk},doctor,Cardiology,50.00,2,100.00,1.50,8.00,0.188')
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = User.objects.create_user('patient', first_name='Pat', last_name='Lee', password='pw')
+        self.appointment = Appointment.objects.create(
+            user=self.patient, doctor=self.doctor, datetime=next_slot(), symptoms='Headache; dizziness',
+        )
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=next_slot(days=2), status='Cancelled')
+
+    def feed(self, user, **headers):
+        response = self.client.get(f'/calendar/{ical.get_token(user.profile)}.ics', **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def text(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_patient_feed_lists_active_appointments(self):
+        text = self.text(self.feed(self.patient))
+        self.assertEqual(text.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:appointment-{self.appointment.pk}@testserver\r\n', text)
+        self.assertIn('DESCRIPTION:Headache\\; dizziness\r\n', text)
+        self.assertIn('STATUS:TENTATIVE\r\n', text)
+
+    def test_doctor_feed_names_the_patient(self):
+        self.assertIn('SUMMARY:Consultation: Pat Lee\r\n', self.text(self.feed(self.doctor.user)))
+
+    def test_unchanged_feed_is_not_sent_again(self):
+        etag = self.feed(self.patient)['ETag']
+        self.assertEqual(self.feed(self.patient, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.appointment.status = 'Confirmed'
+        self.appointment.save()
+        response = self.feed(self.patient, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:CONFIRMED', self.text(response))
+
+    def test_renamed_patient_changes_the_doctors_feed(self):
+        etag = self.feed(self.doctor.user)['ETag']
+        self.patient.first_name = 'Patricia'
+        self.patient.save()
+        response = self.feed(self.doctor.user, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('SUMMARY:Consultation: Patricia Lee\r\n', self.text(response))
+
+    def test_renamed_doctor_changes_the_patients_feed(self):
+        etag = self.feed(self.patient)['ETag']
+        User.objects.filter(pk=self.doctor.user_id).update(first_name='Ada', last_name='Park')
+        response = self.feed(self.patient, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Consultation with Dr. Ada Park', self.text(response))
+
+    def test_swapped_appointment_changes_the_feed(self):
+        older = Appointment.objects.create(
+            user=self.patient, doctor=self.doctor, datetime=next_slot(days=3), status='Cancelled',
+        )
+        etag = self.feed(self.patient)['ETag']
+        # The count and the latest updated_at stay the same.
+        Appointment.objects.filter(pk=older.pk).update(status='Scheduled', updated_at=self.appointment.updated_at)
+        self.appointment.delete()
+        self.assertEqual(self.feed(self.patient, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_reset_token_revokes_the_old_url(self):
+        old = ical.get_token(self.patient.profile)
+        ical.reset_token(self.patient.profile)
+        self.assertEqual(self.client.get(f'/calendar/{old}.ics').status_code, 404)
+
+    def test_long_lines_are_folded(self):
+        self.appointment.symptoms = 'é' * 100
+        self.appointment.save()
+        lines = self.text(self.feed(self.patient)).split('\r\n')
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        description = next(i for i, line in enumerate(lines) if line.startswith('DESCRIPTION:'))
+        unfolded = lines[description] + ''.join(line[1:] for line in lines[description + 1:description + 3])
+        self.assertEqual(unfolded, 'DESCRIPTION:' + 'é' * 100)
+
+
+class HealthExportTests(RecordTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doctor = make_doctor()
+        self.record = MedicalRecord.objects.create(
+            user=self.patient, title='Chest X-ray', date='2026-01-05', record_type='Imaging',
+            file=ContentFile(b'x-ray bytes', name='xray.png'),
+        )
+        Prescription.objects.create(user=self.patient, doctor=self.doctor, diagnosis='Flu', medications='Rest')
+
+    def archive(self, url='/records/export/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive_holds_files_tables_and_manifest(self):
+        archive = self.archive()
+        name = f'records/{self.record.pk}-chest-x-ray.png'
+        self.assertEqual(archive.read(name), b'x-ray bytes')
+        self.assertEqual(archive.getinfo(name).compress_type, zipfile.ZIP_STORED)
+        records = archive.read('records.csv').decode().splitlines()
+        self.assertTrue(records[1].endswith(',' + name))
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual(manifest['tables'], {'records.csv': 1, 'prescriptions.csv': 1, 'appointments.csv': 0})
+        self.assertEqual(manifest['missing_files'], [])
+        self.assertIsNone(archive.testzip())
+
+    def test_missing_file_is_listed_not_fatal(self):
+        self.record.file.storage.purge(self.record.file.name)
+        archive = self.archive()
+        self.assertEqual(json.loads(archive.read('manifest.json'))['missing_files'], [self.record.pk])
+        self.assertTrue(archive.read('records.csv').decode().splitlines()[1].endswith(','))
+
+    def test_doctor_exports_only_their_patients(self):
+        url = f'/doctor/patients/{self.patient.pk}/export/'
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        Appointment.objects.create(user=self.patient, doctor=self.doctor, datetime=next_slot())
+        self.assertEqual(self.archive(url).read(f'records/{self.record.pk}-chest-x-ray.png'), b'x-ray bytes')
+
+
+class RecordSearchTests(RecordTestCase):
+    def add(self, title, content=b'', name='report.txt', user=None, **fields):
+        fields = {'date': '2026-01-05', 'record_type': 'Lab report', **fields}
+        with self.captureOnCommitCallbacks(execute=True):
+            return MedicalRecord.objects.create(
+                user=user or self.patient, title=title, file=ContentFile(content, name=name), **fields,
+            )
+
+    def titles(self, query, user=None):
+        return [record.title for record in record_search.search(user or self.patient, query)]
+
+    def test_details_now_and_file_text_once_extracted(self):
+        record = self.add('Blood test', b'Haemoglobin within range; ferritin low.')
+        self.assertEqual(self.titles('blood'), ['Blood test'])
+        self.assertEqual(self.titles('ferritin'), [])
+        self.assertEqual(self.submit.call_count, 1)
+        self.assertTrue(record_search.extract_and_index(record))
+        [found] = record_search.search(self.patient, 'ferritin')
+        self.assertIn('ferritin', found.search_snippet.lower())
+
+    def test_records_matching_more_terms_rank_first(self):
+        for record in (self.add('Ferritin', b'iron'), self.add('Iron and ferritin', b'iron panel')):
+            record_search.extract_and_index(record)
+        self.assertEqual(self.titles('iron ferritin panel'), ['Iron and ferritin', 'Ferritin'])
+
+    def test_other_patients_records_are_not_searched(self):
+        self.add('Blood test', user=User.objects.create_user('other', password='pw'))
+        self.assertEqual(self.titles('blood'), [])
+
+    def test_editing_details_reuses_the_extracted_text(self):
+        record = self.add('Blood test', b'ferritin low')
+        record_search.extract_and_index(record)
+        record.title = 'Iron study'
+        with self.captureOnCommitCallbacks(execute=True):
+            record.save()
+        self.assertEqual(self.submit.call_count, 1)
+        self.assertEqual(self.titles('iron'), ['Iron study'])
+        self.assertEqual(self.titles('ferritin'), ['Iron study'])
+
+    def test_unreadable_file_still_indexes_the_details(self):
+        record = self.add('Blood test', b'ferritin low')
+        record.file.storage.purge(record.file.name)
+        with self.assertLogs('OHC_System.record_search', 'WARNING'):
+            self.assertFalse(record_search.extract_and_index(record))
+        self.assertEqual(self.titles('blood'), ['Blood test'])
+
+    @skipIf(record_search.PdfReader is None, 'pypdf is not installed')
+    def test_corrupt_pdf_is_not_extracted_again(self):
+        record = self.add('Blood test', b'%PDF-1.4 truncated', name='blood.pdf')
+        with self.assertLogs('OHC_System.record_search', 'WARNING'):
+            self.assertTrue(record_search.extract_and_index(record))
+        self.assertEqual(RecordText.objects.get(record=record).content, '')
+        self.assertEqual(self.titles('blood'), ['Blood test'])
+        record.title = 'Iron study'
+        with self.captureOnCommitCallbacks(execute=True):
+            record.save()
+        self.assertEqual(self.submit.call_count, 1)
+        self.assertEqual(self.titles('iron'), ['Iron study'])
+
+    def test_records_page_searches(self):
+        record_search.extract_and_index(self.add('Blood test', b'ferritin low'))
+        self.add('Chest X-ray', name='xray.png')
+        response = self.client.get('/records/', {'q': 'ferritin'})
+        self.assertEqual([record.title for record in response.context['records']], ['Blood test'])
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user('author', password='pw')
+        self.articles = [
+            HealthArticle.objects.create(title=f'Article {i}', content='Body', author=author) for i in range(3)
+        ]
+        patcher = mock.patch.object(view_counter, '_start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(view_counter._pending.clear)
+
+    def record(self, article, views):
+        for _ in range(views):
+            view_counter.record_view(article.pk)
+
+    def views(self):
+        return [HealthArticle.objects.get(pk=article.pk).views for article in self.articles]
+
+    def test_flush_groups_articles_by_increment(self):
+        first, second, third = self.articles
+        self.record(first, 2)
+        self.record(second, 2)
+        self.record(third, 5)
+        self.assertEqual(view_counter.pending_views(third.pk), 5)
+        updated_at = HealthArticle.objects.get(pk=first.pk).updated_at
+        snapshot_key = article_facets._snapshot_key()
+        # One UPDATE for the articles seen twice, one for the article seen five times.
+        with self.assertNumQueries(2):
+            self.assertEqual(view_counter.flush(), 3)
+        self.assertEqual(self.views(), [2, 2, 5])
+        self.assertEqual(view_counter.pending_views(), {})
+        self.assertEqual(article_facets._snapshot_key(), snapshot_key)
+        self.assertEqual(HealthArticle.objects.get(pk=first.pk).updated_at, updated_at)
+        with self.assertNumQueries(0):
+            self.assertEqual(view_counter.flush(), 0)
+
+    def test_failed_flush_keeps_the_views(self):
+        self.record(self.articles[0], 3)
+        with mock.patch.object(QuerySet, 'update', side_effect=RuntimeError('database gone')):
+            with self.assertRaises(RuntimeError):
+                view_counter.flush()
+        self.record(self.articles[0], 1)
+        view_counter.flush()
+        self.assertEqual(self.views(), [4, 0, 0])
+
+    def test_views_left_at_exit_are_flushed(self):
+        self.record(self.articles[1], 1)
+        view_counter._flush_on_exit()
+        self.assertEqual(self.views(), [0, 1, 0])
+
+    def test_displayed_counts_include_buffered_views(self):
+        self.record(self.articles[2], 4)
+        popular = view_counter.popular_articles(limit=1)
+        self.assertEqual([(article.pk, article.views) for article in popular], [(self.articles[2].pk, 4)])
+
+
+class ArticleSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pw')
+        self.heart = Category.objects.create(name='Heart')
+        self.add('Blood pressure basics', 'How <b>salt</b> raises blood pressure.', category=self.heart)
+        self.add('Healthy sleep', 'Sleep lowers stress and blood sugar.')
+        self.add('Diet and sugar', 'Cutting sugar helps diabetes.')
+
+    def add(self, title, content, **fields):
+        return HealthArticle.objects.create(title=title, content=content, author=self.author, **fields)
+
+    def titles(self, query, **kwargs):
+        return [article.title for article in search.search(query, **kwargs)]
+
+    def test_tokenizer(self):
+        self.assertEqual(search.tokenize('<p>The Heart-Rate of a 5K runner</p>'), ['heart', 'rate', '5k', 'runner'])
+        self.assertEqual(search.tokenize(None), [])
+
+    def test_index_follows_edits(self):
+        article = HealthArticle.objects.get(title='Healthy sleep')
+        article.content = 'Naps help.'
+        article.save()
+        terms = set(ArticleSearchTerm.objects.filter(article=article).values_list('term', flat=True))
+        self.assertEqual(terms, {'healthy', 'sleep', 'naps', 'help'})
+        self.assertEqual(self.titles('stress'), [])
+
+    def test_more_matched_terms_then_field_weight_rank_first(self):
+        self.assertEqual(self.titles('blood sugar'), ['Healthy sleep', 'Blood pressure basics', 'Diet and sugar'])
+        self.assertEqual(self.titles('sugar'), ['Diet and sugar', 'Healthy sleep'])
+        self.assertEqual(self.titles('blood', category='heart'), ['Blood pressure basics'])
+        self.assertEqual(self.titles('the and'), [])
+
+    def test_snippet_marks_matches_and_escapes_text(self):
+        [article] = search.search('salt')
+        self.assertIn('<mark>salt</mark>', article.search_snippet)
+        self.assertNotIn('<b>', article.search_snippet)
+
+    def test_api_returns_ranked_json(self):
+        response = self.client.get('/articles/search/', {'q': 'sugar', 'limit': 1})
+        results = response.json()['results']
+        self.assertEqual([result['title'] for result in results], ['Diet and sugar'])
+        self.assertEqual(self.client.get('/articles/search/', {'q': 'sugar', 'limit': 'x'}).status_code, 400)
+
+    def test_admin_finds_what_the_site_finds(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        for query in ('blood sugar', 'salt', 'stress diabetes'):
+            response = self.client.get('/admin/OHC_System/healtharticle/', {'q': query})
+            found = {article.title for article in response.context['cl'].result_list}
+            self.assertEqual(found, set(self.titles(query)), query)
+
+
+class KeysetPaginationTests(TestCase):
+    VISITS = [date(2026, 5, 1), date(2026, 5, 1), None, date(2026, 4, 2), None, date(2026, 5, 1), date(2026, 6, 3)]
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.doctor = make_doctor()
+        patient = User.objects.create_user('patient', password='pw')
+        self.prescriptions = [
+            Prescription.objects.create(
+                user=patient, doctor=self.doctor, diagnosis='Flu', medications='Rest', next_visit=next_visit,
+            )
+            for next_visit in self.VISITS
+        ]
+
+    def page(self, queryset, ordering, cursor=None, per_page=2, **params):
+        if cursor:
+            params['cursor'] = cursor
+        return paginate(self.factory.get('/', params), queryset, ordering, per_page=per_page)
+
+    def walk(self, queryset, ordering, per_page=2):
+        """The pks of every page walking forward, and walking back again from the last page."""
+        forward, page = [], self.page(queryset, ordering, per_page=per_page)
+        forward.append([obj.pk for obj in page])
+        while page.has_next:
+            page = self.page(queryset, ordering, page.next_cursor, per_page)
+            forward.append([obj.pk for obj in page])
+        backward = []
+        while page.has_previous:
+            page = self.page(queryset, ordering, page.previous_cursor, per_page)
+            backward.insert(0, [obj.pk for obj in page])
+        return forward, backward + forward[-1:]
+
+    def expected(self, descending):
+        def key(prescription):
+            visit = prescription.next_visit
+            value = 0 if visit is None else visit.toordinal()
+            return (visit is None, -value if descending else value, -prescription.pk if descending else prescription.pk)
+        return [prescription.pk for prescription in sorted(self.prescriptions, key=key)]
+
+    def test_walks_over_ties_and_nulls_both_ways(self):
+        queryset = Prescription.objects.all()
+        for ordering, descending in ((('next_visit', 'id'), False), (('-next_visit', '-id'), True)):
+            forward, backward = self.walk(queryset, ordering)
+            self.assertEqual(sum(forward, []), self.expected(descending), ordering)
+            self.assertEqual(backward, forward, ordering)
+            self.assertTrue(all(len(pks) == 2 for pks in forward[:-1]))
+
+    def test_bad_cursors_give_the_first_page(self):
+        queryset = Prescription.objects.all()
+        ordering = ('next_visit', 'id')
+        first = [obj.pk for obj in self.page(queryset, ordering)]
+        token = self.page(queryset, ordering).next_cursor
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        short = signing.dumps(['next', [1]], salt=CURSOR_SALT)
+        for cursor in (tampered, 'garbage', short, signing.dumps(['sideways', [None, 1]], salt=CURSOR_SALT)):
+            page = self.page(queryset, ordering, cursor)
+            self.assertEqual([obj.pk for obj in page], first, cursor)
+            self.assertFalse(page.has_previous)
+
+    def test_page_links_keep_other_parameters(self):
+        page = self.page(Prescription.objects.all(), ('next_visit', 'id'), q='flu')
+        self.assertEqual(QueryDict(page.next_querystring)['q'], 'flu')
+        self.assertEqual(page.previous_querystring, '')
+
+    def test_annotation_keys(self):
+        now = timezone.now()
+        # Patients without an upcoming visit tie on a NULL key.
+        for i, days in enumerate((3, None, 2, 1, None)):
+            patient = User.objects.create_user(f'roster{i}', password='pw')
+            if days is None:
+                Appointment.objects.create(user=patient, doctor=self.doctor, datetime=now - timedelta(days=1, hours=i))
+            else:
+                Appointment.objects.create(user=patient, doctor=self.doctor, datetime=now + timedelta(days=days))
+        patients = roster.patient_roster(self.doctor)
+        forward, backward = self.walk(patients, roster.SORTS['upcoming'])
+        self.assertEqual(backward, forward)
+        pks = sum(forward, [])
+        next_visits = {patient.pk: patient.next_visit for patient in patients}
+        self.assertEqual(len(pks), 5)
+        self.assertEqual(
+            pks, sorted(pks, key=lambda pk: (next_visits[pk] is None, next_visits[pk] or now, pk)),
+        )
@@ -20,15 +20,28 @@ urlpatterns = [
     path('consultation/', views.book_consultation, name='book_consultation'),
     path('appointments/', views.appointments, name='appointments'),
     path('appointments/book/', views.book_appointment, name='book_appointment'),
+    path('appointments/slots/', views.appointment_slots_api, name='appointment_slots_api'),
     path('appointments/cancel/<int:appointment_id>/', views.cancel_appointment, name='cancel_appointment'),
+    path('doctors/', views.doctor_directory, name='doctor_directory'),
+    path('doctors/autocomplete/', views.doctor_autocomplete, name='doctor_autocomplete'),
+
+    # Reports
+    path('reports/appointments/', views.appointment_report, name='appointment_report'),
+    path('reports/revenue/', views.revenue_report, name='revenue_report'),
     
     # Medical Records & Prescriptions
     
     # Articles & Resources
     path('articles/', views.health_articles, name='articles'),
+    path('articles/search/', views.article_search_api, name='article_search_api'),
     path('articles/<slug:slug>/', views.article_detail, name='article_detail'),
     path('records/', views.medical_records, name='records'),
     path('records/upload/', views.upload_record, name='upload_record'),
+    path('records/export/', views.export_health_file, name='export_health_file'),
+    path('records/<int:record_id>/file/', views.download_record, name='download_record'),
+    path('records/uploads/', views.start_record_upload, name='start_record_upload'),
+    path('records/uploads/<uuid:upload_id>/', views.record_upload, name='record_upload'),
+    path('records/uploads/<uuid:upload_id>/complete/', views.complete_record_upload, name='complete_record_upload'),
     path('prescriptions/', views.prescriptions, name='prescriptions'),
     path('prescriptions/<int:prescription_id>/', views.prescription_detail, name='prescription_detail'),
     
@@ -45,7 +58,10 @@ urlpatterns = [
     path('doctor/prescriptions/<int:appointment_id>/write/', views.write_prescription, name='write_prescription'),
     path('doctor/consultations/', views.doctor_consultations, name='doctor_consultations'),
     path('doctor/patients/', views.doctor_patients, name='doctor_patients'),
+    path('doctor/patients/autocomplete/', views.patient_autocomplete, name='patient_autocomplete'),
+    path('doctor/patients/<int:patient_id>/export/', views.export_patient_health_file, name='export_patient_health_file'),
     
     # User Profile & Settings
     path('profile/settings/', views.profile_settings, name='profile_settings'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
 ]
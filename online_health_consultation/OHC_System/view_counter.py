@@ -0,0 +1,120 @@
+"""
+Buffered view counting for health articles.
+
+Article hits are collected in an in-process buffer and written back in
+batches as ``UPDATE ... SET views = views + n`` statements, so a page view
+never rewrites the whole article row (or bumps ``updated_at``) and
+concurrent hits can't lose increments to a read-modify-write race.
+
+A daemon thread flushes the buffer every ``ARTICLE_VIEW_FLUSH_INTERVAL``
+seconds, and whatever is left is flushed when the process exits.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_flusher = None
+
+
+def _flush_interval():
+    return getattr(settings, 'ARTICLE_VIEW_FLUSH_INTERVAL', 30)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(_flush_interval())
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception('Failed to flush article views')
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name='article-view-flusher', daemon=True)
+        _flusher.start()
+
+
+def record_view(article_id):
+    """Buffer one view of an article."""
+    with _lock:
+        _pending[article_id] += 1
+        _start_flusher()
+
+
+def pending_views(article_id=None):
+    """Return buffered views for one article, or a copy of the whole buffer."""
+    with _lock:
+        if article_id is not None:
+            return _pending.get(article_id, 0)
+        return dict(_pending)
+
+
+def flush():
+    """Write buffered views to the database and return the number of rows updated."""
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+    if not batch:
+        return 0
+
+    from .models import HealthArticle
+
+    # One UPDATE per distinct increment rather than one per article.
+    by_delta = defaultdict(list)
+    for article_id, delta in batch.items():
+        by_delta[delta].append(article_id)
+
+    updated = 0
+    try:
+        for delta, ids in by_delta.items():
+            updated += HealthArticle.objects.filter(pk__in=ids).update(views=F('views') + delta)
+    except Exception:
+        # Put the counts back so they are retried on the next flush.
+        with _lock:
+            for article_id, delta in batch.items():
+                _pending[article_id] += delta
+        raise
+
+    from . import article_facets
+    article_facets.invalidate_popular()
+    return updated
+
+
+def with_pending_views(articles):
+    """Add buffered views to each article's ``views`` for display."""
+    pending = pending_views()
+    articles = list(articles)
+    for article in articles:
+        article.views += pending.get(article.pk, 0)
+    return articles
+
+
+def popular_articles(limit=5, facets=None):
+    """Return the most viewed articles, counting views not yet flushed."""
+    from . import article_facets
+
+    facets = facets or article_facets.get_facets()
+    articles = with_pending_views(facets['popular'])
+    articles.sort(key=lambda a: a.views, reverse=True)
+    return articles[:limit]
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        pass
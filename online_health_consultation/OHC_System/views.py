@@ -1,5 +1,9 @@
+import csv
+from itertools import chain
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, authenticate
@@ -8,23 +12,40 @@ from django.views.decorators.csrf import csrf_protect
 from django.middleware.csrf import get_token, rotate_token
 from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
 from django import forms
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
+from django.views.decorators.http import require_http_methods, require_POST
 from django.middleware.csrf import get_token
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
 from .models import (
     Profile, Doctor, Appointment, MedicalRecord, 
-    Prescription, HealthArticle
+    Prescription, HealthArticle, RecordUpload
 )
 from .forms import (
     UserRegistrationForm, ProfileUpdateForm, UserUpdateForm,
-    AppointmentForm, MedicalRecordForm, EmergencyContactForm, PrescriptionForm
+    AppointmentForm, MedicalRecordForm, EmergencyContactForm, PrescriptionForm,
+    SearchDoctorForm, RecordDetailsForm,
 )
-
+from . import article_facets, booking, dashboard_stats, directory, doctor_stats, health_export, ical, images, no_shows, outbox, patient_lookup, record_downloads, record_search, record_uploads, reminders, revenue, rollups, roster, search, slots, view_counter
+from .conditional import articles_last_modified, conditional_page
+from .pagination import paginate
+
+ARTICLE_SEARCH_LIMIT = 50
+RECORD_SEARCH_LIMIT = 50
+ARTICLES_PER_PAGE = 10
+PATIENTS_PER_PAGE = 25
+DOCTORS_PER_PAGE = 20
+SLOT_SEARCH_MAX_DAYS = 31
+REPORT_DEFAULT_DAYS = 30
+
+@conditional_page(articles_last_modified)
 def home(request):
     """Render the home page of the Online Health Consultation System."""
-    articles = HealthArticle.objects.filter(featured=True)[:3]
+    articles = article_facets.get_facets()['featured']
     return render(request, 'online_health_consultation/home.html', {'featured_articles': articles})
 
 @login_required
@@ -43,6 +64,7 @@ def delete_profile_photo(request):
     if request.method == 'POST':
         profile = request.user.profile
         if profile.profile_picture:
+            images.delete_derivatives(profile.profile_picture)
             profile.profile_picture.delete()  # Delete the actual file
             profile.profile_picture = None    # Clear the field
             profile.save()
@@ -307,42 +329,18 @@ def user_logout(request):
 def dashboard(request):
     """Render the user's dashboard with all relevant information."""
     user = request.user
-    is_doctor = user.profile.is_doctor
-
-    # Get appointments queryset
-    if is_doctor:
-        appointments = Appointment.objects.filter(
-            doctor__user=user,
-            status__in=['Scheduled', 'Confirmed']
-        ).order_by('datetime')
-        appointments_count = appointments.count()
-        upcoming_appointments = appointments[:5]
-        consultations_count = appointments.filter(appointment_type='Consultation').count()
-    else:
-        appointments = Appointment.objects.filter(
-            user=user,
-            status__in=['Scheduled', 'Confirmed']
-        ).order_by('datetime')
-        appointments_count = appointments.count()
-        upcoming_appointments = appointments[:5]
-        consultations_count = appointments.filter(appointment_type='Consultation').count()
-
-    # Get other counts
-    records_count = MedicalRecord.objects.filter(user=user).count()
-    prescriptions_count = Prescription.objects.filter(user=user).count()
+    no_shows.start_sweeper()
+    reminders.start_scheduler()
+    stats = dashboard_stats.get_stats(user, user.profile.is_doctor)
 
     # Get recent articles
-    recent_articles = HealthArticle.objects.order_by('-created_at')[:3] if HealthArticle.objects.exists() else []
+    recent_articles = article_facets.get_facets()['recent']
 
     # Get recent activities
     activities = []  # Placeholder for activity feed
 
     context = {
-        'upcoming_appointments': upcoming_appointments,
-        'appointments_count': appointments_count,
-        'consultations_count': consultations_count,
-        'records_count': records_count,
-        'prescriptions_count': prescriptions_count,
+        **stats,
         'recent_articles': recent_articles,
         'activities': activities,
     }
@@ -350,27 +348,64 @@ def dashboard(request):
     return render(request, 'online_health_consultation/dashboard.html', context)
 
 # Consultation & Appointments
+def _suggested_slots(form, days=7, count=6):
+    """Free slots near the time a rejected booking asked for."""
+    if not form.is_bound:
+        return []
+    doctor, requested = form.cleaned_data.get('doctor'), form.cleaned_data.get('datetime')
+    if doctor is None or requested is None:
+        return []
+    start = max(timezone.localtime(requested).date(), timezone.localdate())
+    availability = slots.Availability([doctor], start, start + timedelta(days=days - 1))
+    return [slot for slot in availability.free_slots(doctor.pk) if slot >= requested][:count]
+
+def _booking_initial(request):
+    """Preselect the doctor chosen in the directory."""
+    doctor = request.GET.get('doctor', '')
+    return {'doctor': doctor} if doctor.isdigit() else {}
+
+def _slot_conflict(request, form, template_name):
+    """Re-render a booking form whose slot was taken while it was being submitted."""
+    suggested_slots = _suggested_slots(form)
+    form.add_error('datetime', 'Someone else just booked this time slot. Please choose another one.')
+    return render(request, template_name, {
+        'form': form,
+        'suggested_slots': suggested_slots,
+    }, status=409)
+
 @login_required
 def book_consultation(request):
     """Handle booking new consultations."""
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            appointment = form.save(commit=False)
-            appointment.user = request.user
-            appointment.appointment_type = 'Consultation'
-            appointment.save()
+            try:
+                booking.book(
+                    request.user,
+                    form.cleaned_data['doctor'],
+                    form.cleaned_data['datetime'],
+                    appointment_type='Consultation',
+                )
+            except booking.SlotUnavailable:
+                return _slot_conflict(request, form, 'online_health_consultation/book_consultation.html')
             messages.success(request, 'Consultation booked successfully!')
             return redirect('dashboard')
     else:
-        form = AppointmentForm()
+        form = AppointmentForm(initial=_booking_initial(request))
     
-    return render(request, 'online_health_consultation/book_consultation.html', {'form': form})
+    return render(request, 'online_health_consultation/book_consultation.html', {
+        'form': form,
+        'suggested_slots': _suggested_slots(form),
+    })
 
 @login_required
 def appointments(request):
     """View all appointments."""
-    appointments = Appointment.objects.filter(user=request.user)
+    appointments = paginate(
+        request,
+        Appointment.objects.filter(user=request.user).select_related('doctor__user'),
+        ('-datetime', '-id'),
+    )
     return render(request, 'online_health_consultation/appointments.html', {'appointments': appointments})
 
 @login_required
@@ -379,20 +414,173 @@ def book_appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            appointment = form.save(commit=False)
-            appointment.user = request.user
-            appointment.save()
+            try:
+                booking.book(
+                    request.user,
+                    form.cleaned_data['doctor'],
+                    form.cleaned_data['datetime'],
+                    appointment_type=form.cleaned_data['appointment_type'],
+                )
+            except booking.SlotUnavailable:
+                return _slot_conflict(request, form, 'online_health_consultation/book_appointment.html')
             messages.success(request, 'Appointment booked successfully!')
             return redirect('appointments')
     else:
-        form = AppointmentForm()
-    return render(request, 'online_health_consultation/book_appointment.html', {'form': form})
+        form = AppointmentForm(initial=_booking_initial(request))
+    return render(request, 'online_health_consultation/book_appointment.html', {
+        'form': form,
+        'suggested_slots': _suggested_slots(form),
+    })
+
+@login_required
+def appointment_slots_api(request):
+    """
+    Return free appointment slots as JSON.
+
+    ``?doctor=<id>&start=<date>&end=<date>`` lists one doctor's free slots by
+    date; ``?at=<datetime>`` lists the doctors with a free slot at that time.
+    """
+    if request.GET.get('at'):
+        try:
+            at = parse_datetime(request.GET['at'])
+        except ValueError:
+            at = None
+        if at is None:
+            return JsonResponse({'error': 'at must be a date and time'}, status=400)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        day = timezone.localtime(at).date()
+        doctors = Doctor.objects.select_related('user')
+        if request.GET.get('specialization'):
+            doctors = doctors.filter(specialization__icontains=request.GET['specialization'])
+        availability = slots.Availability(doctors, day, day)
+        return JsonResponse({
+            'at': at.isoformat(),
+            'doctors': [
+                {'id': doctor.pk, 'name': doctor.get_display_name(), 'specialization': doctor.specialization}
+                for doctor in availability.free_doctors(at)
+            ],
+        })
+
+    doctor_id = request.GET.get('doctor', '')
+    if not doctor_id.isdigit():
+        return JsonResponse({'error': 'doctor must be an id'}, status=400)
+    doctor = get_object_or_404(Doctor.objects.select_related('user'), pk=doctor_id)
+    try:
+        start = parse_date(request.GET.get('start', '')) or timezone.localdate()
+        end = parse_date(request.GET.get('end', '')) or start
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be dates'}, status=400)
+    if end < start or (end - start).days >= SLOT_SEARCH_MAX_DAYS:
+        return JsonResponse({'error': f'end must be within {SLOT_SEARCH_MAX_DAYS} days of start'}, status=400)
+    availability = slots.Availability([doctor], start, end)
+    return JsonResponse({
+        'doctor': doctor.pk,
+        'slot_minutes': slots.SLOT_MINUTES,
+        'slots': {
+            day.isoformat(): [timezone.localtime(slot).strftime('%H:%M') for slot in day_slots]
+            for day, day_slots in availability.free_slots_by_date(doctor.pk).items()
+        },
+    })
+
+@staff_member_required
+def appointment_report(request):
+    """
+    Return appointment counts from the rollups as CSV or JSON.
+
+    ``?period=day|week&start=<date>&end=<date>&group=doctor&group=status&format=csv``;
+    ``group`` may be given for each of doctor, specialization, type and status.
+    """
+    period = request.GET.get('period', 'day')
+    if period not in rollups.PERIODS:
+        return JsonResponse({'error': f'period must be one of {", ".join(rollups.PERIODS)}'}, status=400)
+    try:
+        end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+        start = parse_date(request.GET.get('start', '')) or end - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be dates'}, status=400)
+    if end < start:
+        return JsonResponse({'error': 'end must not be before start'}, status=400)
+    groups = [group for group in dict.fromkeys(request.GET.getlist('group')) if group in rollups.GROUPS]
+    rows = rollups.report(period, start, end, groups)
+
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="appointments-{period}-{start}-{end}.csv"'
+        writer = csv.DictWriter(response, fieldnames=rollups.columns(groups))
+        writer.writeheader()
+        writer.writerows(rows)
+        return response
+    return JsonResponse({
+        'period': period,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'rows': list(rows),
+    })
+
+class _Echo:
+    """File-like object handing each CSV line straight back to the streaming response."""
+
+    def write(self, value):
+        return value
+
+@staff_member_required
+def revenue_report(request):
+    """
+    Stream revenue and utilisation per doctor as CSV.
+
+    ``?period=day|week&start=<date>&end=<date>``; any range is allowed since
+    rows are written as they are read.
+    """
+    period = request.GET.get('period', 'week')
+    if period not in revenue.PERIOD_DAYS:
+        return JsonResponse({'error': f'period must be one of {", ".join(revenue.PERIOD_DAYS)}'}, status=400)
+    try:
+        end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+        start = parse_date(request.GET.get('start', '')) or end - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be dates'}, status=400)
+    if end < start:
+        return JsonResponse({'error': 'end must not be before start'}, status=400)
+
+    writer = csv.DictWriter(_Echo(), fieldnames=revenue.COLUMNS)
+    lines = chain([writer.writeheader()], (writer.writerow(row) for row in revenue.rows(period, start, end)))
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="revenue-{period}-{start}-{end}.csv"'
+    return response
+
+def doctor_directory(request):
+    """Search the doctor directory with faceted filters."""
+    form = SearchDoctorForm(request.GET)
+    doctors = Doctor.objects.none()
+    if form.is_valid():
+        doctors = directory.search(
+            query=form.cleaned_data['q'].strip(),
+            specialization=form.cleaned_data['specialization'].strip(),
+            fee_band=form.cleaned_data['fee'],
+            experience_band=form.cleaned_data['experience'],
+            available_at=form.available_at(),
+        )
+    doctors = paginate(request, doctors, ('-experience_years', 'id'), per_page=DOCTORS_PER_PAGE)
+    return render(request, 'online_health_consultation/doctors.html', {
+        'form': form,
+        'doctors': doctors,
+        'facets': directory.get_facets(),
+    })
+
+@login_required
+def doctor_autocomplete(request):
+    """Return bookable doctors matching a name or specialization prefix as JSON."""
+    doctors = directory.autocomplete(request.GET.get('q', '').strip())
+    return JsonResponse({
+        'results': [{'id': doctor.pk, 'text': doctor.get_display_name()} for doctor in doctors],
+    })
 
 @login_required
 def cancel_appointment(request, appointment_id):
     """Cancel an existing appointment."""
     appointment = get_object_or_404(Appointment, id=appointment_id, user=request.user)
-    appointment.status = 'cancelled'
+    appointment.status = 'Cancelled'
     appointment.save()
     messages.success(request, 'Appointment cancelled successfully!')
     return redirect('appointments')
@@ -400,9 +588,17 @@ def cancel_appointment(request, appointment_id):
 # Medical Records & Prescriptions
 @login_required
 def medical_records(request):
-    """View all medical records."""
-    records = MedicalRecord.objects.filter(user=request.user)
-    return render(request, 'online_health_consultation/records.html', {'records': records})
+    """View all medical records, or those matching ``?q`` in their details or file contents."""
+    query = request.GET.get('q', '').strip()
+    if query:
+        records = record_search.search(request.user, query, limit=RECORD_SEARCH_LIMIT)
+    else:
+        records = MedicalRecord.objects.filter(user=request.user)
+    return render(request, 'online_health_consultation/records.html', {
+        'records': records,
+        'query': query,
+        'upload_form': MedicalRecordForm(),
+    })
 
 @login_required
 def upload_record(request):
@@ -418,10 +614,99 @@ def upload_record(request):
         form = MedicalRecordForm()
     return render(request, 'online_health_consultation/upload_record.html', {'form': form})
 
+@login_required
+def download_record(request, record_id):
+    """Send a medical record's file to its patient or one of their doctors; ``?download`` saves it."""
+    record = get_object_or_404(MedicalRecord, id=record_id)
+    if not record_downloads.can_download(request.user, record):
+        raise PermissionDenied
+    return record_downloads.serve(request, record, as_attachment='download' in request.GET)
+
+def _health_file_response(patient):
+    response = StreamingHttpResponse(health_export.archive(patient), content_type='application/zip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="health-file-{patient.username}-{timezone.localdate()}.zip"'
+    )
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+@login_required
+def export_health_file(request):
+    """Stream the user's records, prescriptions and appointments as a ZIP archive."""
+    return _health_file_response(request.user)
+
+@login_required
+@require_POST
+def start_record_upload(request):
+    """Begin a chunked upload of a medical record file."""
+    try:
+        upload = record_uploads.start(
+            request.user,
+            request.POST.get('filename', ''),
+            int(request.POST.get('size', '')),
+            request.POST.get('sha256', ''),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'size must be a number of bytes'}, status=400)
+    except record_uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({
+        'id': str(upload.pk),
+        'url': reverse('record_upload', args=[upload.pk]),
+        'offset': upload.received,
+        'chunk_size': record_uploads.max_chunk_size(),
+    }, status=201)
+
+@login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+def record_upload(request, upload_id):
+    """
+    Report (GET), extend (PATCH) or discard (DELETE) a chunked upload.
+
+    A PATCH body is the raw chunk, starting at the ``Upload-Offset`` header;
+    an ``X-Chunk-SHA256`` header, if sent, is checked against it.
+    """
+    upload = get_object_or_404(RecordUpload, pk=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        record_uploads.abort(upload)
+        return HttpResponse(status=204)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset must be a number of bytes'}, status=400)
+        try:
+            upload.received = record_uploads.append(
+                upload, offset, request, length, request.headers.get('X-Chunk-SHA256', ''),
+            )
+        except record_uploads.UploadError as e:
+            upload.refresh_from_db(fields=['received'])
+            return JsonResponse({'error': str(e), 'offset': upload.received}, status=e.status)
+    return JsonResponse({'offset': upload.received, 'size': upload.size})
+
+@login_required
+@require_POST
+def complete_record_upload(request, upload_id):
+    """Turn a fully received upload into a medical record with the posted details."""
+    upload = get_object_or_404(RecordUpload, pk=upload_id, user=request.user)
+    form = RecordDetailsForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        sha256 = record_uploads.complete(upload, form.save(commit=False))
+    except record_uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({'id': form.instance.pk, 'sha256': sha256, 'redirect': reverse('records')}, status=201)
+
 @login_required
 def prescriptions(request):
     """View all prescriptions."""
-    prescriptions = Prescription.objects.filter(user=request.user)
+    prescriptions = paginate(
+        request,
+        Prescription.objects.filter(user=request.user).select_related('doctor__user'),
+        ('-date', '-id'),
+    )
     return render(request, 'online_health_consultation/prescriptions.html', {'prescriptions': prescriptions})
 
 @login_required
@@ -517,8 +802,7 @@ def contact_page(request):
             subject = request.POST.get('subject')
             message = request.POST.get('message')
 
-            # Send email to admin
-            from django.core.mail import send_mail
+            # Queue the emails; the outbox worker sends them after the response
             from django.conf import settings
             from django.template.loader import render_to_string
 
@@ -534,25 +818,20 @@ def contact_page(request):
             email_body = render_to_string('online_health_consultation/email/contact_email.html', context)
             admin_notification = render_to_string('online_health_consultation/email/admin_notification.html', context)
 
-            # Send confirmation email to user
-            send_mail(
-                subject='Thank you for contacting us',
-                message='',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                html_message=email_body,
-                fail_silently=False
-            )
-
-            # Send notification to admin
-            send_mail(
-                subject=f'New Contact Form Submission: {subject}',
-                message='',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[settings.ADMIN_EMAIL],
-                html_message=admin_notification,
-                fail_silently=False
-            )
+            with transaction.atomic():
+                # Confirmation email to user
+                outbox.enqueue(
+                    subject='Thank you for contacting us',
+                    recipients=[email],
+                    html_body=email_body,
+                )
+
+                # Notification to admin
+                outbox.enqueue(
+                    subject=f'New Contact Form Submission: {subject}',
+                    recipients=[settings.ADMIN_EMAIL],
+                    html_body=admin_notification,
+                )
 
             messages.success(request, 'Thank you for your message. We will get back to you soon!')
             return redirect('contact')
@@ -607,7 +886,29 @@ def profile(request):
 @login_required
 def profile_settings(request):
     """Update user profile settings."""
-    return render(request, 'online_health_consultation/profile_settings.html')
+    profile = request.user.profile
+    if request.method == 'POST' and 'reset_calendar' in request.POST:
+        ical.reset_token(profile)
+        messages.success(request, 'Your calendar link has been reset. Update it in your calendar app.')
+        return redirect('profile_settings')
+    calendar_url = request.build_absolute_uri(reverse('calendar_feed', args=[ical.get_token(profile)]))
+    return render(request, 'online_health_consultation/profile_settings.html', {'calendar_url': calendar_url})
+
+def calendar_feed(request, token):
+    """Stream a user's appointments as an iCalendar feed, or 304 if unchanged."""
+    profile = get_object_or_404(Profile.objects.select_related('user'), calendar_token=token)
+    appointments = ical.feed_appointments(profile)
+    etag = ical.feed_etag(profile, appointments)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = StreamingHttpResponse(
+            ical.feed_lines(profile, appointments, request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Doctor Views
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -621,42 +922,30 @@ def is_doctor(user):
 @user_passes_test(is_doctor)
 def doctor_dashboard(request):
     """Doctor's dashboard view."""
-    today = timezone.now().date()
     doctor = request.user.doctor
+    no_shows.start_sweeper()
+    reminders.start_scheduler()
+    stats = doctor_stats.get_stats(doctor)
     
     # Get today's appointments
-    today_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        datetime__date=today
-    ).order_by('datetime')
-    
-    # Get pending consultations
-    pending_consultations = Appointment.objects.filter(
-        doctor=doctor,
-        status='Scheduled',
-        appointment_type='Consultation'
-    ).count()
-    
-    # Get total unique patients
-    total_patients = Appointment.objects.filter(
-        doctor=doctor
-    ).values('user').distinct().count()
-    
-    # Get completed sessions
-    completed_sessions = Appointment.objects.filter(
-        doctor=doctor,
-        status='Completed'
-    ).count()
+    day_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_appointments = list(
+        Appointment.objects.filter(
+            doctor=doctor,
+            datetime__gte=day_start,
+            datetime__lt=day_start + timedelta(days=1),
+        ).select_related('user').order_by('datetime')
+    )
     
     # Get recent activities
     recent_activities = []  # You can implement activity tracking here
     
     context = {
         'today_appointments': today_appointments[:5],  # Show only first 5
-        'today_appointments_count': today_appointments.count(),
-        'pending_consultations_count': pending_consultations,
-        'total_patients_count': total_patients,
-        'completed_sessions_count': completed_sessions,
+        'today_appointments_count': len(today_appointments),
+        'pending_consultations_count': stats.pending_consultations,
+        'total_patients_count': stats.total_patients,
+        'completed_sessions_count': stats.completed_sessions,
         'recent_activities': recent_activities,
     }
     
@@ -667,7 +956,11 @@ def doctor_dashboard(request):
 def doctor_appointments(request):
     """View doctor's appointments."""
     doctor = request.user.doctor
-    appointments = Appointment.objects.filter(doctor=doctor).order_by('-datetime')
+    appointments = paginate(
+        request,
+        Appointment.objects.filter(doctor=doctor).select_related('user'),
+        ('-datetime', '-id'),
+    )
     return render(request, 'online_health_consultation/doctor_appointments.html', {'appointments': appointments})
 
 @login_required
@@ -714,10 +1007,43 @@ def doctor_availability(request):
 def doctor_patients(request):
     """View doctor's patient list."""
     doctor = request.user.doctor
-    patients = User.objects.filter(
-        patient_appointments__doctor=doctor
-    ).distinct()
-    return render(request, 'online_health_consultation/doctor_patients.html', {'patients': patients})
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort')
+    if sort not in roster.SORTS:
+        sort = roster.DEFAULT_SORT
+    patients = roster.patient_roster(
+        doctor,
+        query=query,
+        upcoming_only=request.GET.get('upcoming') == '1',
+        with_prescriptions=request.GET.get('prescriptions') == '1',
+    )
+    patients = paginate(request, patients, roster.SORTS[sort], per_page=PATIENTS_PER_PAGE)
+    return render(request, 'online_health_consultation/doctor_patients.html', {
+        'patients': patients,
+        'query': query,
+        'sort': sort,
+    })
+
+@login_required
+@user_passes_test(is_doctor)
+def export_patient_health_file(request, patient_id):
+    """Stream the health file of one of the doctor's patients as a ZIP archive."""
+    patient = get_object_or_404(User, pk=patient_id)
+    if not record_downloads.treats(request.user, patient.pk):
+        raise PermissionDenied
+    return _health_file_response(patient)
+
+@login_required
+@user_passes_test(is_doctor)
+def patient_autocomplete(request):
+    """Return patients matching a name, username or phone prefix as JSON."""
+    patients = patient_lookup.lookup(request.GET.get('q', '').strip())
+    return JsonResponse({
+        'results': [
+            {'id': patient.pk, 'text': f'{patient.get_full_name() or patient.username} ({patient.username})'}
+            for patient in patients
+        ],
+    })
 
 @login_required
 @user_passes_test(is_doctor)
@@ -755,8 +1081,6 @@ def doctor_prescriptions(request):
             return redirect('doctor_appointments')
     else:
         form = PrescriptionForm()
-        # This ensures only patients appear in the dropdown
-        form.fields['user'].queryset = User.objects.filter(profile__is_doctor=False).order_by('first_name', 'last_name')
     return render(request, 'online_health_consultation/doctor_prescriptions.html', {'form': form})
 
 @login_required
@@ -764,8 +1088,8 @@ def doctor_prescriptions(request):
 def complete_appointment(request, appointment_id):
     """Mark an appointment as completed."""
     appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user.doctor)
-    if appointment.status != 'completed':
-        appointment.status = 'completed'
+    if appointment.status != 'Completed':
+        appointment.status = 'Completed'
         appointment.save()
         messages.success(request, 'Appointment marked as completed.')
     return redirect('doctor_appointments')
@@ -774,7 +1098,7 @@ def complete_appointment(request, appointment_id):
 @user_passes_test(is_doctor)
 def write_prescription(request, appointment_id):
     """Write a prescription for a completed appointment."""
-    appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user.doctor, status='completed')
+    appointment = get_object_or_404(Appointment, id=appointment_id, doctor=request.user.doctor, status='Completed')
     if request.method == 'POST':
         form = PrescriptionForm(request.POST)
         if form.is_valid():
@@ -798,45 +1122,75 @@ def write_prescription(request, appointment_id):
     }
     return render(request, 'online_health_consultation/doctor_prescriptions.html', context)
 
+@conditional_page(articles_last_modified)
 def health_articles(request):
     """Display list of health articles."""
     # Get query parameters for filtering
     category = request.GET.get('category')
+    query = request.GET.get('q', '').strip()
     
     # Query articles
-    articles = HealthArticle.objects.all().order_by('-created_at')
-    
-    # Get popular articles
-    popular_articles = HealthArticle.objects.all().order_by('-views')[:5]  # Get top 5 most viewed articles
-    if category:
-        articles = articles.filter(category__slug=category)
-        
-    # Get featured articles
-    featured_articles = HealthArticle.objects.filter(featured=True)[:3]
-    
-    # Get popular articles
-    popular_articles = HealthArticle.objects.order_by('-views')[:5]
+    page_obj = None
+    if query:
+        articles = search.search(query, limit=ARTICLE_SEARCH_LIMIT, category=category)
+    else:
+        articles = HealthArticle.objects.select_related('author')
+        if category:
+            articles = articles.filter(category__slug=category)
+        articles = page_obj = paginate(request, articles, ('-created_at', '-id'), per_page=ARTICLES_PER_PAGE)
     
-    # Get all categories with article count
-    categories = []
-    # You would implement this based on your category model
+    # Featured, popular and category counts come from the cached facets snapshot
+    facets = article_facets.get_facets()
     
     # Prepare context
     context = {
         'articles': articles,
-        'featured_articles': featured_articles,
-        'popular_articles': popular_articles,
-        'categories': categories,
+        'featured_articles': facets['featured'],
+        'popular_articles': view_counter.popular_articles(5, facets=facets),
+        'categories': facets['categories'],
+        'query': query,
+        'page_obj': page_obj,
     }
     
     return render(request, 'online_health_consultation/articles.html', context)
 
+def article_search_api(request):
+    """Return ranked article search results as JSON."""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', ARTICLE_SEARCH_LIMIT)), ARTICLE_SEARCH_LIMIT)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+
+    results = [
+        {
+            'title': article.title,
+            'slug': article.slug,
+            'url': reverse('article_detail', args=[article.slug]),
+            'category': article.category.name if article.category else None,
+            'snippet': article.search_snippet,
+            'score': round(article.search_score, 4),
+        }
+        for article in search.search(
+            query, limit=max(limit, 0), offset=offset, category=request.GET.get('category')
+        )
+    ]
+    return JsonResponse({'query': query, 'results': results})
+
+def count_article_view(request, slug):
+    """Count a view of an article whose page was answered with a 304."""
+    article_id = HealthArticle.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    if article_id is not None:
+        view_counter.record_view(article_id)
+
+@conditional_page(articles_last_modified, on_not_modified=count_article_view)
 def article_detail(request, slug):
     """Display a single article."""
     article = get_object_or_404(HealthArticle, slug=slug)
     
-    # Increment view count
-    article.views += 1
-    article.save()
+    # Buffer the view; it is written back in a batch by view_counter
+    view_counter.record_view(article.pk)
+    article.views += view_counter.pending_views(article.pk)
     
     return render(request, 'online_health_consultation/article_detail.html', {'article': article})
\ No newline at end of file
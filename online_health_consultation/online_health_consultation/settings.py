@@ -252,3 +252,37 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = ''  # Your email
 EMAIL_HOST_PASSWORD = ''  # Your email password or app password
+
+# Seconds between writes of buffered article views
+ARTICLE_VIEW_FLUSH_INTERVAL = int(os.getenv('ARTICLE_VIEW_FLUSH_INTERVAL', 30))
+
+# Background threads generating resized copies of uploaded images
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', 2))
+
+# Length of an appointment slot in minutes
+APPOINTMENT_SLOT_MINUTES = int(os.getenv('APPOINTMENT_SLOT_MINUTES', 30))
+
+# Minutes after its start before an unattended appointment becomes a no-show
+NO_SHOW_GRACE_MINUTES = int(os.getenv('NO_SHOW_GRACE_MINUTES', 60))
+
+# Seconds between in-process no-show sweeps (0 leaves it to the sweep_no_shows command)
+NO_SHOW_SWEEP_INTERVAL = int(os.getenv('NO_SHOW_SWEEP_INTERVAL', 300))
+
+# Seconds between in-process email outbox deliveries (0 leaves it to the send_outbox command)
+EMAIL_OUTBOX_INTERVAL = int(os.getenv('EMAIL_OUTBOX_INTERVAL', 10))
+
+# Seconds between in-process appointment reminder runs (0 leaves it to the send_reminders command)
+APPOINTMENT_REMINDER_INTERVAL = int(os.getenv('APPOINTMENT_REMINDER_INTERVAL', 60))
+
+# Chunked medical record uploads: largest chunk and file in bytes, and hours before unfinished uploads are purged
+RECORD_UPLOAD_CHUNK_SIZE = int(os.getenv('RECORD_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+RECORD_UPLOAD_MAX_SIZE = int(os.getenv('RECORD_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+RECORD_UPLOAD_EXPIRY_HOURS = int(os.getenv('RECORD_UPLOAD_EXPIRY_HOURS', 24))
+
+# Front server sending medical record downloads: '' (Django streams them), 'nginx' (X-Accel-Redirect to
+# RECORD_DOWNLOAD_INTERNAL_URL, an internal location aliasing MEDIA_ROOT) or 'sendfile' (X-Sendfile)
+RECORD_DOWNLOAD_SERVER = os.getenv('RECORD_DOWNLOAD_SERVER', '')
+RECORD_DOWNLOAD_INTERNAL_URL = os.getenv('RECORD_DOWNLOAD_INTERNAL_URL', '/protected-media/')
+
+# Background threads extracting the text of medical record files for search
+RECORD_TEXT_WORKERS = int(os.getenv('RECORD_TEXT_WORKERS', 2))